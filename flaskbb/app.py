@@ -16,6 +16,7 @@ import time
 import warnings
 from datetime import datetime
 
+from celery.signals import worker_shutdown
 from flask import Flask, request
 from flask_login import current_user
 from sqlalchemy import event
@@ -48,6 +49,7 @@ from flaskbb.plugins.utils import remove_zombie_plugins_from_db, template_hook
 
 # models
 from flaskbb.user.models import Guest, User
+from flaskbb.user.utils import touch_lastseen
 
 # various helpers
 from flaskbb.utils.helpers import (
@@ -62,7 +64,6 @@ from flaskbb.utils.helpers import (
     mark_online,
     render_template,
     time_since,
-    time_utcnow,
     topic_is_unread,
 )
 
@@ -217,6 +218,17 @@ def configure_celery_app(app, celery):
 
     celery.Task = ContextTask
 
+    def flush_search_queue(**kwargs):
+        # don't leave the queued search index changes behind
+        if not app.config.get("SEARCH_INDEX_ASYNC", False):
+            return
+        from flaskbb.utils.search import process_search_queue
+        with app.app_context():
+            process_search_queue()
+
+    worker_shutdown.connect(flush_search_queue, weak=False,
+                            dispatch_uid="flaskbb.flush_search_queue")
+
 
 def configure_blueprints(app):
     app.pluggy.hook.flaskbb_load_blueprints(app=app)
@@ -258,7 +270,8 @@ def configure_extensions(app):
     # Flask-Whooshee
     whooshee.init_app(app)
     # not needed for unittests - and it will speed up testing A LOT
-    if not app.testing:
+    # the database backends keep their own index up to date
+    if not app.testing and app.config["SEARCH_BACKEND"] == "whoosh":
         whooshee.register_whoosheer(PostWhoosheer)
         whooshee.register_whoosheer(TopicWhoosheer)
         whooshee.register_whoosheer(ForumWhoosheer)
@@ -347,12 +360,10 @@ def configure_before_handlers(app):
 
     @app.before_request
     def update_lastseen():
-        """Updates `lastseen` before every reguest if the user is
-        authenticated."""
+        """Updates `lastseen` if the user is authenticated. The timestamp
+        is only written every `LASTSEEN_GRANULARITY` seconds."""
         if current_user.is_authenticated:
-            current_user.lastseen = time_utcnow()
-            db.session.add(current_user)
-            db.session.commit()
+            touch_lastseen(current_user)
 
     if app.config["REDIS_ENABLED"]:
 
@@ -29,6 +29,7 @@ from ...core.exceptions import (
     StopValidation,
     ValidationError,
 )
+from ...management.models import BoardStatistic
 from ...user.models import User
 
 __all__ = (
@@ -238,6 +239,9 @@ class RegistrationService(UserRegistrationService):
                 date_joined=datetime.now(UTC),
             )
             self.db.session.add(user)
+            self.db.session.flush()
+            BoardStatistic.increment("users")
+            BoardStatistic.set("newest_user_id", user.id)
             self.db.session.commit()
             return user
         except Exception:
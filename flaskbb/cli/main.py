@@ -30,7 +30,8 @@ from flaskbb import create_app
 from flaskbb.cli.utils import (EmailType, FlaskBBCLIError, get_version,
                                prompt_config_path, prompt_save_user,
                                write_config)
-from flaskbb.extensions import alembic, celery, db, whooshee
+from flaskbb.extensions import alembic, celery, db
+from flaskbb.markup import render_post_content
 from flaskbb.utils.populate import (create_default_groups,
                                     create_default_settings, create_latest_db,
                                     create_test_data, create_welcome_forum,
@@ -223,10 +224,161 @@ def populate(bulk_data, test_data, posts, topics, force, initdb):
 
 
 @flaskbb.command()
-def reindex():
+@click.option("--batch-size", "-b", default=10000, type=click.IntRange(1),
+              help="The number of rows that are indexed per segment.")
+@click.option("--procs", "-p", default=1, type=click.IntRange(1),
+              help="The number of processes which build the segments.")
+@click.option("--resume", "-r", default=False, is_flag=True,
+              help="Continues an interrupted reindex from its checkpoint.")
+@click.option("--incremental", "-i", default=False, is_flag=True,
+              help="Only indexes the changes since the last reindex.")
+def reindex(batch_size, procs, resume, incremental):
     """Reindexes the search index."""
+    from flaskbb.utils.search_backends import get_search_backend
+
+    def progress(model, indexed, total):
+        click.secho("[+] {}: {}/{} ({:.0%})".format(
+            model.__name__, indexed, total,
+            float(indexed) / total if total else 1
+        ), fg="cyan")
+
+    if incremental:
+        click.secho("[+] Updating search index...", fg="cyan")
+        stats = get_search_backend().sync(batch_size=batch_size,
+                                          progress=progress)
+        for name, counts in sorted(stats.items()):
+            click.secho("[+] {}: {} updated, {} deleted.".format(
+                name, counts["updated"], counts["deleted"]
+            ), fg="cyan")
+        return
+
     click.secho("[+] Reindexing search index...", fg="cyan")
-    whooshee.reindex()
+    get_search_backend().reindex(batch_size=batch_size, procs=procs,
+                                 resume=resume, progress=progress)
+
+
+@flaskbb.command("flush-views")
+def flush_views():
+    """Writes the buffered topic views and lastseen timestamps to the
+    database."""
+    from flaskbb.forum.utils import flush_topic_views
+    from flaskbb.user.utils import flush_lastseen
+    count = flush_topic_views()
+    click.secho("[+] Flushed the views of {} topics.".format(count),
+                fg="cyan")
+    count = flush_lastseen()
+    click.secho("[+] Flushed the lastseen timestamps of {} users."
+                .format(count), fg="cyan")
+
+
+@flaskbb.command("reconcile-stats")
+def reconcile_stats():
+    """Recounts the board statistics (users, topics and posts)."""
+    from flaskbb.management.models import BoardStatistic
+    stats = BoardStatistic.reconcile()
+    click.secho("[+] {users} users, {topics} topics and {posts} posts."
+                .format(**stats), fg="cyan")
+
+
+@flaskbb.command("verify-counts")
+@click.option("--fix", "-f", default=False, is_flag=True,
+              help="Corrects the counters which are wrong.")
+def verify_counts(fix):
+    """Recounts the post and topic counters of the users, topics and
+    forums and reports the ones which have drifted."""
+    from flaskbb.forum.utils import verify_post_counts
+    wrong = verify_post_counts(fix=fix)
+    for name, count in sorted(wrong.items()):
+        click.secho("[+] {}: {} wrong counters{}.".format(
+            name, count, " (fixed)" if fix and count else ""
+        ), fg="yellow" if count else "cyan")
+
+
+@flaskbb.command("prune-trackers")
+@click.option("--batch-size", "-b", default=1000, type=click.IntRange(1),
+              help="The number of rows that are removed per transaction.")
+def prune_trackers(batch_size):
+    """Removes the read trackers which are older than TRACKER_LENGTH days
+    and collapses the topic trackers of fully read forums."""
+    from flaskbb.forum.tracking import prune_read_trackers
+    removed = prune_read_trackers(batch_size=batch_size)
+    click.secho("[+] Collapsed {collapsed} topicsread rows into forumsread "
+                "trackers.".format(**removed), fg="cyan")
+    click.secho("[+] Removed {topicsread} topicsread, {forumsread} "
+                "forumsread and {readmarks} readmarks rows in {seconds}s."
+                .format(**removed), fg="cyan")
+
+
+@flaskbb.command("flush-search-queue")
+@click.option("--batch-size", "-b", default=500, type=click.IntRange(1),
+              help="The number of queued changes that are written at once.")
+def flush_search_queue(batch_size):
+    """Writes the queued changes to the search index. Only needed if
+    SEARCH_INDEX_ASYNC is enabled."""
+    from flaskbb.utils.search import process_search_queue, search_queue_lag
+    processed = process_search_queue(batch_size=batch_size)
+    click.secho("[+] Processed {} queued search index changes."
+                .format(processed), fg="cyan")
+
+    lag = search_queue_lag()
+    if lag["pending"]:
+        click.secho("[!] {pending} changes are still pending, the oldest "
+                    "one is {lag:.0f}s old.".format(**lag), fg="yellow")
+
+
+@flaskbb.command("render-posts")
+@click.option("--batch-size", "-b", default=1000, type=click.IntRange(1),
+              help="The number of posts that are rendered per transaction.")
+@click.option("--missing", "-m", default=False, is_flag=True,
+              help="Only renders posts which have no stored HTML yet.")
+def render_posts(batch_size, missing):
+    """Rebuilds the stored HTML of the posts. Needs to be run after the
+    markdown plugins have been changed and PERSIST_POST_HTML is enabled.
+    """
+    if not current_app.config.get("PERSIST_POST_HTML", False):
+        click.secho("[!] PERSIST_POST_HTML is disabled. The stored HTML "
+                    "won't be used until it is enabled.", fg="yellow")
+
+    from flaskbb.forum.models import Post
+    posts = Post.__table__
+
+    query = db.select([posts.c.id, posts.c.content])
+    count_query = db.select([db.func.count(posts.c.id)])
+    if missing:
+        query = query.where(posts.c.content_html.is_(None))
+        count_query = count_query.where(posts.c.content_html.is_(None))
+    total = db.session.execute(count_query).scalar()
+
+    update = posts.update().\
+        where(posts.c.id == db.bindparam("_id")).\
+        values(content_html=db.bindparam("_html"))
+
+    click.secho("[+] Rendering {} posts...".format(total), fg="cyan")
+    last_id = 0
+    # the renderer builds urls (e.g. for user mentions) which requires a
+    # request context
+    with current_app.test_request_context(), \
+            click.progressbar(length=total) as bar:
+        while True:
+            # walk the posts by their primary key so that we never have to
+            # load more than one batch into memory
+            rows = db.session.execute(
+                query.where(posts.c.id > last_id).
+                order_by(posts.c.id).limit(batch_size)
+            ).fetchall()
+            if not rows:
+                break
+
+            db.session.execute(update, [
+                {"_id": row.id, "_html": render_post_content(row.content)}
+                for row in rows
+            ])
+            db.session.commit()
+
+            last_id = rows[-1].id
+            bar.update(len(rows))
+
+    click.secho("[+] Done.", fg="cyan")
 
 
 @flaskbb.command()
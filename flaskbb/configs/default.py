@@ -183,6 +183,20 @@ class DefaultConfig(object):
     WHOOSHEE_WRITER_TIMEOUT = 2
     # Minimum number of characters for the search (defaults to 3)
     WHOOSHEE_MIN_STRING_LEN = 3
+    # The backend of the full text search:
+    #   - "whoosh" uses the Whoosh indexes which are stored in WHOOSHEE_DIR
+    #   - "sqlite" and "postgresql" use the full text search of the database
+    #     (FTS5 and tsvector respectively) and have to match the database
+    #     which is used. Run 'flaskbb reindex' after switching the backend.
+    SEARCH_BACKEND = "whoosh"
+    # For how many seconds the results of a search are cached. They are
+    # invalidated whenever the search index changes. 0 disables the cache.
+    SEARCH_CACHE_TIMEOUT = 60
+    # Instead of writing the changes to the search index while the request
+    # is handled, they are queued and written in batches by the
+    # 'process_search_queue' celery task or by 'flaskbb flush-search-queue'.
+    # Only used by the "whoosh" backend.
+    SEARCH_INDEX_ASYNC = False
 
     # Auth
     # ------------------------------
@@ -231,6 +245,23 @@ class DefaultConfig(object):
     #CACHE_TYPE = "redis"
     CACHE_DEFAULT_TIMEOUT = 60
 
+    # Rendered markup (posts, signatures) is cached in a small in-process
+    # LRU. Set MARKUP_CACHE_SHARED to True to additionally store it in the
+    # cache configured above so that all app processes can share it.
+    MARKUP_CACHE_ENABLED = True
+    MARKUP_CACHE_SIZE = 1000
+    MARKUP_CACHE_SHARED = False
+    MARKUP_CACHE_TIMEOUT = 3600
+    # Stores the rendered HTML of a post when the post is saved and serves
+    # it instead of rendering the post on every view. Run
+    # 'flaskbb render-posts' after enabling this option or after changing
+    # the markdown plugins to (re)build the stored HTML.
+    PERSIST_POST_HTML = False
+    # How long the structure of the categories and forums that are visible
+    # to a set of groups is cached. It is invalidated when categories,
+    # forums or groups are changed.
+    FORUM_TREE_CACHE_TIMEOUT = 3600
+
     # Mail
     # ------------------------------
     # Google Mail Example
@@ -266,6 +297,29 @@ class DefaultConfig(object):
     CELERY_BROKER_URL = 'redis://localhost:6379'
     CELERY_RESULT_BACKEND = 'redis://localhost:6379'
     BROKER_TRANSPORT_OPTIONS = {'max_retries': 1}  # necessary as there's no default
+    # Periodic tasks which are run by 'flaskbb celery beat'
+    CELERYBEAT_SCHEDULE = {
+        'flush-topic-views': {
+            'task': 'flaskbb.forum.tasks.flush_topic_views',
+            'schedule': 60.0,
+        },
+        'flush-lastseen': {
+            'task': 'flaskbb.user.tasks.flush_lastseen',
+            'schedule': 60.0,
+        },
+        'reconcile-board-statistics': {
+            'task': 'flaskbb.management.tasks.reconcile_board_statistics',
+            'schedule': 3600.0,
+        },
+        'prune-read-trackers': {
+            'task': 'flaskbb.forum.tasks.prune_read_trackers',
+            'schedule': 86400.0,
+        },
+        'process-search-queue': {
+            'task': 'flaskbb.management.tasks.process_search_queue',
+            'schedule': 10.0,
+        },
+    }
 
 
     # FlaskBB Settings
@@ -277,6 +331,25 @@ class DefaultConfig(object):
     AUTH_URL_PREFIX = "/auth"
     ADMIN_URL_PREFIX = "/admin"
 
+    # Topic views are buffered (in redis if it is enabled, otherwise in
+    # the memory of each process) and written to the database in batches.
+    # The buffer is flushed by the first request after this many seconds,
+    # by the 'flush_topic_views' celery task or by 'flaskbb flush-views'.
+    TOPIC_VIEWS_FLUSH_INTERVAL = 60
+
+    # The 'lastseen' timestamp of a user is only updated if the stored one
+    # is older than this many seconds. The timestamps are buffered like the
+    # topic views and flushed every LASTSEEN_GRANULARITY seconds, by the
+    # 'flush_lastseen' celery task or by 'flaskbb flush-views'.
+    # It should be well below the ONLINE_LAST_MINUTES setting.
+    LASTSEEN_GRANULARITY = 60
+
+    # The backend which stores which topics a user has read:
+    #   - "topicsread" stores a row for every topic a user has visited
+    #   - "readmarks" stores a single row per user and forum which only
+    #     holds the topics read since the whole forum has been read
+    READ_TRACKER = "topicsread"
+
 
     # Remove dead plugins - useful if you want to migrate your instance
     # somewhere else and forgot to reinstall the plugins.
@@ -23,10 +23,10 @@ from flask_mail import Mail
 from flask_redis import FlaskRedis
 from flask_sqlalchemy import SQLAlchemy
 from flask_themes2 import Themes
-from flask_whooshee import Whooshee
 from flask_wtf.csrf import CSRFProtect
 
 from flaskbb.exceptions import AuthorizationRequired
+from flaskbb.utils.whooshee import Whooshee
 
 
 # Permissions Manager
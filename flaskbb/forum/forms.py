@@ -19,6 +19,9 @@ from flask_babelplus import lazy_gettext as _
 
 from flaskbb.forum.models import Topic, Post, Report, Forum
 from flaskbb.user.models import User
+from flaskbb.utils.settings import flaskbb_config
+from flaskbb.utils.search_backends import (cached_search_page,
+                                           get_search_backend)
 
 
 logger = logging.getLogger(__name__)
@@ -99,7 +102,7 @@ class UserSearchForm(FlaskForm):
 
     def get_results(self):
         query = self.search_query.data
-        return User.query.whooshee_search(query)
+        return get_search_backend().search(User, query)
 
 
 class SearchPageForm(FlaskForm):
@@ -112,22 +115,30 @@ class SearchPageForm(FlaskForm):
 
     submit = SubmitField(_("Search"))
 
-    def get_results(self):
-        # Because the DB is not yet initialized when this form is loaded,
-        # the query objects cannot be instantiated in the class itself
-        search_actions = {
-            'post': Post.query.whooshee_search,
-            'topic': Topic.query.whooshee_search,
-            'forum': Forum.query.whooshee_search,
-            'user': User.query.whooshee_search
+    def get_results(self, user, page=1):
+        """Returns a dict which maps the selected search types to a page of
+        their results. Only the posts, topics and forums which are visible
+        to the user are returned. The results are cached.
+
+        :param user: The user who is searching.
+        :param page: The page of the results.
+        """
+        search_models = {
+            'post': (Post, "POSTS_PER_PAGE"),
+            'topic': (Topic, "TOPICS_PER_PAGE"),
+            'forum': (Forum, "TOPICS_PER_PAGE"),
+            'user': (User, "USERS_PER_PAGE")
         }
 
         query = self.search_query.data
         types = self.search_types.data
         results = {}
 
-        for search_type in search_actions.keys():
+        for search_type in search_models.keys():
             if search_type in types:
-                results[search_type] = search_actions[search_type](query)
+                model, per_page = search_models[search_type]
+                results[search_type] = cached_search_page(
+                    model, query, page, flaskbb_config[per_page], user
+                )
 
         return results
@@ -11,6 +11,8 @@
 from flask import _request_ctx_stack, has_request_context, request
 from werkzeug.local import LocalProxy
 
+from flaskbb.utils.database import get_entity
+
 from .models import Category, Forum, Post, Topic
 
 
@@ -49,7 +51,7 @@ def _get_item(model, view_arg, name):
         setattr(
             _request_ctx_stack.top,
             name,
-            model.query.filter_by(id=request.view_args[view_arg]).first()
+            get_entity(model, request.view_args[view_arg])
         )
 
     return getattr(_request_ctx_stack.top, name, None)
@@ -10,12 +10,15 @@
 """
 from datetime import timedelta
 import logging
+import uuid
 
 from flask import abort, current_app, url_for
-from sqlalchemy.orm import aliased
 
-from flaskbb.extensions import db
+from flaskbb.extensions import cache, db
+from flaskbb.management.models import BoardStatistic
 from flaskbb.utils.database import (CRUDMixin, HideableCRUDMixin, UTCDateTime,
+                                    bulk_increment, get_entity_or_404,
+                                    has_view_hidden, keyset_paginate,
                                     make_comparable)
 from flaskbb.utils.helpers import (get_categories_and_forums, get_forums,
                                    slugify, time_utcnow, topic_is_unread)
@@ -90,6 +93,24 @@ class ForumsRead(db.Model, CRUDMixin):
     cleared = db.Column(UTCDateTime(timezone=True), nullable=True)
 
 
+class ReadMarks(db.Model, CRUDMixin):
+    """Stores when a user has read the topics of a forum in a single row.
+    It is used by the :class:`~flaskbb.forum.tracking.ReadMarksTracker`
+    instead of one ``TopicsRead`` row per topic.
+    """
+    __tablename__ = "readmarks"
+
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey("users.id", ondelete="CASCADE"),
+                        primary_key=True)
+    forum_id = db.Column(db.Integer,
+                         db.ForeignKey("forums.id", ondelete="CASCADE"),
+                         primary_key=True)
+    # the topic ids and the times they have been read, sorted by the
+    # topic id (see flaskbb.forum.tracking.encode_marks)
+    marks = db.Column(db.Text, nullable=False, default="")
+
+
 @make_comparable
 class Report(db.Model, CRUDMixin):
     __tablename__ = "reports"
@@ -145,6 +166,9 @@ class Report(db.Model, CRUDMixin):
 @make_comparable
 class Post(HideableCRUDMixin, db.Model):
     __tablename__ = "posts"
+    __table_args__ = (
+        db.Index("ix_posts_topic_id_id", "topic_id", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     topic_id = db.Column(db.Integer,
@@ -154,6 +178,8 @@ class Post(HideableCRUDMixin, db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
     username = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    # The pre-rendered content; only filled if PERSIST_POST_HTML is enabled
+    content_html = db.Column(db.Text, nullable=True)
     date_created = db.Column(UTCDateTime(timezone=True), default=time_utcnow,
                              nullable=False)
     date_modified = db.Column(UTCDateTime(timezone=True), nullable=True)
@@ -221,7 +247,7 @@ class Post(HideableCRUDMixin, db.Model):
 
             if not topic.hidden:
                 topic.last_updated = created
-                topic.last_post = self
+                topic.set_last_post(self)
 
                 # Update the last post info for the forum
                 topic.forum.last_post = self
@@ -234,6 +260,7 @@ class Post(HideableCRUDMixin, db.Model):
                 user.post_count += 1
                 topic.post_count += 1
                 topic.forum.post_count += 1
+                BoardStatistic.increment("posts")
 
             # And commit it!
             db.session.add(topic)
@@ -249,10 +276,13 @@ class Post(HideableCRUDMixin, db.Model):
             self.topic.delete()
             return self
 
+        if not self.hidden and not self.topic.hidden:
+            BoardStatistic.increment("posts", -1)
+            self._change_post_counts(-1)
+
         db.session.delete(self)
 
         self._deal_with_last_post()
-        self._update_counts()
 
         db.session.commit()
         return self
@@ -267,7 +297,9 @@ class Post(HideableCRUDMixin, db.Model):
 
         super(Post, self).hide(user)
         self._deal_with_last_post()
-        self._update_counts()
+        if not self.topic.hidden:
+            BoardStatistic.increment("posts", -1)
+            self._change_post_counts(-1)
         db.session.commit()
         return self
 
@@ -281,7 +313,9 @@ class Post(HideableCRUDMixin, db.Model):
 
         self._restore_post_to_topic()
         super(Post, self).unhide()
-        self._update_counts()
+        if not self.topic.hidden:
+            BoardStatistic.increment("posts")
+            self._change_post_counts(1)
         db.session.commit()
         return self
 
@@ -315,52 +349,36 @@ class Post(HideableCRUDMixin, db.Model):
                     self.topic.forum.last_post_username = None
                     self.topic.forum.last_post_created = None
 
-            # check if there is a second last post in this topic
-            if self.topic.second_last_post is not None:
+            # check if there is a second last post in this topic. This post
+            # is excluded explicitly because it might already be deleted.
+            second_last_post = db.session.query(Post).\
+                filter(Post.topic_id == self.topic.id, Post.id != self.id).\
+                order_by(Post.id.desc()).\
+                first()
+            if second_last_post is not None:
                 # Now the second last post will be the last post
-                self.topic.last_post_id = self.topic.second_last_post
+                self.topic.set_last_post(second_last_post)
 
             # there is no second last post, now the last post is also the
             # first post
             else:
-                self.topic.last_post = self.topic.first_post
+                self.topic.set_last_post(self.topic.first_post)
 
             self.topic.last_updated = self.topic.last_post.date_created
 
-    def _update_counts(self):
-        if self.hidden:
-            clauses = [Post.hidden != True, Post.id != self.id]
-        else:
-            clauses = [db.or_(Post.hidden != True, Post.id == self.id)]
-
-        user_post_clauses = clauses + [
-            Post.user_id == self.user.id,
-            Topic.id == Post.topic_id,
-            Topic.hidden != True,
-        ]
-
-        # Update the post counts
-        self.user.post_count = Post.query.filter(*user_post_clauses).count()
-
-        if self.topic.hidden:
-            self.topic.post_count = 0
-        else:
-            topic_post_clauses = clauses + [
-                Post.topic_id == self.topic.id,
-            ]
-            self.topic.post_count = Post.query.filter(
-                *topic_post_clauses
-            ).count()
-
-        forum_post_clauses = clauses + [
-            Post.topic_id == Topic.id,
-            Topic.forum_id == self.topic.forum.id,
-            Topic.hidden != True,
-        ]
+    def _change_post_counts(self, amount):
+        """Adds ``amount`` to the post counts of the author, the topic and
+        the forum. The counters are changed by the database
+        (``SET post_count = post_count + amount``), so concurrent changes
+        don't get lost.
+        """
+        # todo: Find circular import and break it
+        from flaskbb.user.models import User
 
-        self.topic.forum.post_count = Post.query.filter(
-            *forum_post_clauses
-        ).count()
+        if self.user is not None:
+            self.user.post_count = User.post_count + amount
+        self.topic.post_count = Topic.post_count + amount
+        self.topic.forum.post_count = Forum.post_count + amount
 
     def _restore_post_to_topic(self):
         last_unhidden_post = Post.query.filter(
@@ -374,7 +392,7 @@ class Post(HideableCRUDMixin, db.Model):
             last_unhidden_post and
             self.date_created > last_unhidden_post.date_created
         ):
-            self.topic.last_post = self
+            self.topic.set_last_post(self)
             self.second_last_post = last_unhidden_post
 
             # if we're the newest in the topic again, we might be the newest
@@ -427,6 +445,20 @@ class Topic(HideableCRUDMixin, db.Model):
     last_post = db.relationship("Post", backref="last_post", uselist=False,
                                 foreign_keys=[last_post_id])
 
+    # set to null if the user got deleted
+    last_post_user_id = db.Column(db.Integer,
+                                  db.ForeignKey("users.id",
+                                                ondelete="SET NULL"),
+                                  nullable=True)
+
+    last_post_user = db.relationship("User", uselist=False,
+                                     foreign_keys=[last_post_user_id])
+
+    # Like the last post columns of the forum, these are needed to show
+    # the topic listings without joining the last post of every topic
+    last_post_username = db.Column(db.String(255), nullable=True)
+    last_post_created = db.Column(UTCDateTime(timezone=True), nullable=True)
+
     # One-to-many
     posts = db.relationship("Post", backref="topic", lazy="dynamic",
                             primaryjoin="Post.topic_id == Topic.id",
@@ -436,11 +468,13 @@ class Topic(HideableCRUDMixin, db.Model):
     # Properties
     @property
     def second_last_post(self):
-        """Returns the second last post or None."""
-        try:
-            return self.posts[-2].id
-        except IndexError:
-            return None
+        """Returns the id of the second last post or None."""
+        # don't use self.posts[-2] as negative indexing on a dynamic
+        # relationship loads every post of the topic
+        return db.session.query(Post.id).\
+            filter(Post.topic_id == self.id).\
+            order_by(Post.id.desc()).\
+            offset(1).limit(1).scalar()
 
     @property
     def slug(self):
@@ -452,6 +486,22 @@ class Topic(HideableCRUDMixin, db.Model):
         """Returns the slugified url for the topic."""
         return url_for("forum.view_topic", topic_id=self.id, slug=self.slug)
 
+    @property
+    def last_post_url(self):
+        """Returns the url for the last post in the topic."""
+        return url_for("forum.view_post", post_id=self.last_post_id)
+
+    def set_last_post(self, post):
+        """Sets ``post`` as the last post of the topic and updates the
+        denormalized last post columns.
+
+        :param post: The new last post of the topic.
+        """
+        self.last_post = post
+        self.last_post_user = post.user
+        self.last_post_username = post.username
+        self.last_post_created = post.date_created
+
     def first_unread(self, topicsread, user, forumsread=None):
         """Returns the url to the first unread post. If no unread posts exist
         it will return the url to the topic.
@@ -464,17 +514,48 @@ class Topic(HideableCRUDMixin, db.Model):
                         read, than you will also need to pass an forumsread
                         object.
         """
-        # If the topic is unread try to get the first unread post
-        if topic_is_unread(self, topicsread, user, forumsread):
-            query = Post.query.filter(Post.topic_id == self.id)
-            if topicsread is not None:
-                query = query.filter(Post.date_created > topicsread.last_read)
-            post = query.order_by(Post.id.asc()).first()
-            if post is not None:
-                return post.url
+        post_id = Topic.first_unread_posts(
+            [(self, topicsread)], user, forumsread
+        ).get(self.id)
+        if post_id is not None:
+            return url_for("forum.view_post", post_id=post_id)
 
         return self.url
 
+    @classmethod
+    def first_unread_posts(cls, topics, user, forumsread=None):
+        """Returns the ids of the first unread posts for many topics at
+        once. The posts are looked up with a single grouped query.
+
+        :param topics: An iterable of ``(topic, topicsread)`` tuples.
+        :param user: The user who should be checked if he has read the
+                     topics.
+        :param forumsread: The forumsread object of the forum in which the
+                           topics are.
+        :returns: A dict which maps the ids of the unread topics to the
+                  ids of their first unread post.
+        """
+        conditions = []
+        for topic, topicsread in topics:
+            if not topic_is_unread(topic, topicsread, user, forumsread):
+                continue
+            if topicsread is None:
+                conditions.append(Post.topic_id == topic.id)
+            else:
+                conditions.append(db.and_(
+                    Post.topic_id == topic.id,
+                    Post.date_created > topicsread.last_read
+                ))
+
+        if not conditions:
+            return {}
+
+        query = db.session.query(Post.topic_id, db.func.min(Post.id)).\
+            filter(db.or_(*conditions))
+        if not has_view_hidden():
+            query = query.filter(Post.hidden != True)
+        return dict(query.group_by(Post.topic_id).all())
+
     # Methods
     def __init__(self, title=None, user=None):
         """Creates a topic object with some initial values.
@@ -502,8 +583,7 @@ class Topic(HideableCRUDMixin, db.Model):
 
     @classmethod
     def get_topic(cls, topic_id, user):
-        topic = Topic.query.filter_by(id=topic_id).first_or_404()
-        return topic
+        return get_entity_or_404(Topic, topic_id)
 
     def tracker_needs_update(self, forumsread, topicsread):
         """Returns True if the topicsread tracker needs an update.
@@ -561,41 +641,16 @@ class Topic(HideableCRUDMixin, db.Model):
         if not user.is_authenticated:
             return False
 
-        topicsread = TopicsRead.query.\
-            filter(TopicsRead.user_id == user.id,
-                   TopicsRead.topic_id == self.id).first()
+        from flaskbb.forum.tracking import get_read_tracker
+        tracker = get_read_tracker()
 
+        topicsread = tracker.get(user, self)
         if not self.tracker_needs_update(forumsread, topicsread):
             return False
 
-        # Because we return True/False if the trackers have been
-        # updated, we need to store the status in a temporary variable
-        updated = False
-
-        # A new post has been submitted that the user hasn't read.
-        # Updating...
-        if topicsread:
-            logger.debug("Updating existing TopicsRead '{}' object."
-                         .format(topicsread))
-            topicsread.last_read = time_utcnow()
-            topicsread.save()
-            updated = True
-
-        # The user has not visited the topic before. Inserting him in
-        # the TopicsRead model.
-        elif not topicsread:
-            logger.debug("Creating new TopicsRead object.")
-            topicsread = TopicsRead()
-            topicsread.user = user
-            topicsread.topic = self
-            topicsread.forum = self.forum
-            topicsread.last_read = time_utcnow()
-            topicsread.save()
-            updated = True
-
-        # No unread posts
-        else:
-            updated = False
+        # A new post has been submitted that the user hasn't read or the
+        # user has not visited the topic before.
+        topicsread = tracker.mark_read(user, self, topicsread, forumsread)
 
         # Save True/False if the forums tracker has been updated.
         updated = forum.update_read(user, forumsread, topicsread)
@@ -620,22 +675,7 @@ class Topic(HideableCRUDMixin, db.Model):
         if self.forum == new_forum:
             return False
 
-        old_forum = self.forum
-        self.forum.post_count -= self.post_count
-        self.forum.topic_count -= 1
-        self.forum = new_forum
-
-        new_forum.post_count += self.post_count
-        new_forum.topic_count += 1
-
-        db.session.commit()
-
-        new_forum.update_last_post()
-        old_forum.update_last_post()
-
-        TopicsRead.query.filter_by(topic_id=self.id).delete()
-
-        return True
+        return new_forum.move_topics_to([self])
 
     def save(self, user=None, forum=None, post=None):
         """Saves a topic and returns the topic object. If no parameters are
@@ -672,10 +712,12 @@ class Topic(HideableCRUDMixin, db.Model):
         post.save(user, self)
 
         # Update the first and last post id
-        self.last_post = self.first_post = post
+        self.first_post = post
+        self.set_last_post(post)
 
         # Update the topic count
         forum.topic_count += 1
+        BoardStatistic.increment("topics")
         db.session.commit()
 
         current_app.pluggy.hook.flaskbb_event_topic_save_after(topic=self,
@@ -683,15 +725,20 @@ class Topic(HideableCRUDMixin, db.Model):
         return self
 
     def delete(self, users=None):
-        """Deletes a topic with the corresponding posts. If a list with
-        user objects is passed it will also update their post counts
+        """Deletes a topic with the corresponding posts and updates the
+        post counts of the involved users.
 
-        :param users: A list with user objects
+        :param users: Unused. The post counts of all involved users are
+                      updated with a single statement.
         """
         forum = self.forum
+        if not self.hidden:
+            post_counts = Topic.visible_post_counts([self.id])
+            BoardStatistic.increment("topics", -1)
+            BoardStatistic.increment("posts", -sum(post_counts.values()))
+            Topic.change_post_counts(self.forum, post_counts, 1, -1)
+
         db.session.delete(self)
-        self._fix_user_post_counts(users or self.involved_users().all())
-        self._fix_post_counts(forum)
 
         # forum.last_post_id shouldn't usually be none
         if forum.last_post_id is None or \
@@ -707,11 +754,15 @@ class Topic(HideableCRUDMixin, db.Model):
         if self.hidden:
             return
 
+        # count the posts before the first post is hidden as well
+        post_counts = Topic.visible_post_counts([self.id])
+        BoardStatistic.increment("topics", -1)
+        BoardStatistic.increment("posts", -sum(post_counts.values()))
+
         self._remove_topic_from_forum()
         super(Topic, self).hide(user)
         self._handle_first_post()
-        self._fix_user_post_counts(users or self.involved_users().all())
-        self._fix_post_counts(self.forum)
+        Topic.change_post_counts(self.forum, post_counts, 1, -1)
         db.session.commit()
         return self
 
@@ -724,8 +775,11 @@ class Topic(HideableCRUDMixin, db.Model):
         super(Topic, self).unhide()
         self._handle_first_post()
         self._restore_topic_to_forum()
-        self._fix_user_post_counts(users or self.involved_users().all())
-        self.forum.recalculate()
+
+        post_counts = Topic.visible_post_counts([self.id])
+        BoardStatistic.increment("topics")
+        BoardStatistic.increment("posts", sum(post_counts.values()))
+        Topic.change_post_counts(self.forum, post_counts, 1, 1)
         db.session.commit()
         return self
 
@@ -744,8 +798,8 @@ class Topic(HideableCRUDMixin, db.Model):
                 # Now the second last post will be the last post
                 self.forum.last_post = topics[1].last_post
                 self.forum.last_post_title = topics[1].title
-                self.forum.last_post_user = topics[1].user
-                self.forum.last_post_username = topics[1].username
+                self.forum.last_post_user_id = topics[1].last_post_user_id
+                self.forum.last_post_username = topics[1].last_post_username
                 self.forum.last_post_created = topics[1].last_updated
         else:
             self.forum.last_post = None
@@ -754,43 +808,52 @@ class Topic(HideableCRUDMixin, db.Model):
             self.forum.last_post_username = None
             self.forum.last_post_created = None
 
-    def _fix_user_post_counts(self, users=None):
-        # Update the post counts
-        if users:
-            for user in users:
-                user.post_count = Post.query.filter(
-                    Post.user_id == user.id,
-                    Topic.id == Post.topic_id,
-                    Topic.hidden != True,
-                    Post.hidden != True
-                ).count()
-
-    def _fix_post_counts(self, forum):
-        clauses = [
-            Topic.forum_id == forum.id
-        ]
-        if self.hidden:
-            clauses.extend([
-                Topic.id != self.id,
-                Topic.hidden != True,
-            ])
-        else:
-            clauses.append(db.or_(Topic.id == self.id, Topic.hidden != True))
+    @staticmethod
+    def visible_post_counts(topic_ids):
+        """Returns a dict which maps the ids of the authors (``None`` for
+        deleted users and guests) to the number of their visible posts in
+        the given topics.
 
-        forum.topic_count = Topic.query.filter(*clauses).count()
+        :param topic_ids: The ids of the topics.
+        """
+        if not topic_ids:
+            return {}
+
+        return dict(
+            db.session.query(Post.user_id, db.func.count(Post.id)).
+            filter(Post.topic_id.in_(topic_ids), Post.hidden != True).
+            group_by(Post.user_id).
+            all()
+        )
 
-        post_count = clauses + [
-            Post.topic_id == Topic.id,
-        ]
+    @staticmethod
+    def change_post_counts(forum, post_counts, topic_count, sign):
+        """Adds (``sign=1``) or removes (``sign=-1``) posts to/from the
+        post counts of their authors and the forum, and topics to/from
+        the topic count of the forum. Each counter is updated with a single
+        statement.
+
+        :param forum: The forum of the topics.
+        :param post_counts: The result of :meth:`visible_post_counts`.
+        :param topic_count: The number of topics.
+        :param sign: Either ``1`` or ``-1``.
+        """
+        # todo: Find circular import and break it
+        from flaskbb.user.models import User
 
-        if self.hidden:
-            post_count.append(Post.hidden != True)
-        else:
-            post_count.append(
-                db.or_(Post.hidden != True, Post.id == self.first_post.id)
-            )
+        increments = {user_id: sign * count
+                      for user_id, count in post_counts.items()
+                      if user_id is not None}
+        bulk_increment(User.post_count, User.id, increments)
+        # the bulk update bypasses the session, hence the users which are
+        # already loaded need to fetch their new post count
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, User) and obj.id in increments:
+                db.session.expire(obj, ["post_count"])
 
-        forum.post_count = Post.query.distinct().filter(*post_count).count()
+        forum.topic_count = Forum.topic_count + sign * topic_count
+        forum.post_count = \
+            Forum.post_count + sign * sum(post_counts.values())
 
     def _restore_topic_to_forum(self):
         if (
@@ -799,8 +862,8 @@ class Topic(HideableCRUDMixin, db.Model):
         ):
             self.forum.last_post = self.last_post
             self.forum.last_post_title = self.title
-            self.forum.last_post_user = self.user
-            self.forum.last_post_username = self.username
+            self.forum.last_post_user_id = self.last_post_user_id
+            self.forum.last_post_username = self.last_post_username
             self.forum.last_post_created = self.last_updated
 
     def _handle_first_post(self):
@@ -906,24 +969,25 @@ class Forum(db.Model, CRUDMixin):
         return "<{} {}>".format(self.__class__.__name__, self.id)
 
     def update_last_post(self, commit=True):
-        """Updates the last post in the forum."""
-        last_post = Post.query.\
-            filter(Post.topic_id == Topic.id,
-                   Topic.forum_id == self.id).\
-            order_by(Post.date_created.desc()).\
-            limit(1)\
-            .first()
+        """Updates the last post in the forum. It is taken from the last
+        post columns of the most recently updated visible topic, so no
+        posts have to be scanned.
+        """
+        topic = db.session.query(Topic).\
+            filter(Topic.forum_id == self.id, Topic.hidden != True).\
+            order_by(Topic.last_updated.desc(), Topic.id.desc()).\
+            first()
 
         # Last post is none when there are no topics in the forum
-        if last_post is not None:
+        if topic is not None and topic.last_post_id is not None:
 
             # a new last post was found in the forum
-            if last_post != self.last_post:
-                self.last_post = last_post
-                self.last_post_title = last_post.topic.title
-                self.last_post_user_id = last_post.user_id
-                self.last_post_username = last_post.username
-                self.last_post_created = last_post.date_created
+            if topic.last_post_id != self.last_post_id:
+                self.last_post = topic.last_post
+                self.last_post_title = topic.title
+                self.last_post_user_id = topic.last_post_user_id
+                self.last_post_username = topic.last_post_username
+                self.last_post_created = topic.last_post_created
 
         # No post found..
         else:
@@ -963,21 +1027,11 @@ class Forum(db.Model, CRUDMixin):
             read_cutoff = time_utcnow() - timedelta(
                 days=flaskbb_config['TRACKER_LENGTH'])
 
+        from flaskbb.forum.tracking import get_read_tracker
+        tracker = get_read_tracker()
+
         # fetch the unread posts in the forum
-        unread_count = Topic.query.\
-            outerjoin(TopicsRead,
-                      db.and_(TopicsRead.topic_id == Topic.id,
-                              TopicsRead.user_id == user.id)).\
-            outerjoin(ForumsRead,
-                      db.and_(ForumsRead.forum_id == Topic.forum_id,
-                              ForumsRead.user_id == user.id)).\
-            filter(Topic.forum_id == self.id,
-                   Topic.last_updated > read_cutoff,
-                   db.or_(TopicsRead.last_read == None,  # noqa: E711
-                          TopicsRead.last_read < Topic.last_updated),
-                   db.or_(ForumsRead.last_read == None,  # noqa: E711
-                          ForumsRead.last_read < Topic.last_updated)).\
-            count()
+        unread_count = tracker.unread_count(user, self, read_cutoff)
 
         # No unread topics available - trying to mark the forum as read
         if unread_count == 0:
@@ -996,6 +1050,7 @@ class Forum(db.Model, CRUDMixin):
                              .format(forumsread))
                 forumsread.last_read = time_utcnow()
                 forumsread.save()
+                tracker.compact(user, self, forumsread.last_read)
                 return True
 
             # No ForumRead Entry existing - creating one.
@@ -1005,6 +1060,7 @@ class Forum(db.Model, CRUDMixin):
             forumsread.forum = self
             forumsread.last_read = time_utcnow()
             forumsread.save()
+            tracker.compact(user, self, forumsread.last_read)
             return True
 
         # Nothing updated, because there are still more than 0 unread
@@ -1055,6 +1111,7 @@ class Forum(db.Model, CRUDMixin):
             db.session.add(self)
 
         db.session.commit()
+        invalidate_forum_tree()
         return self
 
     def delete(self, users=None):
@@ -1063,9 +1120,12 @@ class Forum(db.Model, CRUDMixin):
 
         :param users: A list with user objects
         """
+        Forum.remove_statistics(Topic.forum_id == self.id)
+
         # Delete the forum
         db.session.delete(self)
         db.session.commit()
+        invalidate_forum_tree()
 
         # Update the users post count
         if users:
@@ -1078,16 +1138,75 @@ class Forum(db.Model, CRUDMixin):
 
         return self
 
+    @staticmethod
+    def remove_statistics(condition):
+        """Removes the visible topics and posts of the forums which are
+        about to be deleted from the board statistics.
+
+        :param condition: The clause which selects the topics of the
+                          forums, e.g. ``Topic.forum_id == forum.id``.
+        """
+        topics = db.session.query(Topic.id).\
+            filter(condition, Topic.hidden != True)
+        BoardStatistic.increment("topics", -topics.count())
+        BoardStatistic.increment("posts", -db.session.query(Post.id).filter(
+            Post.topic_id.in_(topics.subquery()), Post.hidden != True
+        ).count())
+
     def move_topics_to(self, topics):
-        """Moves a bunch a topics to the forum. Returns ``True`` if all
+        """Moves a bunch a topics to the forum. Returns ``True`` if the
         topics were moved successfully to the forum.
 
+        All topics are moved at once and the counters and last posts of
+        the involved forums are updated only once per forum. The read
+        trackers and the search index of the topics are updated along with
+        them.
+
         :param topics: A iterable with topic objects.
         """
-        status = False
-        for topic in topics:
-            status = topic.move(self)
-        return status
+        ids = [topic.id for topic in topics if topic.forum_id != self.id]
+        if not ids:
+            return False
+
+        # the number of topics and posts which leave every old forum;
+        # hidden topics aren't part of the counters
+        rows = db.session.query(
+            Topic.forum_id, Topic.hidden, db.func.count(Topic.id),
+            db.func.coalesce(db.func.sum(Topic.post_count), 0)
+        ).filter(Topic.id.in_(ids)).\
+            group_by(Topic.forum_id, Topic.hidden).\
+            all()
+
+        deltas = {}
+        for forum_id, hidden, topic_count, post_count in rows:
+            delta = deltas.setdefault(forum_id, [0, 0])
+            if not hidden:
+                delta[0] += topic_count
+                delta[1] += post_count
+
+        db.session.query(Topic).\
+            filter(Topic.id.in_(ids)).\
+            update({Topic.forum_id: self.id}, synchronize_session=False)
+        from flaskbb.forum.tracking import get_read_tracker
+        get_read_tracker().move_topics(ids, list(deltas), self)
+
+        for forum in Forum.query.filter(Forum.id.in_(deltas)):
+            topic_count, post_count = deltas[forum.id]
+            forum.topic_count = Forum.topic_count - topic_count
+            forum.post_count = Forum.post_count - post_count
+            forum.update_last_post(commit=False)
+
+        self.topic_count = \
+            Forum.topic_count + sum(delta[0] for delta in deltas.values())
+        self.post_count = \
+            Forum.post_count + sum(delta[1] for delta in deltas.values())
+        self.update_last_post(commit=False)
+
+        db.session.commit()
+
+        from flaskbb.utils.search_backends import get_search_backend
+        get_search_backend().move_topics(ids)
+        return True
 
     # Classmethods
     @classmethod
@@ -1098,59 +1217,92 @@ class Forum(db.Model, CRUDMixin):
         :param user: The user object is needed to check if we also need their
                      forumsread object.
         """
+        forum = get_entity_or_404(Forum, forum_id)
+
+        forumsread = None
         if user.is_authenticated:
-            forum, forumsread = Forum.query.\
-                filter(Forum.id == forum_id).\
-                options(db.joinedload("category")).\
-                outerjoin(ForumsRead,
-                          db.and_(ForumsRead.forum_id == Forum.id,
-                                  ForumsRead.user_id == user.id)).\
-                add_entity(ForumsRead).\
-                first_or_404()
-        else:
-            forum = Forum.query.filter(Forum.id == forum_id).first_or_404()
-            forumsread = None
+            forumsread = ForumsRead.query.\
+                filter(ForumsRead.forum_id == forum.id,
+                       ForumsRead.user_id == user.id).\
+                first()
 
         return forum, forumsread
 
     @classmethod
-    def get_topics(cls, forum_id, user, page=1, per_page=20):
+    def get_topics(cls, forum_id, user, page=1, per_page=20, after=None,
+                   before=None, forumsread=None):
         """Get the topics for the forum. If the user is logged in,
-        it will perform an outerjoin for the topics with the topicsread and
-        forumsread relation to check if it is read or unread.
+        the read state of the topics is loaded from the read tracker
+        (see :mod:`flaskbb.forum.tracking`) to check if they are read or
+        unread.
+
+        The items of the returned pagination are ``(topic, topicsread)``
+        tuples. The last post of a topic isn't joined; use its
+        ``last_post_*`` columns instead.
+
+        The topics are paginated by seeking on their sort key (see
+        :func:`~flaskbb.utils.database.keyset_paginate`), hence if a
+        topic id is given as ``after`` or ``before``, the page will be
+        loaded without an ``OFFSET``.
+
+        For logged in users the ids of the first unread posts of the
+        topics on the page are stored in ``first_unread_posts`` of the
+        returned pagination object
+        (see :meth:`~flaskbb.forum.models.Topic.first_unread_posts`).
 
         :param forum_id: The forum id
         :param user: The user object
         :param page: The page whom should be loaded
         :param per_page: How many topics per page should be shown
+        :param after: The id of the last topic of the previous page
+        :param before: The id of the first topic of the next page
+        :param forumsread: The forumsread object of the user for the forum
         """
+        query = Topic.query.filter_by(forum_id=forum_id)
+
+        # the topic count of the forum doesn't include the hidden topics
+        total = None
+        if not has_view_hidden():
+            total = db.session.query(Forum.topic_count).\
+                filter(Forum.id == forum_id).scalar()
+
+        topics = keyset_paginate(
+            query,
+            order_by=[(Topic.important, True), (Topic.last_updated, True),
+                      (Topic.id, True)],
+            page=page,
+            per_page=per_page,
+            get_id=lambda item: item[0].id,
+            total=total,
+            after=cls._topic_sort_key(after),
+            before=cls._topic_sort_key(before)
+        )
+
+        if not topics.items and page != 1:
+            abort(404)
+
         if user.is_authenticated:
-            # Now thats intersting - if i don't do the add_entity(Post)
-            # the n+1 still exists when trying to access 'topic.last_post'
-            # but without it it will fire another query.
-            # This way I don't have to use the last_post object when I
-            # iterate over the result set.
-            topics = Topic.query.filter_by(forum_id=forum_id).\
-                outerjoin(TopicsRead,
-                          db.and_(TopicsRead.topic_id == Topic.id,
-                                  TopicsRead.user_id == user.id)).\
-                outerjoin(Post, Topic.last_post_id == Post.id).\
-                add_entity(Post).\
-                add_entity(TopicsRead).\
-                order_by(Topic.important.desc(), Topic.last_updated.desc()).\
-                paginate(page, per_page, True)
+            from flaskbb.forum.tracking import get_read_tracker
+            reads = get_read_tracker().get_many(user, topics.items)
+            topics.items = [(topic, reads.get(topic.id))
+                            for topic in topics.items]
+            topics.first_unread_posts = Topic.first_unread_posts(
+                topics.items, user, forumsread
+            )
         else:
-            topics = Topic.query.filter_by(forum_id=forum_id).\
-                outerjoin(Post, Topic.last_post_id == Post.id).\
-                add_entity(Post).\
-                order_by(Topic.important.desc(), Topic.last_updated.desc()).\
-                paginate(page, per_page, True)
-
-            topics.items = [(topic, last_post, None)
-                            for topic, last_post, in topics.items]
+            topics.items = [(topic, None) for topic in topics.items]
+            topics.first_unread_posts = {}
 
         return topics
 
+    @staticmethod
+    def _topic_sort_key(topic_id):
+        if topic_id is None:
+            return None
+        return db.session.query(
+            Topic.important, Topic.last_updated, Topic.id
+        ).filter(Topic.id == topic_id).first()
+
 
 @make_comparable
 class Category(db.Model, CRUDMixin):
@@ -1192,10 +1344,14 @@ class Category(db.Model, CRUDMixin):
 
         :param users: A list with user objects
         """
+        Forum.remove_statistics(Topic.forum_id.in_(
+            db.session.query(Forum.id).filter(Forum.category_id == self.id)
+        ))
 
         # and finally delete the category itself
         db.session.delete(self)
         db.session.commit()
+        invalidate_forum_tree()
 
         # Update the users post count
         if users:
@@ -1205,6 +1361,13 @@ class Category(db.Model, CRUDMixin):
 
         return self
 
+    def save(self):
+        """Saves the category and invalidates the cached forum tree."""
+        db.session.add(self)
+        db.session.commit()
+        invalidate_forum_tree()
+        return self
+
     # Classmethods
     @classmethod
     def get_all(cls, user):
@@ -1220,43 +1383,7 @@ class Category(db.Model, CRUDMixin):
         :param user: The user object is needed to check if we also need their
                      forumsread object.
         """
-        # import Group model locally to avoid cicular imports
-        from flaskbb.user.models import Group
-        if user.is_authenticated:
-            # get list of user group ids
-            user_groups = [gr.id for gr in user.groups]
-            # filter forums by user groups
-            user_forums = Forum.query.\
-                filter(Forum.groups.any(Group.id.in_(user_groups))).\
-                subquery()
-
-            forum_alias = aliased(Forum, user_forums)
-            # get all
-            forums = cls.query.\
-                join(forum_alias, cls.id == forum_alias.category_id).\
-                outerjoin(ForumsRead,
-                          db.and_(ForumsRead.forum_id == forum_alias.id,
-                                  ForumsRead.user_id == user.id)).\
-                add_entity(forum_alias).\
-                add_entity(ForumsRead).\
-                order_by(Category.position, Category.id,
-                         forum_alias.position).\
-                all()
-        else:
-            guest_group = Group.get_guest_group()
-            # filter forums by guest groups
-            guest_forums = Forum.query.\
-                filter(Forum.groups.any(Group.id == guest_group.id)).\
-                subquery()
-
-            forum_alias = aliased(Forum, guest_forums)
-            forums = cls.query.\
-                join(forum_alias, cls.id == forum_alias.category_id).\
-                add_entity(forum_alias).\
-                order_by(Category.position, Category.id,
-                         forum_alias.position).\
-                all()
-
+        forums = _load_forum_tree(_get_forum_tree(user), user)
         return get_categories_and_forums(forums, user)
 
     @classmethod
@@ -1273,42 +1400,91 @@ class Category(db.Model, CRUDMixin):
         :param user: The user object is needed to check if we also need their
                      forumsread object.
         """
-        from flaskbb.user.models import Group
-        if user.is_authenticated:
-            # get list of user group ids
-            user_groups = [gr.id for gr in user.groups]
-            # filter forums by user groups
-            user_forums = Forum.query.\
-                filter(Forum.groups.any(Group.id.in_(user_groups))).\
-                subquery()
-
-            forum_alias = aliased(Forum, user_forums)
-            forums = cls.query.\
-                filter(cls.id == category_id).\
-                join(forum_alias, cls.id == forum_alias.category_id).\
-                outerjoin(ForumsRead,
-                          db.and_(ForumsRead.forum_id == forum_alias.id,
-                                  ForumsRead.user_id == user.id)).\
-                add_entity(forum_alias).\
-                add_entity(ForumsRead).\
-                order_by(forum_alias.position).\
-                all()
-        else:
-            guest_group = Group.get_guest_group()
-            # filter forums by guest groups
-            guest_forums = Forum.query.\
-                filter(Forum.groups.any(Group.id == guest_group.id)).\
-                subquery()
-
-            forum_alias = aliased(Forum, guest_forums)
-            forums = cls.query.\
-                filter(cls.id == category_id).\
-                join(forum_alias, cls.id == forum_alias.category_id).\
-                add_entity(forum_alias).\
-                order_by(forum_alias.position).\
-                all()
-
+        tree = [(cat_id, forum_id) for cat_id, forum_id in
+                _get_forum_tree(user) if cat_id == category_id]
+        forums = _load_forum_tree(tree, user)
         if not forums:
             abort(404)
 
         return get_forums(forums, user)
+
+
+def invalidate_forum_tree():
+    """Invalidates the cached forum trees of all groups. Needs to be called
+    whenever categories or forums are added, removed or reordered or their
+    groups change.
+    """
+    # a new generation makes all cached trees unreachable
+    cache.set("forum-tree/generation", uuid.uuid4().hex, timeout=0)
+
+
+def visible_forum_ids(user):
+    """Returns the ids of all forums which are visible to the groups of
+    the user.
+
+    :param user: The user.
+    """
+    return [forum_id for _, forum_id in _get_forum_tree(user)]
+
+
+def _get_forum_tree(user):
+    """Returns the ``(category_id, forum_id)`` pairs of all forums which are
+    visible to the groups of the user in the order they are displayed.
+    The result is cached per set of groups.
+    """
+    # import Group model locally to avoid cicular imports
+    from flaskbb.user.models import Group
+    if user.is_authenticated:
+        group_ids = sorted(gr.id for gr in user.groups)
+    else:
+        group_ids = [Group.get_guest_group().id]
+
+    generation = cache.get("forum-tree/generation")
+    if generation is None:
+        invalidate_forum_tree()
+        generation = cache.get("forum-tree/generation")
+
+    key = "forum-tree/{}/{}".format(
+        generation, ",".join(str(group_id) for group_id in group_ids)
+    )
+    tree = cache.get(key)
+    if tree is None:
+        tree = db.session.query(Category.id, Forum.id).\
+            join(Forum, Category.id == Forum.category_id).\
+            filter(Forum.groups.any(Group.id.in_(group_ids))).\
+            order_by(Category.position, Category.id, Forum.position).\
+            all()
+        tree = [tuple(row) for row in tree]
+        cache.set(key, tree,
+                  timeout=current_app.config["FORUM_TREE_CACHE_TIMEOUT"])
+    return tree
+
+
+def _load_forum_tree(tree, user):
+    """Loads the forums (and their categories) of the tree and overlays the
+    forumsread objects of the user. The result has the same form as the
+    one of a ``Category``, ``Forum``, ``ForumsRead`` join.
+    """
+    forum_ids = [forum_id for _, forum_id in tree]
+    if not forum_ids:
+        return []
+
+    forums = {
+        forum.id: forum for forum in Forum.query.
+        options(db.joinedload(Forum.category)).
+        filter(Forum.id.in_(forum_ids))
+    }
+
+    if not user.is_authenticated:
+        return [(forums[forum_id].category, forums[forum_id])
+                for forum_id in forum_ids if forum_id in forums]
+
+    forumsread = {
+        read.forum_id: read for read in ForumsRead.query.filter(
+            ForumsRead.user_id == user.id,
+            ForumsRead.forum_id.in_(forum_ids)
+        )
+    }
+    return [(forums[forum_id].category, forums[forum_id],
+             forumsread.get(forum_id))
+            for forum_id in forum_ids if forum_id in forums]
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+    flaskbb.forum.moderation
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Moderates many topics of a forum at once. Instead of saving, hiding
+    or deleting every topic on its own, each action is executed with a
+    constant number of statements in one transaction and the counters of
+    the forum and the users are fixed only once.
+
+    :copyright: (c) 2018 the FlaskBB Team
+    :license: BSD, see LICENSE for more details
+"""
+import attr
+
+from flaskbb.management.models import BoardStatistic
+from flaskbb.utils.helpers import time_utcnow
+from flaskbb.utils.search import invalidate_search_cache
+from flaskbb.utils.search_backends import get_search_backend
+
+from .models import Post, Report, Topic, TopicsRead, topictracker
+
+
+@attr.s(cmp=False, frozen=True, repr=True, hash=False)
+class TopicModerator(object):
+    """
+    Executes moderation actions on many topics of a forum. Every method
+    takes the forum and the ids of the selected topics; topics which
+    belong to another forum are ignored. The methods return the number of
+    topics which have been changed.
+    """
+
+    db = attr.ib()
+
+    def set_flag(self, forum, topic_ids, flag, value):
+        """Sets the ``locked`` or ``important`` flag of the topics.
+
+        :param flag: Either ``"locked"`` or ``"important"``.
+        :param value: The new value of the flag.
+        """
+        if flag not in {"locked", "important"}:
+            raise ValueError("Unknown topic flag: {}".format(flag))
+
+        column = getattr(Topic, flag)
+        changed = self._topics(forum, topic_ids, column != value).\
+            update({column: value}, synchronize_session=False)
+        self.db.session.commit()
+        return changed
+
+    def hide(self, forum, topic_ids, user):
+        """Hides the topics together with their first posts.
+
+        :param user: The user who hides the topics.
+        """
+        ids = self._topic_ids(forum, topic_ids, Topic.hidden != True)
+        if not ids:
+            return 0
+
+        # count the posts before the first posts are hidden as well
+        post_counts = Topic.visible_post_counts(ids)
+        self._set_hidden(ids, True, time_utcnow(), user.id)
+        self._change_counts(forum, post_counts, len(ids), -1)
+        forum.update_last_post(commit=False)
+        self.db.session.commit()
+        # the hidden topics are bulk updated, hence no session events
+        invalidate_search_cache()
+        return len(ids)
+
+    def unhide(self, forum, topic_ids):
+        """Restores the hidden topics together with their first posts."""
+        ids = self._topic_ids(forum, topic_ids, Topic.hidden == True)
+        if not ids:
+            return 0
+
+        self._set_hidden(ids, False, None, None)
+        post_counts = Topic.visible_post_counts(ids)
+        self._change_counts(forum, post_counts, len(ids), 1)
+        forum.update_last_post(commit=False)
+        self.db.session.commit()
+        invalidate_search_cache()
+        return len(ids)
+
+    def delete(self, forum, topic_ids):
+        """Deletes the topics together with their posts, reports and read
+        trackers.
+        """
+        rows = self._topics(forum, topic_ids).\
+            with_entities(Topic.id, Topic.hidden).all()
+        if not rows:
+            return 0
+
+        ids = [topic_id for topic_id, _ in rows]
+        visible = [topic_id for topic_id, hidden in rows if not hidden]
+        post_counts = Topic.visible_post_counts(visible)
+        self._change_counts(forum, post_counts, len(visible), -1)
+
+        post_ids = [post_id for (post_id, ) in self.db.session.
+                    query(Post.id).filter(Post.topic_id.in_(ids))]
+
+        # the topics and the forum reference their posts and vice versa,
+        # thus the references have to be removed first
+        forum.last_post = None
+        self.db.session.flush()
+        self._topics(forum, ids).update(
+            {Topic.first_post_id: None, Topic.last_post_id: None},
+            synchronize_session=False
+        )
+        if post_ids:
+            self.db.session.query(Report).\
+                filter(Report.post_id.in_(post_ids)).\
+                delete(synchronize_session=False)
+        self.db.session.query(TopicsRead).\
+            filter(TopicsRead.topic_id.in_(ids)).\
+            delete(synchronize_session=False)
+        self.db.session.execute(
+            topictracker.delete().where(topictracker.c.topic_id.in_(ids))
+        )
+        self.db.session.query(Post).\
+            filter(Post.topic_id.in_(ids)).\
+            delete(synchronize_session=False)
+        self._topics(forum, ids).delete(synchronize_session=False)
+
+        forum.update_last_post(commit=False)
+        self.db.session.commit()
+
+        search_backend = get_search_backend()
+        search_backend.delete(Post, post_ids)
+        search_backend.delete(Topic, ids)
+        return len(ids)
+
+    def move(self, forum, topic_ids, new_forum):
+        """Moves the topics to ``new_forum``. Returns ``True`` if the
+        topics have been moved.
+
+        :param new_forum: The forum the topics should be moved to.
+        """
+        topics = self._topics(forum, topic_ids).all()
+        return new_forum.move_topics_to(topics)
+
+    def _topics(self, forum, topic_ids, *clauses):
+        return self.db.session.query(Topic).filter(
+            Topic.forum_id == forum.id, Topic.id.in_(topic_ids), *clauses
+        )
+
+    def _topic_ids(self, forum, topic_ids, *clauses):
+        return [topic_id for (topic_id, ) in
+                self._topics(forum, topic_ids, *clauses).
+                with_entities(Topic.id)]
+
+    def _set_hidden(self, ids, hidden, hidden_at, hidden_by_id):
+        values = {"hidden": hidden, "hidden_at": hidden_at,
+                  "hidden_by_id": hidden_by_id}
+        self.db.session.query(Topic).\
+            filter(Topic.id.in_(ids)).\
+            update({getattr(Topic, key): value
+                    for key, value in values.items()},
+                   synchronize_session=False)
+
+        # the first post shares the hidden state with its topic
+        first_posts = self.db.session.query(Topic.first_post_id).\
+            filter(Topic.id.in_(ids))
+        self.db.session.query(Post).\
+            filter(Post.id.in_(first_posts.subquery())).\
+            update({getattr(Post, key): value
+                    for key, value in values.items()},
+                   synchronize_session=False)
+
+    def _change_counts(self, forum, post_counts, topic_count, sign):
+        Topic.change_post_counts(forum, post_counts, topic_count, sign)
+        BoardStatistic.increment("topics", sign * topic_count)
+        BoardStatistic.increment("posts", sign * sum(post_counts.values()))
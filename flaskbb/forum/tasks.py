@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+    flaskbb.forum.tasks
+    ~~~~~~~~~~~~~~~~~~~
+
+    The celery tasks of the forums module.
+
+    :copyright: (c) 2018 the FlaskBB Team
+    :license: BSD, see LICENSE for more details
+"""
+import logging
+
+from flaskbb.extensions import celery
+
+from . import tracking, utils
+
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task
+def flush_topic_views():
+    """Writes the topic views which are buffered in redis to the
+    database.
+    """
+    count = utils.flush_topic_views()
+    logger.debug("Flushed the views of {} topics.".format(count))
+    return count
+
+
+@celery.task
+def prune_read_trackers():
+    """Removes the expired read trackers and collapses the ones of fully
+    read forums.
+    """
+    removed = tracking.prune_read_trackers()
+    logger.info("Pruned the read trackers in {seconds}s: {collapsed} "
+                "collapsed, {topicsread} topicsread, {forumsread} "
+                "forumsread and {readmarks} readmarks rows removed."
+                .format(**removed))
+    return removed
@@ -0,0 +1,580 @@
+# -*- coding: utf-8 -*-
+"""
+    flaskbb.forum.tracking
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    The backends which store which topics a user has read. The backend
+    is selected with the ``READ_TRACKER`` config option.
+
+    :copyright: (c) 2018 the FlaskBB Team
+    :license: BSD, see LICENSE for more details
+"""
+import logging
+import time
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from flaskbb.extensions import db
+from flaskbb.utils.database import UTCDateTime, upsert_from_select
+from flaskbb.utils.helpers import (from_microseconds, time_utcnow,
+                                   to_microseconds)
+from flaskbb.utils.settings import flaskbb_config
+
+from .models import Forum, ForumsRead, ReadMarks, Topic, TopicsRead
+
+
+logger = logging.getLogger(__name__)
+
+#: The read state of a topic which is returned by the
+#: :class:`ReadMarksTracker`. Like a ``TopicsRead`` object it has a
+#: ``last_read`` attribute, thus it can be used in its place.
+ReadMark = namedtuple("ReadMark", ["topic_id", "last_read"])
+
+
+def encode_marks(marks):
+    """Encodes a dict which maps topic ids to the times they have been read
+    as a string. The topics are sorted by their id and the times are
+    stored as microseconds since the epoch, e.g. ``"3:1534150000000000"``.
+
+    :param marks: A dict with topic ids and timezone aware datetimes.
+    """
+    return ",".join(
+        "{}:{}".format(topic_id, to_microseconds(last_read))
+        for topic_id, last_read in sorted(marks.items())
+    )
+
+
+def decode_marks(value):
+    """Decodes the marks which have been encoded by :func:`encode_marks`.
+
+    :param value: The encoded marks.
+    """
+    marks = {}
+    for mark in (value or "").split(","):
+        if not mark:
+            continue
+        topic_id, microseconds = mark.split(":")
+        marks[int(topic_id)] = from_microseconds(int(microseconds))
+    return marks
+
+
+class ReadTracker(object):
+    """The interface of the read tracking backends.
+
+    A backend stores when a user has read a topic. The objects it returns
+    for the topics have a ``last_read`` attribute and are used by
+    :func:`~flaskbb.utils.helpers.topic_is_unread`. The ``ForumsRead``
+    trackers are shared by all backends.
+    """
+
+    def get(self, user, topic):
+        """Returns the read object of the topic or ``None`` if the user
+        hasn't read it yet.
+
+        :param user: The user whose read state should be returned.
+        :param topic: The topic.
+        """
+        return self.get_many(user, [topic]).get(topic.id)
+
+    def get_many(self, user, topics):
+        """Returns a dict which maps the ids of the topics which the user
+        has read to their read objects.
+
+        :param user: The user whose read state should be returned.
+        :param topics: An iterable with topics.
+        """
+        raise NotImplementedError
+
+    def mark_read(self, user, topic, topicsread, forumsread=None):
+        """Stores that the user has read the topic just now and returns
+        the read object.
+
+        :param user: The user who has read the topic.
+        :param topic: The topic which has been read.
+        :param topicsread: The read object which has been returned by
+                           :meth:`get`, so that it isn't loaded again.
+        :param forumsread: The forumsread object of the forum of the topic.
+        """
+        raise NotImplementedError
+
+    def unread_count(self, user, forum, read_cutoff):
+        """Returns the number of topics in the forum which are unread.
+
+        :param user: The user whose unread topics should be counted.
+        :param forum: The forum.
+        :param read_cutoff: Topics which haven't been updated since then
+                            are treated as read.
+        """
+        raise NotImplementedError
+
+    def compact(self, user, forum, last_read):
+        """Called after the whole forum has been read by the user at
+        ``last_read``. Read objects older than that are not needed anymore.
+
+        :param user: The user who has read the forum.
+        :param forum: The forum which has been read.
+        :param last_read: The time the forum has been read.
+        """
+
+    def clear(self, user, forum_id=None):
+        """Removes the read state of the user, either for a single forum or
+        for all forums. It is called when the forums are marked as read.
+
+        :param user: The user whose read state should be removed.
+        :param forum_id: The id of the forum. If ``None``, the read state of
+                         all forums is removed.
+        """
+        raise NotImplementedError
+
+    def move_topics(self, topic_ids, forum_ids, new_forum):
+        """Moves the read state of topics which have been moved to
+        another forum.
+
+        :param topic_ids: The ids of the moved topics.
+        :param forum_ids: The ids of the forums the topics were moved from.
+        :param new_forum: The forum the topics have been moved to.
+        """
+        raise NotImplementedError
+
+
+class TopicsReadTracker(ReadTracker):
+    """Stores the read state of every topic a user has visited in its own
+    ``TopicsRead`` row.
+    """
+
+    def get_many(self, user, topics):
+        topic_ids = [topic.id for topic in topics]
+        if not topic_ids:
+            return {}
+
+        return {
+            topicsread.topic_id: topicsread
+            for topicsread in TopicsRead.query.filter(
+                TopicsRead.user_id == user.id,
+                TopicsRead.topic_id.in_(topic_ids)
+            )
+        }
+
+    def mark_read(self, user, topic, topicsread, forumsread=None):
+        # The user has not visited the topic before. Inserting him in
+        # the TopicsRead model.
+        if topicsread is None:
+            logger.debug("Creating new TopicsRead object.")
+            topicsread = TopicsRead()
+            topicsread.user = user
+            topicsread.topic = topic
+            topicsread.forum = topic.forum
+        else:
+            logger.debug("Updating existing TopicsRead '{}' object."
+                         .format(topicsread))
+
+        topicsread.last_read = time_utcnow()
+        return topicsread.save()
+
+    def unread_count(self, user, forum, read_cutoff):
+        return Topic.query.\
+            outerjoin(TopicsRead,
+                      db.and_(TopicsRead.topic_id == Topic.id,
+                              TopicsRead.user_id == user.id)).\
+            outerjoin(ForumsRead,
+                      db.and_(ForumsRead.forum_id == Topic.forum_id,
+                              ForumsRead.user_id == user.id)).\
+            filter(Topic.forum_id == forum.id,
+                   Topic.last_updated > read_cutoff,
+                   db.or_(TopicsRead.last_read == None,  # noqa: E711
+                          TopicsRead.last_read < Topic.last_updated),
+                   db.or_(ForumsRead.last_read == None,  # noqa: E711
+                          ForumsRead.last_read < Topic.last_updated)).\
+            count()
+
+    def clear(self, user, forum_id=None):
+        query = TopicsRead.query.filter(TopicsRead.user_id == user.id)
+        if forum_id is not None:
+            query = query.filter(TopicsRead.forum_id == forum_id)
+        query.delete(synchronize_session=False)
+
+    def move_topics(self, topic_ids, forum_ids, new_forum):
+        db.session.query(TopicsRead).\
+            filter(TopicsRead.topic_id.in_(topic_ids)).\
+            update({TopicsRead.forum_id: new_forum.id},
+                   synchronize_session=False)
+
+
+class ReadMarksTracker(ReadTracker):
+    """Stores the read state of a user for a whole forum in a single
+    ``ReadMarks`` row.
+
+    The ``last_read`` timestamp of the ``ForumsRead`` tracker acts as a
+    watermark: every topic which hasn't been updated since then is read.
+    The row only holds the topics which have been read after the
+    watermark, encoded as a sorted list of topic ids and timestamps
+    (see :func:`encode_marks`). Whenever the whole forum has been read,
+    the watermark moves forward and the marks are emptied again.
+
+    As the row is shared by all topics of the forum, it is only replaced
+    if it hasn't been changed by another request since it has been read.
+    """
+
+    #: How often the marks are read again if they have been changed by
+    #: another request in the meantime.
+    retries = 3
+
+    def get_many(self, user, topics):
+        topics = list(topics)
+        forum_ids = {topic.forum_id for topic in topics}
+        if not forum_ids:
+            return {}
+
+        marks = {}
+        for row in ReadMarks.query.filter(ReadMarks.user_id == user.id,
+                                          ReadMarks.forum_id.in_(forum_ids)):
+            marks.update(decode_marks(row.marks))
+
+        watermarks = dict(
+            db.session.query(ForumsRead.forum_id, ForumsRead.last_read).
+            filter(ForumsRead.user_id == user.id,
+                   ForumsRead.forum_id.in_(forum_ids))
+        )
+
+        reads = {}
+        for topic in topics:
+            values = [value for value in (marks.get(topic.id),
+                                          watermarks.get(topic.forum_id))
+                      if value is not None]
+            if values:
+                reads[topic.id] = ReadMark(topic.id, max(values))
+        return reads
+
+    def mark_read(self, user, topic, topicsread, forumsread=None):
+        now = time_utcnow()
+        for _ in range(self.retries):
+            value = db.session.query(ReadMarks.marks).\
+                filter(ReadMarks.user_id == user.id,
+                       ReadMarks.forum_id == topic.forum_id).\
+                with_for_update().\
+                scalar()
+
+            marks = decode_marks(value)
+            marks[topic.id] = now
+            if forumsread is not None:
+                marks = {topic_id: last_read
+                         for topic_id, last_read in marks.items()
+                         if last_read > forumsread.last_read}
+
+            if self._replace_marks(user.id, topic.forum_id, value,
+                                   encode_marks(marks)):
+                break
+        else:
+            logger.warning("The read marks of user %s in forum %s have been "
+                           "changed concurrently, topic %s isn't marked as "
+                           "read.", user.id, topic.forum_id, topic.id)
+
+        db.session.commit()
+        return ReadMark(topic.id, now)
+
+    def unread_count(self, user, forum, read_cutoff):
+        forumsread = ForumsRead.query.\
+            filter(ForumsRead.user_id == user.id,
+                   ForumsRead.forum_id == forum.id).first()
+        if forumsread is not None and forumsread.last_read > read_cutoff:
+            read_cutoff = forumsread.last_read
+
+        row = ReadMarks.query.\
+            filter(ReadMarks.user_id == user.id,
+                   ReadMarks.forum_id == forum.id).first()
+        marks = decode_marks(row.marks if row else None)
+
+        # only the topics which have been updated after the watermark
+        # have to be compared with the marks
+        updated = db.session.query(Topic.id, Topic.last_updated).\
+            filter(Topic.forum_id == forum.id,
+                   Topic.last_updated > read_cutoff)
+        return sum(1 for topic_id, last_updated in updated
+                   if marks.get(topic_id) is None or
+                   marks[topic_id] < last_updated)
+
+    def compact(self, user, forum, last_read):
+        row = ReadMarks.query.\
+            filter(ReadMarks.user_id == user.id,
+                   ReadMarks.forum_id == forum.id).first()
+        if row is None:
+            return
+
+        row.marks = encode_marks({
+            topic_id: value
+            for topic_id, value in decode_marks(row.marks).items()
+            if value > last_read
+        })
+        row.save()
+
+    def clear(self, user, forum_id=None):
+        query = ReadMarks.query.filter(ReadMarks.user_id == user.id)
+        if forum_id is not None:
+            query = query.filter(ReadMarks.forum_id == forum_id)
+        query.delete(synchronize_session=False)
+
+    def move_topics(self, topic_ids, forum_ids, new_forum):
+        topic_ids = set(topic_ids)
+        moved = {}
+        for row in ReadMarks.query.filter(ReadMarks.forum_id.in_(forum_ids)):
+            marks = decode_marks(row.marks)
+            if topic_ids.isdisjoint(marks):
+                continue
+
+            user_marks = moved.setdefault(row.user_id, {})
+            for topic_id in topic_ids.intersection(marks):
+                user_marks[topic_id] = marks.pop(topic_id)
+            row.marks = encode_marks(marks)
+
+        for user_id, marks in moved.items():
+            row = self._get_row(user_id, new_forum.id)
+            marks.update(decode_marks(row.marks))
+            row.marks = encode_marks(marks)
+            db.session.add(row)
+
+    def _replace_marks(self, user_id, forum_id, old, new):
+        # compare-and-swap, returns False if the marks are not ``old``
+        # anymore
+        table = ReadMarks.__table__
+        if old is None:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(
+                        user_id=user_id, forum_id=forum_id, marks=new
+                    ))
+            except IntegrityError:
+                return False
+            return True
+
+        result = db.session.execute(
+            table.update().
+            where(table.c.user_id == user_id).
+            where(table.c.forum_id == forum_id).
+            where(table.c.marks == old).
+            values(marks=new)
+        )
+        return result.rowcount == 1
+
+    def _get_row(self, user_id, forum_id):
+        row = ReadMarks.query.\
+            filter(ReadMarks.user_id == user_id,
+                   ReadMarks.forum_id == forum_id).first()
+        if row is None:
+            row = ReadMarks(user_id=user_id, forum_id=forum_id)
+        return row
+
+
+#: The available read tracking backends.
+read_trackers = {
+    "topicsread": TopicsReadTracker,
+    "readmarks": ReadMarksTracker
+}
+
+
+def get_read_tracker(app=None):
+    """Returns the read tracking backend which is configured with
+    ``READ_TRACKER``.
+
+    :param app: The app. Defaults to the current app.
+    """
+    app = app or current_app
+    return read_trackers[app.config["READ_TRACKER"]]()
+
+
+def mark_forums_read(user, forum_id=None):
+    """Marks a single forum or all forums as read for the user. The
+    ``ForumsRead`` trackers of all forums are written with a single
+    statement and the topic trackers are removed with another one,
+    regardless of the number of forums. The session is committed.
+
+    :param user: The user who has read the forums.
+    :param forum_id: The id of the forum. If ``None``, all forums are
+                     marked as read.
+    """
+    now = db.literal(time_utcnow(), UTCDateTime(timezone=True))
+    forums = db.select([
+        db.literal(user.id).label("user_id"),
+        Forum.id.label("forum_id"),
+        now.label("last_read"),
+        now.label("cleared")
+    ])
+    if forum_id is not None:
+        forums = forums.where(Forum.id == forum_id)
+
+    get_read_tracker().clear(user, forum_id=forum_id)
+    upsert_from_select(
+        ForumsRead.__table__,
+        ["user_id", "forum_id", "last_read", "cleared"],
+        forums,
+        keys=["user_id", "forum_id"]
+    )
+    db.session.commit()
+
+
+def prune_read_trackers(batch_size=1000):
+    """Removes the read trackers which don't affect the read state of any
+    topic anymore. Topics which haven't been updated in the last
+    ``TRACKER_LENGTH`` days are always read, thus trackers older than that
+    can be removed. Besides that, the ``TopicsRead`` rows of a user are
+    collapsed into the ``ForumsRead`` tracker once all topics of the forum
+    have been read.
+
+    The rows are removed in batches of ``batch_size`` rows which are
+    committed one by one. Returns a dict with the number of removed rows
+    per table and the number of ``seconds`` it took.
+
+    :param batch_size: The number of rows which are removed per batch.
+    """
+    started = time.time()
+    removed = {"collapsed": 0, "topicsread": 0, "forumsread": 0,
+               "readmarks": 0}
+
+    # nothing is pruned while the tracker is disabled so that the read
+    # state is still there once it gets enabled again
+    if flaskbb_config["TRACKER_LENGTH"] > 0:
+        cutoff = time_utcnow() - timedelta(
+            days=flaskbb_config["TRACKER_LENGTH"]
+        )
+        removed["collapsed"] = _collapse_topicsread(cutoff, batch_size)
+        removed["topicsread"] = _delete_in_batches(
+            TopicsRead, TopicsRead.user_id, TopicsRead.topic_id,
+            TopicsRead.last_read < cutoff, batch_size
+        )
+        removed["forumsread"] = _delete_in_batches(
+            ForumsRead, ForumsRead.user_id, ForumsRead.forum_id,
+            db.and_(ForumsRead.last_read < cutoff,
+                    db.or_(ForumsRead.cleared == None,
+                           ForumsRead.cleared < cutoff)),
+            batch_size
+        )
+        removed["readmarks"] = _prune_readmarks(cutoff, batch_size)
+
+    removed["seconds"] = round(time.time() - started, 3)
+    return removed
+
+
+def _delete_in_batches(model, first, second, condition, batch_size):
+    """Deletes the rows of a table with a primary key of two columns
+    which match ``condition``.
+    """
+    total = 0
+    while True:
+        keys = db.session.query(first, second).\
+            filter(condition).\
+            limit(batch_size).\
+            all()
+        if not keys:
+            return total
+
+        grouped = defaultdict(list)
+        for first_key, second_key in keys:
+            grouped[first_key].append(second_key)
+
+        db.session.query(model).\
+            filter(db.or_(*[db.and_(first == key, second.in_(values))
+                            for key, values in grouped.items()])).\
+            delete(synchronize_session=False)
+        db.session.commit()
+        total += len(keys)
+
+
+def _collapse_topicsread(cutoff, batch_size):
+    """Replaces the ``TopicsRead`` rows of a user in a forum with the
+    ``cleared`` watermark of the ``ForumsRead`` tracker if there are no
+    unread topics in the forum. Returns the number of removed rows.
+    """
+    total = 0
+    last = None
+    while True:
+        pairs = db.session.query(TopicsRead.user_id, TopicsRead.forum_id).\
+            distinct().\
+            order_by(TopicsRead.user_id, TopicsRead.forum_id)
+        if last is not None:
+            pairs = pairs.filter(db.or_(
+                TopicsRead.user_id > last[0],
+                db.and_(TopicsRead.user_id == last[0],
+                        TopicsRead.forum_id > last[1])
+            ))
+        pairs = pairs.limit(batch_size).all()
+        if not pairs:
+            return total
+
+        for user_id, forum_id in pairs:
+            total += _collapse_forum(user_id, forum_id, cutoff)
+        db.session.commit()
+        last = pairs[-1]
+
+
+def _collapse_forum(user_id, forum_id, cutoff):
+    unread = db.session.query(Topic.id).\
+        outerjoin(TopicsRead,
+                  db.and_(TopicsRead.topic_id == Topic.id,
+                          TopicsRead.user_id == user_id)).\
+        outerjoin(ForumsRead,
+                  db.and_(ForumsRead.forum_id == Topic.forum_id,
+                          ForumsRead.user_id == user_id)).\
+        filter(Topic.forum_id == forum_id,
+               Topic.hidden != True,
+               Topic.last_updated > cutoff,
+               db.or_(TopicsRead.last_read == None,
+                      TopicsRead.last_read < Topic.last_updated),
+               db.or_(ForumsRead.last_read == None,
+                      ForumsRead.last_read < Topic.last_updated)).\
+        first()
+    if unread is not None:
+        return 0
+
+    rows = db.session.query(TopicsRead).\
+        filter(TopicsRead.user_id == user_id,
+               TopicsRead.forum_id == forum_id)
+    last_read = rows.with_entities(db.func.max(TopicsRead.last_read)).\
+        scalar()
+
+    # every topic which has been updated until the user has read the
+    # last topic is read, so this is the new watermark
+    forumsread = ForumsRead.query.\
+        filter(ForumsRead.user_id == user_id,
+               ForumsRead.forum_id == forum_id).first()
+    if forumsread is None:
+        forumsread = ForumsRead(user_id=user_id, forum_id=forum_id,
+                                last_read=last_read)
+    forumsread.last_read = max(forumsread.last_read, last_read)
+    forumsread.cleared = max(forumsread.cleared or last_read, last_read)
+    db.session.add(forumsread)
+
+    return rows.delete(synchronize_session=False)
+
+
+def _prune_readmarks(cutoff, batch_size):
+    """Removes the marks which are older than ``cutoff`` and the rows
+    which don't contain any marks anymore. Returns the number of removed
+    rows.
+    """
+    total = 0
+    last = None
+    while True:
+        rows = ReadMarks.query.order_by(ReadMarks.user_id, ReadMarks.forum_id)
+        if last is not None:
+            rows = rows.filter(db.or_(
+                ReadMarks.user_id > last[0],
+                db.and_(ReadMarks.user_id == last[0],
+                        ReadMarks.forum_id > last[1])
+            ))
+        rows = rows.limit(batch_size).all()
+        if not rows:
+            return total
+
+        for row in rows:
+            marks = {topic_id: last_read for topic_id, last_read
+                     in decode_marks(row.marks).items()
+                     if last_read >= cutoff}
+            if not marks:
+                db.session.delete(row)
+                total += 1
+            else:
+                row.marks = encode_marks(marks)
+        db.session.commit()
+        last = rows[-1].user_id, rows[-1].forum_id
@@ -12,7 +12,13 @@
 from flask import current_app
 from flask_login import current_user
 
+from flaskbb.extensions import db
+from flaskbb.user.models import User
+from flaskbb.utils.buffers import get_buffer
+from flaskbb.utils.database import bulk_increment, bulk_update
+
 from .locals import current_forum
+from .models import Forum, Post, Topic
 
 
 def force_login_if_needed():
@@ -29,3 +35,84 @@ def should_force_login(user, forum):
     return not user.is_authenticated and not (
         {g.id for g in forum.groups} & {g.id for g in user.groups}
     )
+
+
+def count_topic_view(topic_id):
+    """
+    Counts a view of a topic. The views are buffered and written to the
+    database once the buffer is older than ``TOPIC_VIEWS_FLUSH_INTERVAL``
+    seconds.
+    """
+    views = get_buffer("topic-views")
+    views.incr(topic_id)
+
+    if views.due(current_app.config["TOPIC_VIEWS_FLUSH_INTERVAL"]):
+        flush_topic_views()
+
+
+def flush_topic_views():
+    """
+    Writes the buffered topic views to the database with a single
+    update and returns the number of updated topics.
+    """
+    views = get_buffer("topic-views").drain()
+    if not views:
+        return 0
+
+    bulk_increment(Topic.views, Topic.id, views)
+    db.session.commit()
+    return len(views)
+
+
+def verify_post_counts(fix=False):
+    """
+    Recounts the post counts of the users, topics and forums and the topic
+    counts of the forums and compares them with the stored counters, which
+    are only changed by deltas when posts and topics are hidden or deleted.
+
+    Returns a dict which maps the names of the counters to the number of
+    rows whose counter is wrong.
+
+    :param fix: If set to ``True``, the wrong counters are corrected.
+    """
+    visible = db.and_(Post.hidden != True, Topic.hidden != True)
+
+    user_posts = db.session.query(Post.user_id, db.func.count(Post.id)).\
+        join(Topic, Post.topic_id == Topic.id).\
+        filter(visible, Post.user_id != None).\
+        group_by(Post.user_id)
+    topic_posts = db.session.query(Post.topic_id, db.func.count(Post.id)).\
+        filter(Post.hidden != True).\
+        group_by(Post.topic_id)
+    forum_posts = db.session.query(Topic.forum_id, db.func.count(Post.id)).\
+        join(Post, Post.topic_id == Topic.id).\
+        filter(visible).\
+        group_by(Topic.forum_id)
+    forum_topics = db.session.query(Topic.forum_id, db.func.count(Topic.id)).\
+        filter(Topic.hidden != True).\
+        group_by(Topic.forum_id)
+
+    # the post counts of hidden topics aren't maintained
+    wrong = {
+        "user_posts": _compare_counter(User.post_count, User.id,
+                                       dict(user_posts), fix),
+        "topic_posts": _compare_counter(Topic.post_count, Topic.id,
+                                        dict(topic_posts), fix,
+                                        Topic.hidden != True),
+        "forum_posts": _compare_counter(Forum.post_count, Forum.id,
+                                        dict(forum_posts), fix),
+        "forum_topics": _compare_counter(Forum.topic_count, Forum.id,
+                                         dict(forum_topics), fix),
+    }
+    if fix:
+        db.session.commit()
+    return wrong
+
+
+def _compare_counter(column, key_column, counts, fix, *clauses):
+    stored = db.session.query(key_column, column).filter(*clauses)
+    wrong = {key: counts.get(key, 0) for key, value in stored
+             if value != counts.get(key, 0)}
+    if fix:
+        bulk_update(column, key_column, wrong)
+    return len(wrong)
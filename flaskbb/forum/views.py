@@ -20,14 +20,20 @@ from flask_babelplus import gettext as _
 from flask_login import current_user, login_required
 from pluggy import HookimplMarker
 from sqlalchemy import asc, desc
+from werkzeug.urls import url_encode
 
 from flaskbb.extensions import allows, db
 from flaskbb.markup import make_renderer
 from flaskbb.forum.forms import (NewTopicForm, QuickreplyForm, ReplyForm,
                                  ReportForm, SearchPageForm, UserSearchForm)
-from flaskbb.forum.models import (Category, Forum, ForumsRead, Post, Topic,
-                                  TopicsRead)
+from flaskbb.forum.models import Category, Forum, ForumsRead, Post, Topic
+from flaskbb.forum.moderation import TopicModerator
+from flaskbb.forum.tracking import get_read_tracker, mark_forums_read
+from flaskbb.management.models import BoardStatistic
 from flaskbb.user.models import User
+from flaskbb.user.utils import AuthorBundle
+from flaskbb.utils.database import (get_entity_or_404, has_view_hidden,
+                                    keyset_paginate)
 from flaskbb.utils.helpers import (do_topic_action, format_quote,
                                    get_online_users, real, register_view,
                                    render_template, time_diff, time_utcnow,
@@ -38,8 +44,9 @@ from flaskbb.utils.requirements import (CanAccessForum,
                                         CanPostTopic, Has,
                                         IsAtleastModeratorInForum)
 from flaskbb.utils.settings import flaskbb_config
+from . import tasks  # noqa: F401 (registers the celery tasks)
 from .locals import current_topic, current_forum, current_category
-from .utils import force_login_if_needed
+from .utils import count_topic_view, force_login_if_needed
 
 impl = HookimplMarker("flaskbb")
 
@@ -52,10 +59,11 @@ class ForumIndex(MethodView):
         categories = Category.get_all(user=real(current_user))
 
         # Fetch a few stats about the forum
-        user_count = User.query.count()
-        topic_count = Topic.query.count()
-        post_count = Post.query.count()
-        newest_user = User.query.order_by(User.id.desc()).first()
+        stats = BoardStatistic.as_dict()
+        user_count = stats["users"]
+        topic_count = stats["topics"]
+        post_count = stats["posts"]
+        newest_user = User.query.get(stats["newest_user_id"])
 
         # Check if we use redis or not
         if not current_app.config["REDIS_ENABLED"]:
@@ -117,7 +125,10 @@ class ViewForum(MethodView):
             forum_id=forum_instance.id,
             user=real(current_user),
             page=page,
-            per_page=flaskbb_config["TOPICS_PER_PAGE"]
+            per_page=flaskbb_config["TOPICS_PER_PAGE"],
+            after=request.args.get("after", type=int),
+            before=request.args.get("before", type=int),
+            forumsread=forumsread
         )
 
         return render_template(
@@ -140,7 +151,7 @@ class ViewPost(MethodView):
 
     def get(self, post_id):
         """Redirects to a post in a topic."""
-        post = Post.query.filter_by(id=post_id).first_or_404()
+        post = get_entity_or_404(Post, post_id)
         post_in_topic = Post.query.filter(
             Post.topic_id == post.topic_id, Post.id <= post_id
         ).order_by(Post.id.asc()).count()
@@ -171,13 +182,14 @@ class ViewTopic(MethodView):
 
     def get(self, topic_id, slug=None):
         page = request.args.get("page", 1, type=int)
+        after = request.args.get("after", type=int)
+        before = request.args.get("before", type=int)
 
         # Fetch some information about the topic
         topic = Topic.get_topic(topic_id=topic_id, user=real(current_user))
 
         # Count the topic views
-        topic.views += 1
-        topic.save()
+        count_topic_view(topic.id)
 
         # Update the topicsread status if the user hasn't read it
         forumsread = None
@@ -189,24 +201,37 @@ class ViewTopic(MethodView):
         topic.update_read(real(current_user), topic.forum, forumsread)
 
         # fetch the posts in the topic
-        posts = Post.query.outerjoin(
-            User, Post.user_id == User.id
-        ).filter(
-            Post.topic_id == topic.id
-        ).add_entity(
-            User
-        ).order_by(
-            Post.id.asc()
-        ).paginate(page, flaskbb_config["POSTS_PER_PAGE"], False)
+        posts = keyset_paginate(
+            Post.query.outerjoin(
+                User, Post.user_id == User.id
+            ).filter(
+                Post.topic_id == topic.id
+            ).add_entity(
+                User
+            ).options(
+                db.joinedload(Post.hidden_by)
+            ),
+            order_by=[(Post.id, False)],
+            page=page,
+            per_page=flaskbb_config["POSTS_PER_PAGE"],
+            get_id=lambda item: item[0].id,
+            # the post count doesn't include the hidden posts
+            total=None if has_view_hidden() else topic.post_count,
+            after=(after, ) if after is not None else None,
+            before=(before, ) if before is not None else None
+        )
 
         # Abort if there are no posts on this page
         if len(posts.items) == 0:
             abort(404)
 
+        authors = AuthorBundle(user for _, user in posts.items)
+
         return render_template(
             "forum/topic.html",
             topic=topic,
             posts=posts,
+            authors=authors,
             last_seen=time_diff(),
             form=self.form()
         )
@@ -261,13 +286,13 @@ class NewTopic(MethodView):
     ]
 
     def get(self, forum_id, slug=None):
-        forum_instance = Forum.query.filter_by(id=forum_id).first_or_404()
+        forum_instance = get_entity_or_404(Forum, forum_id)
         return render_template(
             "forum/new_topic.html", forum=forum_instance, form=self.form()
         )
 
     def post(self, forum_id, slug=None):
-        forum_instance = Forum.query.filter_by(id=forum_id).first_or_404()
+        forum_instance = get_entity_or_404(Forum, forum_id)
         form = self.form()
         if form.validate_on_submit():
             topic = form.save(real(current_user), forum_instance)
@@ -315,7 +340,10 @@ class ManageForum(MethodView):
             forum_id=forum_instance.id,
             user=real(current_user),
             page=page,
-            per_page=flaskbb_config["TOPICS_PER_PAGE"]
+            per_page=flaskbb_config["TOPICS_PER_PAGE"],
+            after=request.args.get("after", type=int),
+            before=request.args.get("before", type=int),
+            forumsread=forumsread
         )
 
         return render_template(
@@ -355,7 +383,8 @@ class ManageForum(MethodView):
                 topics=tmp_topics,
                 user=real(current_user),
                 action="locked",
-                reverse=False
+                reverse=False,
+                forum=forum_instance
             )
 
             flash(_("%(count)s topics locked.", count=changed), "success")
@@ -366,7 +395,8 @@ class ManageForum(MethodView):
                 topics=tmp_topics,
                 user=real(current_user),
                 action="locked",
-                reverse=True
+                reverse=True,
+                forum=forum_instance
             )
             flash(_("%(count)s topics unlocked.", count=changed), "success")
             return redirect(mod_forum_url)
@@ -377,7 +407,8 @@ class ManageForum(MethodView):
                 topics=tmp_topics,
                 user=real(current_user),
                 action="important",
-                reverse=False
+                reverse=False,
+                forum=forum_instance
             )
             flash(_("%(count)s topics highlighted.", count=changed), "success")
             return redirect(mod_forum_url)
@@ -387,7 +418,8 @@ class ManageForum(MethodView):
                 topics=tmp_topics,
                 user=real(current_user),
                 action="important",
-                reverse=True
+                reverse=True,
+                forum=forum_instance
             )
             flash(_("%(count)s topics trivialized.", count=changed), "success")
             return redirect(mod_forum_url)
@@ -398,7 +430,8 @@ class ManageForum(MethodView):
                 topics=tmp_topics,
                 user=real(current_user),
                 action="delete",
-                reverse=False
+                reverse=False,
+                forum=forum_instance
             )
             flash(_("%(count)s topics deleted.", count=changed), "success")
             return redirect(mod_forum_url)
@@ -411,7 +444,7 @@ class ManageForum(MethodView):
                 flash(_("Please choose a new forum for the topics."), "info")
                 return redirect(mod_forum_url)
 
-            new_forum = Forum.query.filter_by(id=new_forum_id).first_or_404()
+            new_forum = get_entity_or_404(Forum, new_forum_id)
             # check the permission in the current forum and in the new forum
 
             if not Permission(
@@ -423,7 +456,8 @@ class ManageForum(MethodView):
                 )
                 return redirect(mod_forum_url)
 
-            if new_forum.move_topics_to(tmp_topics):
+            moderator = TopicModerator(db)
+            if moderator.move(forum_instance, ids, new_forum):
                 flash(_("Topics moved."), "success")
             else:
                 flash(_("Failed to move topics."), "danger")
@@ -436,7 +470,8 @@ class ManageForum(MethodView):
                 topics=tmp_topics,
                 user=real(current_user),
                 action="hide",
-                reverse=False
+                reverse=False,
+                forum=forum_instance
             )
             flash(_("%(count)s topics hidden.", count=changed), "success")
             return redirect(mod_forum_url)
@@ -446,7 +481,8 @@ class ManageForum(MethodView):
                 topics=tmp_topics,
                 user=real(current_user),
                 action="unhide",
-                reverse=False
+                reverse=False,
+                forum=forum_instance
             )
             flash(_("%(count)s topics unhidden.", count=changed), "success")
             return redirect(mod_forum_url)
@@ -473,11 +509,11 @@ class NewPost(MethodView):
     ]
 
     def get(self, topic_id, slug=None, post_id=None):
-        topic = Topic.query.filter_by(id=topic_id).first_or_404()
+        topic = get_entity_or_404(Topic, topic_id)
         form = self.form()
 
         if post_id is not None:
-            post = Post.query.filter_by(id=post_id).first_or_404()
+            post = get_entity_or_404(Post, post_id)
             form.content.data = format_quote(post.username, post.content)
 
         return render_template(
@@ -485,12 +521,12 @@ class NewPost(MethodView):
         )
 
     def post(self, topic_id, slug=None, post_id=None):
-        topic = Topic.query.filter_by(id=topic_id).first_or_404()
+        topic = get_entity_or_404(Topic, topic_id)
         form = self.form()
 
         # check if topic exists
         if post_id is not None:
-            post = Post.query.filter_by(id=post_id).first_or_404()
+            post = get_entity_or_404(Post, post_id)
 
         if form.validate_on_submit():
             post = form.save(real(current_user), topic)
@@ -517,7 +553,7 @@ class EditPost(MethodView):
     ]
 
     def get(self, post_id):
-        post = Post.query.filter_by(id=post_id).first_or_404()
+        post = get_entity_or_404(Post, post_id)
         form = self.form(obj=post)
 
         return render_template(
@@ -525,7 +561,7 @@ class EditPost(MethodView):
         )
 
     def post(self, post_id):
-        post = Post.query.filter_by(id=post_id).first_or_404()
+        post = get_entity_or_404(Post, post_id)
         form = self.form(obj=post)
 
         if form.validate_on_submit():
@@ -554,7 +590,7 @@ class ReportView(MethodView):
     def post(self, post_id):
         form = self.form()
         if form.validate_on_submit():
-            post = Post.query.filter_by(id=post_id).first_or_404()
+            post = get_entity_or_404(Post, post_id)
             form.save(real(current_user), post)
             flash(_("Thanks for reporting."), "success")
 
@@ -628,13 +664,6 @@ class TopicTracker(MethodView):
     def get(self):
         page = request.args.get("page", 1, type=int)
         topics = real(current_user).tracked_topics.\
-            outerjoin(
-                TopicsRead,
-                db.and_(
-                    TopicsRead.topic_id == Topic.id,
-                    TopicsRead.user_id == real(current_user).id
-                )).\
-            outerjoin(Post, Topic.last_post_id == Post.id).\
             outerjoin(Forum, Topic.forum_id == Forum.id).\
             outerjoin(
                 ForumsRead,
@@ -642,12 +671,16 @@ class TopicTracker(MethodView):
                     ForumsRead.forum_id == Forum.id,
                     ForumsRead.user_id == real(current_user).id
                 )).\
-            add_entity(Post).\
-            add_entity(TopicsRead).\
             add_entity(ForumsRead).\
             order_by(Topic.last_updated.desc()).\
             paginate(page, flaskbb_config["TOPICS_PER_PAGE"], True)
 
+        reads = get_read_tracker().get_many(
+            real(current_user), [topic for topic, _ in topics.items]
+        )
+        topics.items = [(topic, reads.get(topic.id), forumsread)
+                        for topic, forumsread in topics.items]
+
         return render_template("forum/topictracker.html", topics=topics)
 
     def post(self):
@@ -670,18 +703,34 @@ class Search(MethodView):
     form = SearchPageForm
 
     def get(self):
+        # the further pages of the results are requested with the search
+        # criteria in the query string
+        if "search_query" in request.args:
+            form = self.form(request.args, meta={"csrf": False})
+            if form.validate():
+                return self.render_results(form)
+
         return render_template("forum/search_form.html", form=self.form())
 
     def post(self):
         form = self.form()
         if form.validate_on_submit():
-            result = form.get_results()
-            return render_template(
-                "forum/search_result.html", form=form, result=result
-            )
+            return self.render_results(form)
 
         return render_template("forum/search_form.html", form=form)
 
+    def render_results(self, form):
+        page = max(request.args.get("page", 1, type=int), 1)
+        result = form.get_results(real(current_user), page)
+        search_params = "&" + url_encode({
+            "search_query": form.search_query.data,
+            "search_types": form.search_types.data
+        })
+        return render_template(
+            "forum/search_result.html", form=form, result=result,
+            search_params=search_params
+        )
+
 
 class DeleteTopic(MethodView):
     decorators = [
@@ -698,11 +747,8 @@ class DeleteTopic(MethodView):
     ]
 
     def post(self, topic_id, slug=None):
-        topic = Topic.query.filter_by(id=topic_id).first_or_404()
-        involved_users = User.query.filter(
-            Post.topic_id == topic.id, User.id == Post.user_id
-        ).all()
-        topic.delete(users=involved_users)
+        topic = get_entity_or_404(Topic, topic_id)
+        topic.delete()
         return redirect(url_for("forum.view_forum", forum_id=topic.forum_id))
 
 
@@ -721,7 +767,7 @@ class LockTopic(MethodView):
     ]
 
     def post(self, topic_id, slug=None):
-        topic = Topic.query.filter_by(id=topic_id).first_or_404()
+        topic = get_entity_or_404(Topic, topic_id)
         topic.locked = True
         topic.save()
         return redirect(topic.url)
@@ -742,7 +788,7 @@ class UnlockTopic(MethodView):
     ]
 
     def post(self, topic_id, slug=None):
-        topic = Topic.query.filter_by(id=topic_id).first_or_404()
+        topic = get_entity_or_404(Topic, topic_id)
         topic.locked = False
         topic.save()
         return redirect(topic.url)
@@ -763,7 +809,7 @@ class HighlightTopic(MethodView):
     ]
 
     def post(self, topic_id, slug=None):
-        topic = Topic.query.filter_by(id=topic_id).first_or_404()
+        topic = get_entity_or_404(Topic, topic_id)
         topic.important = True
         topic.save()
         return redirect(topic.url)
@@ -784,7 +830,7 @@ class TrivializeTopic(MethodView):
     ]
 
     def post(self, topic_id=None, slug=None):
-        topic = Topic.query.filter_by(id=topic_id).first_or_404()
+        topic = get_entity_or_404(Topic, topic_id)
         topic.important = False
         topic.save()
         return redirect(topic.url)
@@ -804,7 +850,7 @@ class DeletePost(MethodView):
     ]
 
     def post(self, post_id):
-        post = Post.query.filter_by(id=post_id).first_or_404()
+        post = get_entity_or_404(Post, post_id)
         first_post = post.first_post
         topic_url = post.topic.url
         forum_url = post.topic.forum.url
@@ -831,7 +877,7 @@ class RawPost(MethodView):
     ]
 
     def get(self, post_id):
-        post = Post.query.filter_by(id=post_id).first_or_404()
+        post = get_entity_or_404(Post, post_id)
         return format_quote(username=post.username, content=post.content)
 
 
@@ -851,24 +897,8 @@ class MarkRead(MethodView):
     def post(self, forum_id=None, slug=None):
         # Mark a single forum as read
         if forum_id is not None:
-            forum_instance = Forum.query.filter_by(id=forum_id).first_or_404()
-            forumsread = ForumsRead.query.filter_by(
-                user_id=real(current_user).id, forum_id=forum_instance.id
-            ).first()
-            TopicsRead.query.filter_by(
-                user_id=real(current_user).id, forum_id=forum_instance.id
-            ).delete()
-
-            if not forumsread:
-                forumsread = ForumsRead()
-                forumsread.user = real(current_user)
-                forumsread.forum = forum_instance
-
-            forumsread.last_read = time_utcnow()
-            forumsread.cleared = time_utcnow()
-
-            db.session.add(forumsread)
-            db.session.commit()
+            forum_instance = get_entity_or_404(Forum, forum_id)
+            mark_forums_read(real(current_user), forum_id=forum_instance.id)
 
             flash(
                 _(
@@ -880,21 +910,7 @@ class MarkRead(MethodView):
             return redirect(forum_instance.url)
 
         # Mark all forums as read
-        ForumsRead.query.filter_by(user_id=real(current_user).id).delete()
-        TopicsRead.query.filter_by(user_id=real(current_user).id).delete()
-
-        forums = Forum.query.all()
-        forumsread_list = []
-        for forum_instance in forums:
-            forumsread = ForumsRead()
-            forumsread.user = real(current_user)
-            forumsread.forum = forum_instance
-            forumsread.last_read = time_utcnow()
-            forumsread.cleared = time_utcnow()
-            forumsread_list.append(forumsread)
-
-        db.session.add_all(forumsread_list)
-        db.session.commit()
+        mark_forums_read(real(current_user))
 
         flash(_("All forums marked as read."), "success")
 
@@ -927,7 +943,7 @@ class TrackTopic(MethodView):
     ]
 
     def post(self, topic_id, slug=None):
-        topic = Topic.query.filter_by(id=topic_id).first_or_404()
+        topic = get_entity_or_404(Topic, topic_id)
         real(current_user).track_topic(topic)
         real(current_user).save()
         return redirect(topic.url)
@@ -947,7 +963,7 @@ class UntrackTopic(MethodView):
     ]
 
     def post(self, topic_id, slug=None):
-        topic = Topic.query.filter_by(id=topic_id).first_or_404()
+        topic = get_entity_or_404(Topic, topic_id)
         real(current_user).untrack_topic(topic)
         real(current_user).save()
         return redirect(topic.url)
@@ -974,7 +990,7 @@ class UnhideTopic(MethodView):
     decorators = [login_required]
 
     def post(self, topic_id, slug=None):
-        topic = Topic.query.filter_by(id=topic_id).first_or_404()
+        topic = get_entity_or_404(Topic, topic_id)
         if not Permission(Has("makehidden"), IsAtleastModeratorInForum(
                 forum=topic.forum)):
             flash(
@@ -990,7 +1006,7 @@ class HidePost(MethodView):
     decorators = [login_required]
 
     def post(self, post_id):
-        post = Post.query.filter(Post.id == post_id).first_or_404()
+        post = get_entity_or_404(Post, post_id)
 
         if not Permission(Has("makehidden"), IsAtleastModeratorInForum(
                 forum=post.topic.forum)):
@@ -1020,7 +1036,7 @@ class UnhidePost(MethodView):
     decorators = [login_required]
 
     def post(self, post_id):
-        post = Post.query.filter(Post.id == post_id).first_or_404()
+        post = get_entity_or_404(Post, post_id)
 
         if not Permission(Has("makehidden"), IsAtleastModeratorInForum(
                 forum=post.topic.forum)):
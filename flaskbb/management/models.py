@@ -9,10 +9,13 @@
     :license: BSD, see LICENSE for more details.
 """
 import logging
+import uuid
+
+from sqlalchemy import event
 
 from flaskbb._compat import iteritems
 from flaskbb.extensions import cache, db
-from flaskbb.utils.database import CRUDMixin
+from flaskbb.utils.database import CRUDMixin, UTCDateTime, request_cache
 from flaskbb.utils.forms import SettingValueType, generate_settings_form
 
 logger = logging.getLogger(__name__)
@@ -106,7 +109,9 @@ class Setting(db.Model, CRUDMixin):
         return settings
 
     @classmethod
-    @cache.cached(key_prefix="settings")
+    @cache.cached(key_prefix=lambda: "settings/{}".format(
+        Setting.get_generation()
+    ))
     def as_dict(cls, from_group=None, upper=True):
         """Returns all settings as a dict. This method is cached. If you want
         to invalidate the cache, simply execute ``self.invalidate_cache()``.
@@ -135,7 +140,134 @@ class Setting(db.Model, CRUDMixin):
 
         return settings
 
+    @classmethod
+    def get_generation(cls):
+        """Returns the generation of the settings. It changes whenever the
+        settings are updated, hence it can be used to check if a copy of
+        the settings is still up to date.
+        """
+        generation = cache.get("settings/generation")
+        if generation is None:
+            generation = uuid.uuid4().hex
+            cache.set("settings/generation", generation, timeout=0)
+        return generation
+
     @classmethod
     def invalidate_cache(cls):
         """Invalidates this objects cached metadata."""
-        cache.delete_memoized(cls.as_dict, cls)
+        # a new generation makes all cached settings unreachable
+        cache.set("settings/generation", uuid.uuid4().hex, timeout=0)
+        request_cache("settings").clear()
+
+
+class BoardStatistic(db.Model):
+    """Stores the board wide statistics (e.g. the number of posts) so that
+    they don't have to be counted on every request. The counters are
+    updated by the save and delete methods of the users, topics and posts
+    and recounted by :meth:`reconcile`. The rows are created together
+    with the table, as they are only ever updated afterwards.
+    """
+    __tablename__ = "board_statistics"
+
+    key = db.Column(db.String(255), primary_key=True)
+    value = db.Column(db.BigInteger, default=0, nullable=False)
+
+    #: The statistics which are maintained by FlaskBB.
+    keys = ("users", "topics", "posts", "newest_user_id")
+
+    def __repr__(self):
+        return "<{} {}={}>".format(self.__class__.__name__, self.key,
+                                   self.value)
+
+    @classmethod
+    def increment(cls, key, amount=1):
+        """Increments the statistic by ``amount``. The change is
+        committed together with the current transaction.
+
+        :param key: The key of the statistic, e.g. ``posts``.
+        :param amount: The amount which is added. Can be negative.
+        """
+        if amount == 0:
+            return
+
+        # a single update statement so that concurrent increments
+        # can't overwrite each other
+        cls.query.filter(cls.key == key).update(
+            {cls.value: cls.value + amount}, synchronize_session=False
+        )
+
+    @classmethod
+    def set(cls, key, value):
+        """Sets the statistic to ``value``. The change is committed together
+        with the current transaction.
+
+        :param key: The key of the statistic.
+        :param value: The new value.
+        """
+        cls.query.filter(cls.key == key).update(
+            {cls.value: value}, synchronize_session=False
+        )
+
+    @classmethod
+    def as_dict(cls):
+        """Returns all statistics as a dict. Missing statistics are
+        ``0`` until they are recounted by :meth:`reconcile`.
+        """
+        stats = dict.fromkeys(cls.keys, 0)
+        stats.update(db.session.query(cls.key, cls.value))
+        return stats
+
+    @classmethod
+    def reconcile(cls):
+        """Recounts all statistics, stores them and returns them as
+        a dict.
+        """
+        # todo: Find circular import and break it
+        from flaskbb.forum.models import Post, Topic
+        from flaskbb.user.models import User
+
+        stats = {
+            "users": db.session.query(db.func.count(User.id)).scalar(),
+            "topics": db.session.query(db.func.count(Topic.id)).filter(
+                Topic.hidden != True
+            ).scalar(),
+            "posts": db.session.query(db.func.count(Post.id)).filter(
+                Post.topic_id == Topic.id,
+                Post.hidden != True,
+                Topic.hidden != True
+            ).scalar(),
+            "newest_user_id": db.session.query(db.func.max(User.id)).scalar()
+        }
+        stats = {key: value or 0 for key, value in iteritems(stats)}
+
+        for key, value in iteritems(stats):
+            db.session.merge(cls(key=key, value=value))
+        db.session.commit()
+        return stats
+
+
+@event.listens_for(BoardStatistic.__table__, "after_create")
+def _create_statistics(table, connection, **kwargs):
+    # the statistics of a new board are all 0
+    connection.execute(table.insert(), [
+        {"key": key, "value": 0} for key in BoardStatistic.keys
+    ])
+
+
+class SearchQueueEntry(db.Model):
+    """A change of a searchable object which hasn't been written to the
+    search index yet. The entries are added in the same transaction as the
+    change itself if ``SEARCH_INDEX_ASYNC`` is enabled and are applied
+    in batches by :func:`~flaskbb.utils.search.process_search_queue`.
+    """
+    __tablename__ = "search_queue"
+
+    id = db.Column(db.Integer, primary_key=True)
+    #: The name of the model class, e.g. ``Post``.
+    model = db.Column(db.String(50), nullable=False)
+    object_id = db.Column(db.Integer, nullable=False)
+    queued_at = db.Column(UTCDateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return "<{} {} {}>".format(self.__class__.__name__, self.model,
+                                   self.object_id)
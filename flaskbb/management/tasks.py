@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+    flaskbb.management.tasks
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    The celery tasks of the management module.
+
+    :copyright: (c) 2018 the FlaskBB Team
+    :license: BSD, see LICENSE for more details
+"""
+import logging
+
+from flaskbb.extensions import celery
+
+from .models import BoardStatistic
+
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task
+def reconcile_board_statistics():
+    """Recounts the board statistics to correct the drift of the
+    incrementally maintained counters.
+    """
+    stats = BoardStatistic.reconcile()
+    logger.debug("Reconciled the board statistics: {}".format(stats))
+    return stats
+
+
+@celery.task
+def process_search_queue():
+    """Writes the queued changes to the search index."""
+    from flaskbb.utils.search import process_search_queue, search_queue_lag
+    processed = process_search_queue()
+    lag = search_queue_lag()
+    logger.debug("Processed {} search queue entries, {pending} pending "
+                 "(lag: {lag}s)".format(processed, **lag))
+    return processed
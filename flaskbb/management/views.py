@@ -28,7 +28,7 @@ from flaskbb.forum.models import Category, Forum, Post, Report, Topic
 from flaskbb.management.forms import (AddForumForm, AddGroupForm, AddUserForm,
                                       CategoryForm, EditForumForm,
                                       EditGroupForm, EditUserForm)
-from flaskbb.management.models import Setting, SettingsGroup
+from flaskbb.management.models import BoardStatistic, Setting, SettingsGroup
 from flaskbb.plugins.models import PluginRegistry, PluginStore
 from flaskbb.plugins.utils import validate_plugin
 from flaskbb.user.models import Group, Guest, User
@@ -39,8 +39,11 @@ from flaskbb.utils.helpers import (get_online_users, register_view,
 from flaskbb.utils.requirements import (CanBanUser, CanEditUser, IsAdmin,
                                         IsAtleastModerator,
                                         IsAtleastSuperModerator)
+from flaskbb.utils.search_backends import search_cache_stats
 from flaskbb.utils.settings import flaskbb_config
 
+from . import tasks  # noqa: F401 (registers the celery tasks)
+
 impl = HookimplMarker('flaskbb')
 
 logger = logging.getLogger(__name__)
@@ -1140,17 +1143,22 @@ class ManagementOverview(MethodView):
             sys.version_info[0], sys.version_info[1], sys.version_info[2]
         )
 
+        board_stats = BoardStatistic.as_dict()
+        search_cache = search_cache_stats()
+
         stats = {
             "current_app": current_app,
             "unread_reports": unread_reports,
             # stats stats
-            "all_users": User.query.count(),
+            "all_users": board_stats["users"],
             "banned_users": banned_users,
             "online_users": online_users,
             "all_groups": Group.query.count(),
             "report_count": Report.query.count(),
-            "topic_count": Topic.query.count(),
-            "post_count": Post.query.count(),
+            "topic_count": board_stats["topics"],
+            "post_count": board_stats["posts"],
+            "search_cache_hits": search_cache["hits"],
+            "search_cache_misses": search_cache["misses"],
             # components
             "python_version": python_version,
             "celery_version": celery_version,
@@ -8,11 +8,14 @@
     :copyright: (c) 2016 by the FlaskBB Team.
     :license: BSD, see LICENSE for more details.
 """
+import hashlib
 import logging
 import re
+import threading
+from collections import OrderedDict
 
 import mistune
-from flask import url_for
+from flask import current_app, url_for
 from jinja2 import Markup
 from pluggy import HookimplMarker
 from pygments import highlight
@@ -20,6 +23,9 @@ from pygments.formatters import HtmlFormatter
 from pygments.lexers import get_lexer_by_name
 from pygments.util import ClassNotFound
 
+from flaskbb._compat import to_bytes
+from flaskbb.extensions import cache
+
 impl = HookimplMarker('flaskbb')
 
 logger = logging.getLogger(__name__)
@@ -75,10 +81,173 @@ def flaskbb_load_nonpost_markdown_class():
     return FlaskBBRenderer
 
 
+class RenderCache(object):
+    """Caches rendered markup. The first tier is a small in-process LRU,
+    the second (optional) tier is the shared ``flask_caching`` cache so that
+    all app processes can reuse each other's work.
+
+    Every entry is stored together with a stamp. A lookup only succeeds if
+    the stamp matches, which means that an edited post (new
+    ``date_modified``) is never served from a stale entry.
+
+    :param maxsize: The amount of entries kept in the process local LRU.
+                    ``0`` disables the local tier.
+    :param shared: If ``True``, entries are also stored in the shared cache.
+    :param timeout: The timeout for the entries in the shared cache.
+    :param key_prefix: The prefix for the keys in the shared cache.
+    """
+
+    def __init__(self, maxsize=1000, shared=False, timeout=None,
+                 key_prefix="markup"):
+        self.maxsize = maxsize
+        self.shared = shared
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shared_key(self, key):
+        return "{}/{}".format(self.key_prefix, key)
+
+    def get(self, key, stamp=None):
+        """Returns the cached value for ``key`` or ``None`` if there is
+        no entry or if it has been rendered for a different ``stamp``.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+
+        if entry is None and self.shared:
+            entry = cache.get(self._shared_key(key))
+            if entry is not None:
+                self._store_local(key, entry)
+
+        if entry is None or entry[0] != stamp:
+            return None
+        return entry[1]
+
+    def set(self, key, value, stamp=None):
+        """Stores ``value`` for ``key`` in all enabled tiers."""
+        entry = (stamp, value)
+        self._store_local(key, entry)
+        if self.shared:
+            cache.set(self._shared_key(key), entry, timeout=self.timeout)
+
+    def delete(self, key):
+        """Removes ``key`` from all enabled tiers."""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared:
+            cache.delete(self._shared_key(key))
+
+    def clear(self):
+        """Empties the process local tier."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _store_local(self, key, entry):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def _post_key(post_id):
+    return "post/{}".format(post_id)
+
+
+def _post_stamp(post):
+    modified = post.date_modified or post.date_created
+    return modified.isoformat() if modified is not None else None
+
+
+def _renderer_fingerprint(classes):
+    names = ",".join(
+        "{}.{}".format(cls.__module__, cls.__name__) for cls in classes
+    )
+    return hashlib.sha1(to_bytes(names)).hexdigest()[:12]
+
+
+def make_render_cache(app, classes):
+    """Creates a :class:`RenderCache` configured by the ``MARKUP_CACHE_*``
+    options. Returns ``None`` if the cache is disabled.
+
+    The shared keys contain a fingerprint of the used renderer classes,
+    so enabling or disabling markdown plugins does not serve HTML that
+    was rendered by a different set of plugins.
+    """
+    if not app.config.get("MARKUP_CACHE_ENABLED", True):
+        return None
+
+    return RenderCache(
+        maxsize=app.config.get("MARKUP_CACHE_SIZE", 1000),
+        shared=app.config.get("MARKUP_CACHE_SHARED", False),
+        timeout=app.config.get("MARKUP_CACHE_TIMEOUT"),
+        key_prefix="markup/{}".format(_renderer_fingerprint(classes))
+    )
+
+
+def make_post_renderer(renderer, render_cache, persisted=False):
+    """Returns a renderer which renders the content of a post and caches
+    the rendered HTML by the post id and the date of the last
+    modification.
+
+    :param renderer: The renderer created by :func:`make_renderer`.
+    :param render_cache: A :class:`RenderCache` or ``None``.
+    :param persisted: If ``True``, the pre-rendered ``content_html`` of
+                      the post is used when it is available.
+    """
+    def render_post(post):
+        if persisted and post.content_html is not None:
+            return Markup(post.content_html)
+
+        if render_cache is None or post.id is None:
+            return renderer(post.content)
+
+        key, stamp = _post_key(post.id), _post_stamp(post)
+        html = render_cache.get(key, stamp)
+        if html is None:
+            html = renderer(post.content)
+            render_cache.set(key, html, stamp)
+        return Markup(html)
+
+    return render_post
+
+
+def render_post_content(content, app=None):
+    """Renders ``content`` with the post markdown renderer of the app.
+    The result is not cached.
+
+    :param content: The markdown text of a post.
+    :param app: The app whose renderer is used. Defaults to the current app.
+    """
+    app = app or current_app
+    return app.extensions["post_renderer"](content)
+
+
 @impl
 def flaskbb_jinja_directives(app):
     render_classes = app.pluggy.hook.flaskbb_load_post_markdown_class(app=app)
-    app.jinja_env.filters['markup'] = make_renderer(render_classes)
+    render_cache = make_render_cache(app, render_classes)
+    app.extensions["markup_cache"] = render_cache
+
+    post_renderer = make_renderer(render_classes)
+    app.extensions["post_renderer"] = post_renderer
+
+    app.jinja_env.filters['markup'] = make_renderer(render_classes,
+                                                    render_cache)
+    app.jinja_env.filters['post_markup'] = make_post_renderer(
+        post_renderer, render_cache,
+        persisted=app.config.get("PERSIST_POST_HTML", False)
+    )
 
     render_classes = app.pluggy.hook.flaskbb_load_nonpost_markdown_class(
         app=app
@@ -86,8 +255,43 @@ def flaskbb_jinja_directives(app):
     app.jinja_env.filters['nonpost_markup'] = make_renderer(render_classes)
 
 
-def make_renderer(classes):
+@impl
+def flaskbb_event_post_save_before(post):
+    # always reset the stored HTML so that a post edited while the option
+    # was disabled can't serve outdated HTML once it gets enabled again
+    if current_app.config.get("PERSIST_POST_HTML", False):
+        post.content_html = render_post_content(post.content)
+    else:
+        post.content_html = None
+
+
+@impl
+def flaskbb_event_post_save_after(post, is_new):
+    render_cache = current_app.extensions.get("markup_cache")
+    if render_cache is not None and not is_new:
+        render_cache.delete(_post_key(post.id))
+
+
+def make_renderer(classes, render_cache=None):
+    """Creates a markdown renderer from the given renderer classes.
+
+    :param classes: The renderer classes which are combined.
+    :param render_cache: If a :class:`RenderCache` is passed, the rendered
+                         HTML is cached by a digest of the text.
+    """
     RenderCls = type('FlaskBBRenderer', tuple(classes), {})
 
     markup = mistune.Markdown(renderer=RenderCls(escape=True, hard_wrap=True))
-    return lambda text: Markup(markup.render(text))
+
+    if render_cache is None:
+        return lambda text: Markup(markup.render(text))
+
+    def render(text):
+        key = "text/{}".format(hashlib.sha1(to_bytes(text)).hexdigest())
+        html = render_cache.get(key)
+        if html is None:
+            html = markup.render(text)
+            render_cache.set(key, html)
+        return Markup(html)
+
+    return render
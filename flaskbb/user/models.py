@@ -17,8 +17,11 @@ from flaskbb.extensions import db, cache
 from flaskbb.exceptions import AuthenticationError
 from flaskbb.utils.helpers import time_utcnow
 from flaskbb.utils.settings import flaskbb_config
-from flaskbb.utils.database import CRUDMixin, UTCDateTime, make_comparable
-from flaskbb.forum.models import Post, Topic, Forum, topictracker
+from flaskbb.utils.database import (CRUDMixin, UTCDateTime, make_comparable,
+                                    request_cache)
+from flaskbb.forum.models import (Post, Topic, Forum, topictracker,
+                                  invalidate_forum_tree)
+from flaskbb.management.models import BoardStatistic
 from flaskbb.deprecation import deprecated
 
 logger = logging.getLogger(__name__)
@@ -70,6 +73,18 @@ class Group(db.Model, CRUDMixin):
         """
         return "<{} {} {}>".format(self.__class__.__name__, self.id, self.name)
 
+    def save(self):
+        """Saves the group and invalidates the cached forum trees."""
+        super(Group, self).save()
+        invalidate_forum_tree()
+        return self
+
+    def delete(self):
+        """Deletes the group and invalidates the cached forum trees."""
+        super(Group, self).delete()
+        invalidate_forum_tree()
+        return self
+
     @classmethod
     def selectable_groups_choices(cls):
         return Group.query.order_by(Group.name.asc()).with_entities(
@@ -187,8 +202,9 @@ class User(db.Model, UserMixin, CRUDMixin):
 
     @property
     def permissions(self):
-        """Returns the permissions for the user."""
-        return self.get_permissions()
+        """Returns the permissions for the user. They are only looked up
+        once per request."""
+        return _request_permissions(self)
 
     @property
     def groups(self):
@@ -387,24 +403,13 @@ class User(db.Model, UserMixin, CRUDMixin):
     @cache.memoize()
     def get_permissions(self, exclude=None):
         """Returns a dictionary with all permissions the user has"""
-        if exclude:
-            exclude = set(exclude)
-        else:
-            exclude = set()
-        exclude.update(['id', 'name', 'description'])
-
-        perms = {}
-        # Get the Guest group
-        for group in self.groups:
-            columns = set(group.__table__.columns.keys()) - set(exclude)
-            for c in columns:
-                perms[c] = getattr(group, c) or perms.get(c, False)
-        return perms
+        return group_permissions(self.groups, exclude)
 
     def invalidate_cache(self):
         """Invalidates this objects cached metadata."""
         cache.delete_memoized(self.get_permissions, self)
         cache.delete_memoized(self.get_groups, self)
+        request_cache("permissions").pop(self.get_id(), None)
 
     def ban(self):
         """Bans the user. Returns True upon success."""
@@ -458,13 +463,30 @@ class User(db.Model, UserMixin, CRUDMixin):
 
             self.invalidate_cache()
 
+        is_new = self.id is None
         db.session.add(self)
+        if is_new:
+            db.session.flush()
+            BoardStatistic.increment("users")
+            BoardStatistic.set("newest_user_id", self.id)
         db.session.commit()
         return self
 
     def delete(self):
         """Deletes the User."""
         db.session.delete(self)
+        BoardStatistic.increment("users", -1)
+        db.session.flush()
+
+        # the newest user is recounted if it has been deleted
+        BoardStatistic.query.filter(
+            BoardStatistic.key == "newest_user_id",
+            BoardStatistic.value == self.id
+        ).update({
+            BoardStatistic.value: db.session.query(
+                db.func.coalesce(db.func.max(User.id), 0)
+            ).as_scalar()
+        }, synchronize_session=False)
         db.session.commit()
 
         return self
@@ -473,7 +495,7 @@ class User(db.Model, UserMixin, CRUDMixin):
 class Guest(AnonymousUserMixin):
     @property
     def permissions(self):
-        return self.get_permissions()
+        return _request_permissions(self)
 
     @property
     def groups(self):
@@ -486,21 +508,41 @@ class Guest(AnonymousUserMixin):
     @cache.memoize()
     def get_permissions(self, exclude=None):
         """Returns a dictionary with all permissions the user has"""
-        if exclude:
-            exclude = set(exclude)
-        else:
-            exclude = set()
-        exclude.update(['id', 'name', 'description'])
-
-        perms = {}
-        # Get the Guest group
-        for group in self.groups:
-            columns = set(group.__table__.columns.keys()) - set(exclude)
-            for c in columns:
-                perms[c] = getattr(group, c) or perms.get(c, False)
-        return perms
+        return group_permissions(self.groups, exclude)
 
     @classmethod
     def invalidate_cache(cls):
         """Invalidates this objects cached metadata."""
         cache.delete_memoized(cls.get_permissions, cls)
+        request_cache("permissions").pop(None, None)
+
+
+def group_permissions(groups, exclude=None):
+    """Returns a dictionary with the permissions of ``groups``. A
+    permission is granted if any of the groups grants it.
+
+    :param groups: The groups whose permissions should be merged.
+    :param exclude: The names of the columns which aren't permissions.
+    """
+    if exclude:
+        exclude = set(exclude)
+    else:
+        exclude = set()
+    exclude.update(['id', 'name', 'description'])
+
+    perms = {}
+    for group in groups:
+        columns = set(group.__table__.columns.keys()) - set(exclude)
+        for c in columns:
+            perms[c] = getattr(group, c) or perms.get(c, False)
+    return perms
+
+
+def _request_permissions(user):
+    # the permissions are memoized in the cache, but looking them up there
+    # for every requirement of every post on a page still adds up
+    permissions = request_cache("permissions")
+    key = user.get_id()
+    if key not in permissions:
+        permissions[key] = user.get_permissions()
+    return permissions[key]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+    flaskbb.user.tasks
+    ~~~~~~~~~~~~~~~~~~
+
+    The celery tasks of the user module.
+
+    :copyright: (c) 2018 the FlaskBB Team
+    :license: BSD, see LICENSE for more details
+"""
+import logging
+
+from flaskbb.extensions import celery
+
+from . import utils
+
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task
+def flush_lastseen():
+    """Writes the ``lastseen`` timestamps which are buffered in redis to
+    the database.
+    """
+    count = utils.flush_lastseen()
+    logger.debug("Flushed the lastseen timestamps of {} users.".format(count))
+    return count
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+    flaskbb.user.utils
+    ~~~~~~~~~~~~~~~~~~
+
+    Utilities specific to the FlaskBB user module
+
+    :copyright: (c) 2018 the FlaskBB Team
+    :license: BSD, see LICENSE for more details
+"""
+from datetime import timedelta
+
+from flask import current_app
+
+from flaskbb.extensions import db
+from flaskbb.utils.buffers import get_buffer
+from flaskbb.utils.database import bulk_update, request_cache
+from flaskbb.utils.helpers import (from_microseconds, time_diff, time_utcnow,
+                                   to_microseconds)
+
+from .models import Group, User, group_permissions, groups_users
+
+
+def touch_lastseen(user):
+    """
+    Updates the ``lastseen`` timestamp of the user, but only if the stored
+    one is older than ``LASTSEEN_GRANULARITY`` seconds. The timestamps are
+    buffered and written to the database in batches.
+    """
+    granularity = current_app.config["LASTSEEN_GRANULARITY"]
+    now = time_utcnow()
+    if (
+        user.lastseen is not None and
+        now - user.lastseen < timedelta(seconds=granularity)
+    ):
+        return
+
+    lastseen = get_buffer("lastseen")
+    lastseen.set(user.id, to_microseconds(now))
+
+    if lastseen.due(granularity):
+        flush_lastseen()
+
+
+def flush_lastseen():
+    """
+    Writes the buffered ``lastseen`` timestamps to the database with a
+    single update and returns the number of updated users.
+    """
+    timestamps = get_buffer("lastseen").drain()
+    if not timestamps:
+        return 0
+
+    bulk_update(User.lastseen, User.id, {
+        user_id: from_microseconds(timestamp)
+        for user_id, timestamp in timestamps.items()
+    })
+    db.session.commit()
+    return len(timestamps)
+
+
+class AuthorBundle(object):
+    """
+    The authors of a page of posts together with their groups, permissions
+    and online status. The primary and the secondary groups of all authors
+    are loaded with one query each, so rendering the page doesn't lazy
+    load them author by author.
+
+    The permissions of the authors are also stored for the current
+    request, hence ``user.permissions`` (and therefore the requirements)
+    won't look them up again.
+
+    :param users: The authors. ``None`` entries (i.e. posts by deleted
+                  users) are ignored.
+    """
+
+    def __init__(self, users):
+        self.users = {user.id: user for user in users if user is not None}
+        self.groups = self._load_groups()
+        self.permissions = {
+            user_id: group_permissions(groups)
+            for user_id, groups in self.groups.items()
+        }
+
+        online_since = time_diff()
+        self.online = {
+            user.id for user in self.users.values()
+            if user.lastseen is not None and user.lastseen >= online_since
+        }
+
+        cached = request_cache("permissions")
+        for user in self.users.values():
+            cached.setdefault(user.get_id(), self.permissions[user.id])
+
+    def _load_groups(self):
+        if not self.users:
+            return {}
+
+        # the primary groups end up in the identity map of the session,
+        # so ``user.primary_group`` doesn't have to query them again
+        primary_groups = {
+            group.id: group for group in Group.query.filter(
+                Group.id.in_({user.primary_group_id
+                              for user in self.users.values()})
+            )
+        }
+        groups = {
+            user.id: [primary_groups[user.primary_group_id]]
+            for user in self.users.values()
+        }
+
+        secondary_groups = db.session.query(
+            groups_users.c.user_id, Group
+        ).join(
+            Group, Group.id == groups_users.c.group_id
+        ).filter(
+            groups_users.c.user_id.in_(list(self.users))
+        )
+        for user_id, group in secondary_groups:
+            groups[user_id].append(group)
+        return groups
+
+    def is_online(self, user):
+        """Returns ``True`` if ``user`` has been online recently
+        (see :func:`~flaskbb.utils.helpers.is_online`).
+        """
+        return user.id in self.online
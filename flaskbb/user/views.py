@@ -22,6 +22,7 @@ from flaskbb.user.models import User
 from flaskbb.utils.helpers import register_view, render_template
 
 from ..core.exceptions import PersistenceError, StopValidation
+from . import tasks  # noqa: F401 (registers the celery tasks)
 from .services.factories import (
     change_details_form_factory,
     change_email_form_factory,
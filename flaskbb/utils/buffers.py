@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+    flaskbb.utils.buffers
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Write buffers which collect frequent small updates (e.g. counters)
+    so that they can be written to the database in batches.
+
+    :copyright: (c) 2018 by the FlaskBB Team.
+    :license: BSD, see LICENSE for more details.
+"""
+import logging
+import threading
+import time
+import uuid
+
+from flask import current_app
+from redis.exceptions import ResponseError
+
+from flaskbb.extensions import redis_store
+
+
+logger = logging.getLogger(__name__)
+
+
+class _FlushTimer(object):
+    """Keeps track of when a buffer has been flushed the last time by
+    this process.
+    """
+
+    def __init__(self):
+        self._last_flush = time.time()
+        self._timer_lock = threading.Lock()
+
+    def due(self, interval):
+        """Returns ``True`` if the last flush is older than ``interval``
+        seconds. In that case the timer is reset, so only one caller will
+        be told to flush the buffer.
+
+        :param interval: The flush interval in seconds.
+        """
+        now = time.time()
+        with self._timer_lock:
+            if now - self._last_flush < interval:
+                return False
+            self._last_flush = now
+            return True
+
+
+class LocalBuffer(_FlushTimer):
+    """A buffer which lives in the memory of the current process.
+    It is used when redis is not available; as every process has its own
+    buffer, it can only be flushed by the process itself.
+    """
+
+    def __init__(self, name):
+        super(LocalBuffer, self).__init__()
+        self.name = name
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def incr(self, key, amount=1):
+        """Increments the value of ``key`` by ``amount``."""
+        with self._lock:
+            self._data[key] = self._data.get(key, 0) + amount
+
+    def set(self, key, value):
+        """Sets ``key`` to ``value``, replacing the buffered value."""
+        with self._lock:
+            self._data[key] = value
+
+    def drain(self):
+        """Returns all buffered values and empties the buffer."""
+        with self._lock:
+            data, self._data = self._data, {}
+        return data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisBuffer(_FlushTimer):
+    """A buffer which is stored in a redis hash and is therefore shared
+    by all processes. Keys and values are converted with ``key_type``
+    and ``value_type`` when the buffer is drained.
+    """
+
+    def __init__(self, name, key_type=int, value_type=int):
+        super(RedisBuffer, self).__init__()
+        self.name = name
+        self.key = "buffer/{}".format(name)
+        self.key_type = key_type
+        self.value_type = value_type
+
+    def incr(self, key, amount=1):
+        """Increments the value of ``key`` by ``amount``."""
+        redis_store.hincrby(self.key, key, amount)
+
+    def set(self, key, value):
+        """Sets ``key`` to ``value``, replacing the buffered value."""
+        redis_store.hset(self.key, key, value)
+
+    def drain(self):
+        """Returns all buffered values and empties the buffer."""
+        # move the hash out of the way first so that the increments which
+        # arrive while draining end up in a new hash and won't get lost
+        draining = "{}/draining/{}".format(self.key, uuid.uuid4().hex)
+        try:
+            redis_store.rename(self.key, draining)
+        except ResponseError:
+            # the hash doesn't exist, i.e. there is nothing to drain
+            return {}
+
+        pipe = redis_store.pipeline()
+        pipe.hgetall(draining)
+        pipe.delete(draining)
+        data, _ = pipe.execute()
+        return {
+            self.key_type(key.decode("utf-8")):
+                self.value_type(value.decode("utf-8"))
+            for key, value in data.items()
+        }
+
+    def __len__(self):
+        return redis_store.hlen(self.key)
+
+
+def get_buffer(name, app=None):
+    """Returns the buffer called ``name``. A :class:`RedisBuffer` is used
+    if redis is enabled, otherwise a :class:`LocalBuffer`.
+
+    :param name: The name of the buffer.
+    :param app: The app to which the buffer belongs. Defaults to the
+                current app.
+    """
+    app = app or current_app
+    buffers = app.extensions.setdefault("buffers", {})
+    if name not in buffers:
+        if app.config["REDIS_ENABLED"]:
+            buffers[name] = RedisBuffer(name)
+        else:
+            buffers[name] = LocalBuffer(name)
+    return buffers[name]
@@ -10,8 +10,9 @@
 """
 import logging
 import pytz
+from flask import _request_ctx_stack, abort, has_request_context
 from flask_login import current_user
-from flask_sqlalchemy import BaseQuery
+from flask_sqlalchemy import BaseQuery, Pagination
 from sqlalchemy.ext.declarative import declared_attr
 from flaskbb.extensions import db
 from ..core.exceptions import PersistenceError
@@ -82,15 +83,21 @@ class UTCDateTime(db.TypeDecorator):
         return value
 
 
+def has_view_hidden():
+    """Returns ``True`` if the current user is allowed to see hidden
+    posts and topics.
+    """
+    return bool(current_user and current_user.permissions.get(
+        "viewhidden", False
+    ))
+
+
 class HideableQuery(BaseQuery):
 
     def __new__(cls, *args, **kwargs):
         inst = super(HideableQuery, cls).__new__(cls)
         include_hidden = kwargs.pop("_with_hidden", False)
-        has_view_hidden = current_user and current_user.permissions.get(
-            "viewhidden", False
-        )
-        with_hidden = include_hidden or has_view_hidden
+        with_hidden = include_hidden or has_view_hidden()
         if args or kwargs:
             super(HideableQuery, inst).__init__(*args, **kwargs)
             entity = inst._mapper_zero().class_
@@ -161,8 +168,265 @@ class HideableCRUDMixin(HideableMixin, CRUDMixin):
     pass
 
 
+def request_cache(name):
+    """Returns the dictionary called ``name`` which is stored on the
+    current request context, i.e. it is discarded at the end of the
+    request. Outside of a request context an empty dictionary is returned
+    every time.
+
+    :param name: The name of the dictionary.
+    """
+    if not has_request_context():
+        return {}
+
+    ctx = _request_ctx_stack.top
+    caches = getattr(ctx, "flaskbb_caches", None)
+    if caches is None:
+        caches = ctx.flaskbb_caches = {}
+    return caches.setdefault(name, {})
+
+
+def get_entity(model, entity_id):
+    """Returns the instance of ``model`` with the primary key ``entity_id``
+    or ``None``. Hidden instances are only returned if the current user is
+    allowed to see them.
+
+    Within a request every entity is only looked up once, so that the
+    requirements, views and templates can share it.
+
+    :param model: The model class, e.g. ``Topic``.
+    :param entity_id: The primary key of the entity.
+    """
+    entities = request_cache("entities")
+    key = (model, entity_id)
+    if key not in entities:
+        entities[key] = _load_entity(model, entity_id)
+    return entities[key]
+
+
+def get_entity_or_404(model, entity_id):
+    """Like :func:`get_entity` but aborts with a 404 error if the entity
+    doesn't exist.
+    """
+    entity = get_entity(model, entity_id)
+    if entity is None:
+        abort(404)
+    return entity
+
+
+def _load_entity(model, entity_id):
+    if issubclass(model, HideableMixin):
+        return model.query.get(entity_id, include_hidden=has_view_hidden())
+    return model.query.get(entity_id)
+
+
 def try_commit(session, message="Error while saving"):
     try:
         session.commit()
     except Exception:
         raise PersistenceError(message)
+
+
+def bulk_increment(column, key_column, increments):
+    """Increments ``column`` of many rows with a single
+    ``UPDATE ... SET column = column + CASE key_column WHEN ... END``
+    statement. The session is not committed.
+
+    Returns the number of updated rows.
+
+    :param column: The column which should be incremented,
+                   e.g. ``Topic.views``.
+    :param key_column: The column which identifies the rows,
+                       e.g. ``Topic.id``.
+    :param increments: A dict which maps the keys to the amounts.
+    """
+    if not increments:
+        return 0
+
+    return db.session.query(key_column.class_).\
+        filter(key_column.in_(list(increments))).\
+        update({column: column + db.case(increments, value=key_column,
+                                         else_=0)},
+               synchronize_session=False)
+
+
+def bulk_update(column, key_column, values):
+    """Sets ``column`` of many rows to different values with a single
+    ``UPDATE ... SET column = CASE key_column WHEN ... END`` statement.
+    The session is not committed.
+
+    Returns the number of updated rows.
+
+    :param column: The column which should be updated,
+                   e.g. ``User.lastseen``.
+    :param key_column: The column which identifies the rows,
+                       e.g. ``User.id``.
+    :param values: A dict which maps the keys to the new values.
+    """
+    if not values:
+        return 0
+
+    # bind the values with the type of the column so that e.g. the
+    # UTCDateTime conversion is applied
+    whens = {key: db.literal(value, column.type)
+             for key, value in values.items()}
+    return db.session.query(key_column.class_).\
+        filter(key_column.in_(list(values))).\
+        update({column: db.case(whens, value=key_column, else_=column)},
+               synchronize_session=False)
+
+
+def upsert_from_select(table, columns, select, keys):
+    """Inserts the rows of ``select`` into ``table`` and overwrites the
+    rows which already exist with a single
+    ``INSERT ... SELECT ... ON CONFLICT`` statement (``ON DUPLICATE KEY
+    UPDATE`` on MySQL and ``INSERT OR REPLACE`` on SQLite). On other
+    databases the existing rows are deleted first. The session is not
+    committed.
+
+    :param table: The table, e.g. ``ForumsRead.__table__``.
+    :param columns: The names of the columns which are filled by
+                    ``select``, in the same order.
+    :param select: A select statement which returns the new rows. Its
+                   columns have to be labeled with the names of
+                   ``columns``.
+    :param keys: The names of the primary key columns.
+    """
+    dialect = db.session.get_bind().dialect.name
+    for statement in _upsert_statements(dialect, table, columns, select,
+                                        keys):
+        db.session.execute(statement)
+
+
+def _upsert_statements(dialect, table, columns, select, keys):
+    updates = [column for column in columns if column not in keys]
+
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).from_select(columns, select)
+        return [statement.on_conflict_do_update(
+            index_elements=keys,
+            set_={column: statement.excluded[column] for column in updates}
+        )]
+
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table).from_select(columns, select)
+        return [statement.on_duplicate_key_update(
+            **{column: statement.inserted[column] for column in updates}
+        )]
+
+    if dialect == "sqlite":
+        # the whole row is replaced, which is fine as long as ``select``
+        # provides all of its columns
+        return [table.insert().prefix_with("OR REPLACE").
+                from_select(columns, select)]
+
+    new_rows = select.alias()
+    return [
+        table.delete().where(db.tuple_(*[table.c[key] for key in keys]).in_(
+            db.select([new_rows.c[key] for key in keys])
+        )),
+        table.insert().from_select(columns, select)
+    ]
+
+
+class KeysetPagination(Pagination):
+    """A :class:`~flask_sqlalchemy.Pagination` whose items have been
+    fetched by seeking past the sort key of an adjacent page instead of
+    skipping the previous rows with an ``OFFSET``.
+
+    Links to the adjacent pages carry the id of the first respectively the
+    last item of the page as cursor (see :meth:`cursor_for`).
+
+    :param get_id: A callable which returns the id of an item.
+    """
+
+    def __init__(self, query, page, per_page, total, items, get_id):
+        super(KeysetPagination, self).__init__(
+            query, page, per_page, total, items
+        )
+        self.get_id = get_id
+
+    def cursor_for(self, page):
+        """Returns the query string which has to be appended to the url
+        of ``page``. Only adjacent pages have a cursor, an empty string is
+        returned for all other pages.
+
+        :param page: The page number for which the link is generated.
+        """
+        if not self.items:
+            return ""
+
+        if page == self.page + 1:
+            return "&after={}".format(self.get_id(self.items[-1]))
+        elif page == self.page - 1:
+            return "&before={}".format(self.get_id(self.items[0]))
+        return ""
+
+
+def _keyset_order(order_by, reverse=False):
+    return [
+        column.asc() if descending == reverse else column.desc()
+        for column, descending in order_by
+    ]
+
+
+def _keyset_seek(order_by, key, reverse=False):
+    # builds (a < x) OR (a = x AND ((b < y) OR (b = y AND c < z))) instead
+    # of a row value comparison because the sort directions may be mixed
+    # and not every database supports row values
+    clause = None
+    for (column, descending), value in reversed(list(zip(order_by, key))):
+        # wrap the value so that booleans can be compared with '<' and '>'
+        value = db.literal(value, column.type)
+        if descending != reverse:
+            seek = column < value
+        else:
+            seek = column > value
+
+        if clause is None:
+            clause = seek
+        else:
+            clause = db.or_(seek, db.and_(column == value, clause))
+    return clause
+
+
+def keyset_paginate(query, order_by, page, per_page, get_id, total=None,
+                    after=None, before=None):
+    """Paginates ``query`` by seeking past the sort key of the last
+    item of the previous page (``after``) or the first item of the next
+    page (``before``). Pages which are not reached via a cursor are
+    loaded with a regular ``OFFSET``.
+
+    :param query: The query which should be paginated. It must not be
+                  ordered yet.
+    :param order_by: A list of ``(column, descending)`` tuples. The last
+                     column has to be unique, e.g. the primary key.
+    :param page: The page number.
+    :param per_page: How many items per page should be shown.
+    :param get_id: A callable which returns the id of an item. It is used
+                   to generate the cursors for the adjacent pages.
+    :param total: The total number of items. If ``None``, it will be
+                  counted.
+    :param after: The sort key of the last item of the previous page.
+    :param before: The sort key of the first item of the next page.
+    """
+    page = max(page, 1)
+    if total is None:
+        total = query.order_by(None).count()
+
+    if after is not None:
+        items = query.filter(_keyset_seek(order_by, after)).\
+            order_by(*_keyset_order(order_by)).\
+            limit(per_page).all()
+    elif before is not None:
+        items = query.filter(_keyset_seek(order_by, before, reverse=True)).\
+            order_by(*_keyset_order(order_by, reverse=True)).\
+            limit(per_page).all()
+        items.reverse()
+    else:
+        items = query.order_by(*_keyset_order(order_by)).\
+            limit(per_page).offset((page - 1) * per_page).all()
+
+    return KeysetPagination(query, page, per_page, total, items, get_id)
@@ -93,81 +93,67 @@ def render_template(template, **context):  # pragma: no cover
 
 
 # TODO(anr): clean this up
-def do_topic_action(topics, user, action, reverse):  # noqa: C901
-    """Executes a specific action for topics. Returns a list with the modified
-    topic objects.
+def do_topic_action(topics, user, action, reverse, forum):
+    """Executes a specific action for topics. Returns the number of modified
+    topics.
 
     :param topics: A iterable with ``Topic`` objects.
     :param user: The user object which wants to perform the action.
-    :param action: One of the following actions: locked, important and delete.
+    :param action: One of the following actions: locked, important, delete,
+                   hide and unhide.
     :param reverse: If the action should be done in a reversed way.
                     For example, to unlock a topic, ``reverse`` should be
                     set to ``True``.
+    :param forum: The forum which is moderated. Topics which belong to
+                  another forum are ignored.
     """
     if not topics:
         return False
 
+    from flaskbb.extensions import db
+    from flaskbb.forum.moderation import TopicModerator
     from flaskbb.utils.requirements import (IsAtleastModeratorInForum,
                                             CanDeleteTopic, Has)
 
-    if not Permission(IsAtleastModeratorInForum(forum=topics[0].forum)):
+    if not Permission(IsAtleastModeratorInForum(forum=forum)):
         flash(
             _("You do not have the permissions to execute this action."),
             "danger"
         )
         return False
 
-    modified_topics = 0
-    if action not in {'delete', 'hide', 'unhide'}:
-        for topic in topics:
-            if getattr(topic, action) and not reverse:
-                continue
-
-            setattr(topic, action, not reverse)
-            modified_topics += 1
-            topic.save()
-
-    elif action == "delete":
-        if not Permission(CanDeleteTopic):
-            flash(
-                _("You do not have the permissions to delete these topics."),
-                "danger"
-            )
-            return False
-
-        for topic in topics:
-            modified_topics += 1
-            topic.delete()
-
-    elif action == 'hide':
-        if not Permission(Has('makehidden')):
-            flash(
-                _("You do not have the permissions to hide these topics."),
-                "danger"
-            )
-            return False
-
-        for topic in topics:
-            if topic.hidden:
-                continue
-            modified_topics += 1
-            topic.hide(user)
-
-    elif action == 'unhide':
-        if not Permission(Has('makehidden')):
-            flash(
-                _("You do not have the permissions to unhide these topics."),
-                "danger"
-            )
-            return False
-
-        for topic in topics:
-            if not topic.hidden:
-                continue
-            modified_topics += 1
-            topic.unhide()
-
-    return modified_topics
+    if action == "delete" and not Permission(CanDeleteTopic):
+        flash(
+            _("You do not have the permissions to delete these topics."),
+            "danger"
+        )
+        return False
+
+    if action == "hide" and not Permission(Has("makehidden")):
+        flash(
+            _("You do not have the permissions to hide these topics."),
+            "danger"
+        )
+        return False
+
+    if action == "unhide" and not Permission(Has("makehidden")):
+        flash(
+            _("You do not have the permissions to unhide these topics."),
+            "danger"
+        )
+        return False
+
+    # the actions are executed for all topics at once
+    topic_ids = [topic.id for topic in topics]
+    moderator = TopicModerator(db)
+
+    if action == "delete":
+        return moderator.delete(forum, topic_ids)
+    elif action == "hide":
+        return moderator.hide(forum, topic_ids, user)
+    elif action == "unhide":
+        return moderator.unhide(forum, topic_ids)
+    return moderator.set_flag(forum, topic_ids, action, not reverse)
 
 
 def get_categories_and_forums(query_result, user):
@@ -406,6 +392,23 @@ def time_utcnow():
     return datetime.now(UTC)
 
 
+#: The timezone aware start of the unix epoch.
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+
+def to_microseconds(value):
+    """Returns a timezone aware datetime as microseconds since the epoch."""
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10**6 + delta.microseconds
+
+
+def from_microseconds(value):
+    """Returns the timezone aware datetime of the microseconds since the
+    epoch.
+    """
+    return EPOCH + timedelta(microseconds=value)
+
+
 def time_diff():
     """Calculates the time difference between now and the ONLINE_LAST_MINUTES
     variable from the configuration.
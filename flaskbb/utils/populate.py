@@ -22,6 +22,9 @@ from flaskbb.extensions import alembic, db
 from flaskbb.forum.models import Category, Forum, Post, Topic
 from flaskbb.management.models import Setting, SettingsGroup
 from flaskbb.user.models import Group, User
+from flaskbb.utils.search_backends import (SQLSearchBackend,
+                                           get_search_backend,
+                                           search_documents)
 
 
 logger = logging.getLogger(__name__)
@@ -47,6 +50,7 @@ def delete_settings_from_fixture(fixture):
 
         group.delete()
 
+    Setting.invalidate_cache()
     return deleted_settings
 
 
@@ -81,6 +85,7 @@ def create_settings_from_fixture(fixture):
                 setting.save()
                 created_settings[group].append(setting)
 
+    Setting.invalidate_cache()
     return created_settings
 
 
@@ -156,6 +161,8 @@ def update_settings_from_fixture(fixture, overwrite_group=False,
 
                 setting.save()
                 updated_settings[group].append(setting)
+
+    Setting.invalidate_cache()
     return updated_settings
 
 
@@ -398,6 +405,15 @@ def create_latest_db(target="default@head"):
         create_database(db.engine.url)
 
     db.create_all()
+
+    # the documents of the database search backends aren't part of the
+    # metadata of the models
+    search_backend = get_search_backend()
+    if isinstance(search_backend, SQLSearchBackend):
+        with db.engine.begin() as connection:
+            search_backend.create_table(connection)
+            connection.execute(search_documents.delete())
+
     alembic.stamp(target=target)
 
 
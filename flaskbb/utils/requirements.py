@@ -14,6 +14,7 @@ from flask_allows import And, Or, Permission, Requirement
 from flaskbb.exceptions import FlaskBBError
 from flaskbb.forum.locals import current_forum, current_post, current_topic
 from flaskbb.forum.models import Forum, Post, Topic
+from flaskbb.utils.database import get_entity
 
 logger = logging.getLogger(__name__)
 
@@ -63,7 +64,7 @@ class IsModeratorInForum(IsAuthed):
         return self._get_forum_from_request()
 
     def _get_forum_from_id(self):
-        return Forum.query.get(self.forum_id)
+        return get_entity(Forum, self.forum_id)
 
     def _get_forum_from_request(self):
         if not current_forum:
@@ -113,21 +114,14 @@ class TopicNotLocked(Requirement):
             * Is the topic locked?
             * Is the forum the topic belongs to locked?
 
-        Except in the case of a topic instance being provided to the
-        constructor, all of these tuples are SQLA KeyedTuples.
         """
         if self._topic is not None:
             return self._topic.locked, self._topic.forum.locked
         elif self._post is not None:
             return self._post.topic.locked, self._post.topic.forum.locked
         elif self._topic_id is not None:
-            return (
-                Topic.query.join(Forum, Forum.id == Topic.forum_id).filter(
-                    Topic.id == self._topic_id
-                ).with_entities(
-                    Topic.locked, Forum.locked
-                ).first()
-            )
+            topic = get_entity(Topic, self._topic_id)
+            return topic.locked, topic.forum.locked
         else:
             return self._get_topic_from_request()
 
@@ -155,7 +149,7 @@ class ForumNotLocked(Requirement):
         if self._forum is not None:
             return self._forum
         elif self._forum_id is not None:
-            return Forum.query.get(self._forum_id)
+            return get_entity(Forum, self._forum_id)
         else:
             return self._get_forum_from_request()
 
@@ -9,32 +9,533 @@
     :copyright: (c) 2016 by the FlaskBB Team.
     :license: BSD, see LICENSE for more details.
 """
+import json
 import logging
+import os
+import uuid
+from collections import defaultdict
+
 import whoosh
+from flask import current_app
 from flask_whooshee import AbstractWhoosheer
+from sqlalchemy.orm import selectinload
+from whoosh.index import LockError
+from whoosh.query import Every, NumericRange
 
 from flaskbb._compat import text_type
+from flaskbb.extensions import cache, db, whooshee
 from flaskbb.forum.models import Forum, Topic, Post
+from flaskbb.management.models import SearchQueueEntry
 from flaskbb.user.models import User
+from flaskbb.utils.helpers import (from_microseconds, time_utcnow,
+                                   to_microseconds)
 
 
 logger = logging.getLogger(__name__)
 
+#: The attributes of the searchable models which change their search
+#: results. Updates of other attributes, e.g. of the counters, neither
+#: rewrite the documents nor invalidate the cached search results.
+indexed_attributes = {
+    Post: ("content", "username", "modified_by", "hidden"),
+    # the first post is part of the document of its topic
+    Topic: ("title", "username", "first_post_id", "forum_id", "hidden"),
+    Forum: ("title", "description"),
+    User: ("username", "email")
+}
+
+
+def invalidate_search_cache():
+    """Invalidates all cached search results. Needs to be called whenever
+    the search index changes.
+    """
+    # a new generation makes all cached results unreachable
+    cache.set("search/generation", uuid.uuid4().hex, timeout=0)
+
+
+def has_indexed_changes(obj):
+    """Checks if an updated object has changes which alter its search
+    results, see :data:`indexed_attributes`. New objects only show up in
+    the cached search results once they expire.
+
+    :param obj: The object which is being flushed.
+    """
+    attrs = db.inspect(obj).attrs
+    return any(attrs[name].history.has_changes()
+               for name in indexed_attributes.get(type(obj), ()))
+
+
+def delete_from_index(model, ids):
+    """Removes the ``model`` instances with the given ``ids`` from the
+    search index. Rows which are deleted with bulk statements don't
+    trigger the session events the index is updated by, hence they have
+    to be removed explicitly. If ``SEARCH_INDEX_ASYNC`` is enabled, the
+    deletions are queued instead.
+
+    :param model: The model class, e.g. ``Post``.
+    :param ids: The primary keys of the deleted instances.
+    """
+    config = current_app.extensions["whooshee"]
+    if not ids or config["enable_indexing"] is False:
+        return
+
+    if current_app.config.get("SEARCH_INDEX_ASYNC", False):
+        enqueue_index_changes(model, ids)
+        db.session.commit()
+        return
+
+    for wh in whooshee.whoosheers:
+        if model not in wh.models:
+            continue
+
+        field = _unique_field(wh)
+        writer = whooshee.get_or_create_index(current_app, wh).\
+            writer(timeout=config["writer_timeout"])
+        for id_ in ids:
+            writer.delete_by_term(field, id_)
+        writer.commit()
+    invalidate_search_cache()
+
+
+def update_index(model, ids, batch_size=500):
+    """Writes the current state of the ``model`` instances with the given
+    ``ids`` to the search index. Like :func:`delete_from_index`, this is
+    needed after they have been changed with bulk statements. If
+    ``SEARCH_INDEX_ASYNC`` is enabled, the changes are queued instead.
+
+    :param model: The model class, e.g. ``Post``.
+    :param ids: The primary keys of the changed instances.
+    :param batch_size: The number of instances which are loaded at once.
+    """
+    ids = list(ids)
+    config = current_app.extensions["whooshee"]
+    if not ids or config["enable_indexing"] is False:
+        return
+
+    if current_app.config.get("SEARCH_INDEX_ASYNC", False):
+        enqueue_index_changes(model, ids)
+        db.session.commit()
+        return
+
+    for i in range(0, len(ids), batch_size):
+        _write_index_changes({model.__name__: set(ids[i:i + batch_size])})
+
+
+def enqueue_index_changes(model, ids, connection=None):
+    """Adds changed (inserted, updated or deleted) objects to the search
+    queue. The queue only stores which objects have changed; their current
+    state is read when the queue is processed.
+
+    :param model: The model class, e.g. ``Post``.
+    :param ids: The primary keys of the changed objects.
+    :param connection: The connection which should be used, e.g. the one
+                       of the flush which changes the objects. Defaults to
+                       the session, which isn't committed.
+    """
+    if not ids:
+        return
+
+    now = time_utcnow()
+    (connection or db.session).execute(
+        SearchQueueEntry.__table__.insert(),
+        [{"model": model.__name__, "object_id": id_, "queued_at": now}
+         for id_ in ids]
+    )
+
+
+def process_search_queue(batch_size=500):
+    """Writes the queued changes to the search index and removes them from
+    the queue. Each batch of changes is applied with one index writer per
+    whoosheer and every object is only written once per batch, even if it
+    has been changed several times. Objects which don't exist anymore are
+    removed from the index.
+
+    Returns the number of processed queue entries. If the index is locked
+    by another writer, the remaining entries are left in the queue.
+
+    :param batch_size: The number of queue entries per batch.
+    """
+    enabled = current_app.extensions["whooshee"]["enable_indexing"]
+    processed = 0
+    while True:
+        entries = db.session.query(SearchQueueEntry.id,
+                                   SearchQueueEntry.model,
+                                   SearchQueueEntry.object_id).\
+            order_by(SearchQueueEntry.id).\
+            limit(batch_size).\
+            all()
+        if not entries:
+            return processed
+
+        changes = defaultdict(set)
+        for _, model, object_id in entries:
+            changes[model].add(object_id)
+
+        if enabled is not False:
+            try:
+                _write_index_changes(changes)
+            except LockError:
+                logger.info("The search index is locked by another writer. "
+                            "{} queued changes have been processed."
+                            .format(processed))
+                return processed
+
+        # entries with lower ids can be committed after the batch has been
+        # read, hence only the read entries are removed
+        db.session.query(SearchQueueEntry).\
+            filter(SearchQueueEntry.id.in_([entry[0] for entry in entries])).\
+            delete(synchronize_session=False)
+        db.session.commit()
+        processed += len(entries)
+
+
+def search_queue_lag():
+    """Returns a dict with the number of ``pending`` changes in the search
+    queue and the ``lag``, i.e. the age of the oldest one in seconds.
+    """
+    pending, oldest = db.session.query(
+        db.func.count(SearchQueueEntry.id),
+        db.func.min(SearchQueueEntry.queued_at)
+    ).one()
+
+    lag = 0
+    if oldest is not None:
+        lag = max((time_utcnow() - oldest).total_seconds(), 0)
+    return {"pending": pending, "lag": lag}
+
+
+def rebuild_index(batch_size=10000, procs=1, resume=False, progress=None):
+    """Rebuilds the search indexes from scratch.
+
+    The objects are loaded in chunks of ``batch_size`` rows ordered by
+    their primary key, hence the memory usage doesn't depend on the size
+    of the board. Every chunk is committed as a separate segment and the
+    segments are merged once a whoosheer has been reindexed. After each
+    chunk, the last indexed primary key is stored in a checkpoint file
+    in the index directory so that an interrupted rebuild can be resumed.
+
+    :param batch_size: The number of rows per chunk.
+    :param procs: The number of processes which build the segments. Only
+                  used for indexes which are stored on the disk.
+    :param resume: Continues from the checkpoint of a previous rebuild
+                   instead of starting over.
+    :param progress: A callable which is called with the model, the number
+                     of indexed objects and the total number of objects
+                     after every chunk.
+    """
+    config = current_app.extensions["whooshee"]
+    if config["memory_storage"]:
+        procs = 1
+
+    checkpoint = _load_checkpoint() if resume else {}
+    watermarks = {}
+    for wh in whooshee.whoosheers:
+        if wh.__name__ in checkpoint:
+            index = whooshee.get_or_create_index(current_app, wh)
+        else:
+            index = _clear_index(wh)
+            checkpoint[wh.__name__] = {}
+
+        watermarks[wh.__name__] = {}
+        for model in wh.models:
+            # the changes which happen during the rebuild are picked up
+            # by the next incremental reindex
+            watermarks[wh.__name__][model.__name__] = \
+                _get_watermark(wh, model)
+            _rebuild_model(index, wh, model, checkpoint, batch_size, procs,
+                           progress)
+
+        # merges the segments of the chunks
+        index.optimize()
+
+    _remove_checkpoint()
+    _save_state("watermarks.json", watermarks)
+    invalidate_search_cache()
+
+
+def _rebuild_model(index, wh, model, checkpoint, batch_size, procs,
+                   progress):
+    timeout = current_app.extensions["whooshee"]["writer_timeout"]
+    update = getattr(wh, "update_{}".format(model.__name__.lower()))
+    options = getattr(wh, "reindex_options", ())
+    last_id = checkpoint[wh.__name__].get(model.__name__, 0)
+
+    total = db.session.query(db.func.count(model.id)).scalar()
+    indexed = db.session.query(db.func.count(model.id)).\
+        filter(model.id <= last_id).\
+        scalar()
+    while True:
+        # the hidden objects are indexed as well
+        objects = db.session.query(model).\
+            options(*options).\
+            filter(model.id > last_id).\
+            order_by(model.id).\
+            limit(batch_size).\
+            all()
+        if not objects:
+            return
+
+        if procs > 1:
+            writer = index.writer(procs=procs, multisegment=True,
+                                  timeout=timeout)
+        else:
+            writer = index.writer(timeout=timeout)
+        try:
+            for obj in objects:
+                update(writer, obj)
+        except Exception:
+            writer.cancel()
+            raise
+        writer.commit(merge=False)
+
+        last_id = objects[-1].id
+        indexed += len(objects)
+        checkpoint[wh.__name__][model.__name__] = last_id
+        _save_checkpoint(checkpoint)
+        if progress is not None:
+            progress(model, indexed, max(total, indexed))
+
+
+def _clear_index(wh):
+    indexes = current_app.extensions["whooshee"]["whoosheers_indexes"]
+    storage = whooshee.get_or_create_index(current_app, wh).storage
+    indexes[wh] = storage.create_index(wh.schema)
+    return indexes[wh]
+
+
+def sync_index(batch_size=10000, progress=None):
+    """Brings the search indexes up to date without rebuilding them.
+
+    Every whoosheer keeps a watermark with the highest primary key of the
+    objects it has indexed and the time they have been indexed at. Only
+    the objects which have been created or modified since are indexed
+    again.
+    Afterwards, the primary keys in the index are compared with the ones
+    in the database in chunks of ``batch_size`` ids, which removes the
+    objects that have been deleted with bulk statements and adds the
+    ones that are missing.
+
+    Returns a dict which maps the model names to the number of updated
+    and deleted objects.
+
+    :param batch_size: The number of rows per chunk.
+    :param progress: A callable which is called with the model, the
+                     number of compared ids and the total number of ids
+                     after every chunk.
+    """
+    watermarks = _load_state("watermarks.json")
+    stats = {}
+    for wh in whooshee.whoosheers:
+        marks = watermarks.setdefault(wh.__name__, {})
+        for model in wh.models:
+            # taken before the index is updated, hence nothing is missed
+            watermark = _get_watermark(wh, model)
+            updated = _index_modified(wh, model, marks.get(model.__name__),
+                                      batch_size)
+            added, deleted = _reconcile_index(wh, model, batch_size,
+                                              progress)
+            stats[model.__name__] = {"updated": updated + added,
+                                     "deleted": deleted}
+
+            marks[model.__name__] = watermark
+            _save_state("watermarks.json", watermarks)
+
+    invalidate_search_cache()
+    return stats
+
+
+def _get_watermark(wh, model):
+    # the modification times are set by the application as well
+    return {
+        "id": db.session.query(db.func.max(model.id)).scalar() or 0,
+        "modified": to_microseconds(time_utcnow())
+    }
+
+
+def _index_modified(wh, model, watermark, batch_size):
+    changed = db.session.query(model.id)
+    if watermark is not None:
+        clause = model.id > watermark["id"]
+        column = _modified_column(wh, model)
+        if column is not None:
+            # the objects which have been modified at the same time as
+            # the watermark are indexed again
+            clause = db.or_(clause, column >= from_microseconds(
+                watermark["modified"]
+            ))
+        changed = changed.filter(clause)
+
+    updated = 0
+    last_id = 0
+    while True:
+        ids = [id_ for id_, in changed.
+               filter(model.id > last_id).
+               order_by(model.id).
+               limit(batch_size)]
+        if not ids:
+            return updated
+
+        _write_index_changes({model.__name__: set(ids)}, [wh])
+        updated += len(ids)
+        last_id = ids[-1]
+
+
+def _reconcile_index(wh, model, batch_size, progress):
+    field = _unique_field(wh)
+    index = whooshee.get_or_create_index(current_app, wh)
+    max_id = db.session.query(db.func.max(model.id)).scalar() or 0
+    with index.searcher() as searcher:
+        # the highest id in the index can't be lower than the one in the
+        # database after the modified objects have been indexed
+        hits = searcher.search(Every(), limit=1, sortedby=field,
+                               reverse=True)
+        if hits:
+            max_id = max(max_id, hits[0][field])
+
+        added = deleted = 0
+        for start in range(0, max_id + 1, batch_size):
+            end = start + batch_size - 1
+            indexed = set(
+                hit[field] for hit in
+                searcher.search(NumericRange(field, start, end), limit=None)
+            )
+            existing = set(
+                id_ for id_, in db.session.query(model.id).
+                filter(model.id.between(start, end))
+            )
+
+            missing = existing - indexed
+            removed = indexed - existing
+            if missing or removed:
+                _write_index_changes({model.__name__: missing | removed},
+                                     [wh])
+                added += len(missing)
+                deleted += len(removed)
+
+            if progress is not None:
+                progress(model, min(end, max_id), max_id)
+    return added, deleted
+
+
+def _modified_column(wh, model):
+    name = getattr(wh, "modified_column", None)
+    return getattr(model, name) if name is not None else None
+
+
+def _state_path(name):
+    config = current_app.extensions["whooshee"]
+    if config["memory_storage"]:
+        return None
+    return os.path.join(config["index_path_root"], name)
+
+
+def _load_state(name):
+    """Loads a JSON file from the index directory. The state of indexes
+    which are kept in memory is kept in memory as well.
+    """
+    path = _state_path(name)
+    if path is None:
+        state = current_app.extensions["whooshee"].get("state", {})
+        return json.loads(state.get(name, "{}"))
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_state(name, data):
+    path = _state_path(name)
+    if path is None:
+        current_app.extensions["whooshee"].setdefault("state", {})[name] = \
+            json.dumps(data)
+        return
+    # replaces the previous file atomically
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.rename(path + ".tmp", path)
+
+
+def _remove_state(name):
+    path = _state_path(name)
+    if path is None:
+        current_app.extensions["whooshee"].get("state", {}).pop(name, None)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _load_checkpoint():
+    return _load_state("reindex.json")
+
+
+def _save_checkpoint(checkpoint):
+    _save_state("reindex.json", checkpoint)
+
+
+def _remove_checkpoint():
+    _remove_state("reindex.json")
+
+
+def _write_index_changes(changes, whoosheers=None):
+    timeout = current_app.extensions["whooshee"]["writer_timeout"]
+    for wh in whoosheers or whooshee.whoosheers:
+        models = [model for model in wh.models if model.__name__ in changes]
+        if not models:
+            continue
+
+        if not whooshee.index_is_current(wh):
+            continue
+
+        writer = whooshee.get_or_create_index(current_app, wh).\
+            writer(timeout=timeout)
+        try:
+            for model in models:
+                ids = changes[model.__name__]
+                # the hidden objects are indexed as well
+                objects = db.session.query(model).\
+                    options(*getattr(wh, "reindex_options", ())).\
+                    filter(model.id.in_(ids)).\
+                    all()
+
+                update = getattr(wh, "update_{}".format(
+                    model.__name__.lower()
+                ))
+                for obj in objects:
+                    update(writer, obj)
+
+                deleted = ids.difference(obj.id for obj in objects)
+                for id_ in deleted:
+                    writer.delete_by_term(_unique_field(wh), id_)
+        except Exception:
+            writer.cancel()
+            raise
+        writer.commit()
+    invalidate_search_cache()
+
+
+def _unique_field(wh):
+    return next(name for name, field in wh.schema.items()
+                if getattr(field, "unique", False))
+
 
 class PostWhoosheer(AbstractWhoosheer):
     models = [Post]
+    # the forum of a post is the one of its topic
+    reindex_options = [selectinload("topic")]
+    modified_column = "date_modified"
 
     schema = whoosh.fields.Schema(
         post_id=whoosh.fields.NUMERIC(stored=True, unique=True),
+        forum_id=whoosh.fields.NUMERIC(),
         username=whoosh.fields.TEXT(),
         modified_by=whoosh.fields.TEXT(),
-        content=whoosh.fields.TEXT()
+        content=whoosh.fields.TEXT(stored=True)
     )
 
     @classmethod
     def update_post(cls, writer, post):
         writer.update_document(
             post_id=post.id,
+            forum_id=getattr(post.topic, 'forum_id', None),
             username=text_type(post.username),
             modified_by=text_type(post.modified_by),
             content=text_type(post.content)
@@ -44,6 +545,7 @@ class PostWhoosheer(AbstractWhoosheer):
     def insert_post(cls, writer, post):
         writer.add_document(
             post_id=post.id,
+            forum_id=getattr(post.topic, 'forum_id', None),
             username=text_type(post.username),
             modified_by=text_type(post.modified_by),
             content=text_type(post.content)
@@ -56,18 +558,23 @@ class PostWhoosheer(AbstractWhoosheer):
 
 class TopicWhoosheer(AbstractWhoosheer):
     models = [Topic]
+    # loads the first posts of the topics with one query per chunk
+    reindex_options = [selectinload(Topic.first_post)]
+    modified_column = "last_updated"
 
     schema = whoosh.fields.Schema(
         topic_id=whoosh.fields.NUMERIC(stored=True, unique=True),
+        forum_id=whoosh.fields.NUMERIC(),
         title=whoosh.fields.TEXT(),
         username=whoosh.fields.TEXT(),
-        content=whoosh.fields.TEXT()
+        content=whoosh.fields.TEXT(stored=True)
     )
 
     @classmethod
     def update_topic(cls, writer, topic):
         writer.update_document(
             topic_id=topic.id,
+            forum_id=topic.forum_id,
             title=text_type(topic.title),
             username=text_type(topic.username),
             content=text_type(getattr(topic.first_post, 'content', None))
@@ -77,6 +584,7 @@ class TopicWhoosheer(AbstractWhoosheer):
     def insert_topic(cls, writer, topic):
         writer.add_document(
             topic_id=topic.id,
+            forum_id=topic.forum_id,
             title=text_type(topic.title),
             username=text_type(topic.username),
             content=text_type(getattr(topic.first_post, 'content', None))
@@ -0,0 +1,763 @@
+# -*- coding: utf-8 -*-
+"""
+    flaskbb.utils.search_backends
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    The backends which are used for the full text search. The backend
+    is selected with the ``SEARCH_BACKEND`` config option.
+
+    :copyright: (c) 2018 the FlaskBB Team
+    :license: BSD, see LICENSE for more details
+"""
+import hashlib
+import logging
+import re
+from collections import Counter
+
+import whoosh.highlight
+import whoosh.qparser
+import whoosh.query
+from flask import current_app
+from flask_sqlalchemy import Pagination
+from markupsafe import Markup, escape
+from sqlalchemy import event
+
+from flaskbb._compat import text_type
+from flaskbb.extensions import cache, db, redis_store, whooshee
+from flaskbb.forum.models import Forum, Post, Topic, visible_forum_ids
+from flaskbb.user.models import User
+from flaskbb.utils.search import (delete_from_index, has_indexed_changes,
+                                  invalidate_search_cache, rebuild_index,
+                                  sync_index, update_index)
+
+
+logger = logging.getLogger(__name__)
+
+#: The table which stores the documents of the database backends. It isn't
+#: part of the metadata of the models because its definition depends on
+#: the database, see :meth:`SQLSearchBackend.create_table`.
+search_documents = db.Table(
+    "search_documents", db.MetaData(),
+    db.Column("model", db.String(50), nullable=False),
+    db.Column("object_id", db.Integer, nullable=False),
+    db.Column("document", db.Text, nullable=False)
+)
+
+
+def _text(*columns):
+    text = db.func.coalesce(columns[0], "")
+    for column in columns[1:]:
+        text = text + " " + db.func.coalesce(column, "")
+    return text
+
+
+#: Maps the searchable models to functions which return a select of the
+#: ids and the searchable text of their objects.
+searchable_models = {
+    Post: lambda: db.select([
+        Post.id, _text(Post.username, Post.modified_by, Post.content)
+    ]),
+    Topic: lambda: db.select([
+        Topic.id, _text(Topic.title, Topic.username, Post.content)
+    ]).select_from(
+        db.outerjoin(Topic, Post, Post.id == Topic.first_post_id)
+    ),
+    Forum: lambda: db.select([
+        Forum.id, _text(Forum.title, Forum.description)
+    ]),
+    User: lambda: db.select([
+        User.id, _text(User.username, User.email)
+    ])
+}
+
+
+#: The markers which enclose the matches in the snippets.
+MATCH_START = u"\x02"
+MATCH_END = u"\x03"
+
+
+def highlight(snippet):
+    """Turns a snippet whose matches are enclosed in :data:`MATCH_START`
+    and :data:`MATCH_END` into markup which highlights them.
+
+    :param snippet: The snippet which has been returned by the index.
+    """
+    html = text_type(escape(snippet))
+    return Markup(html.replace(MATCH_START, u"<mark>").
+                  replace(MATCH_END, u"</mark>"))
+
+
+def filter_visible(query, model, user):
+    """Filters a query of the model by the forums which are visible to the
+    user. The queries of other models than posts, topics and forums are
+    returned unchanged.
+
+    :param query: The query which should be filtered.
+    :param model: The model of the query.
+    :param user: The user who is searching.
+    """
+    forum_ids = visible_forum_ids(user)
+    if model is Post:
+        return query.join(Topic, Topic.id == Post.topic_id).\
+            filter(Topic.forum_id.in_(forum_ids))
+    elif model is Topic:
+        return query.filter(Topic.forum_id.in_(forum_ids))
+    elif model is Forum:
+        return query.filter(Forum.id.in_(forum_ids))
+    return query
+
+
+def search_terms(query):
+    """Splits a search query into its words. Everything else is dropped,
+    hence the words can be used in the query syntax of the databases
+    without escaping them.
+
+    :param query: The search query which has been entered by the user.
+    """
+    return re.findall(r"\w+", query, re.UNICODE)
+
+
+class SearchBackend(object):
+    """The interface of the search backends."""
+
+    def search(self, model, query):
+        """Returns a query of the objects of the model which match the
+        search query, ordered by their relevance.
+
+        :param model: The model which should be searched, e.g. ``Post``.
+        :param query: The search query which has been entered by the user.
+        """
+        raise NotImplementedError
+
+    def search_page(self, model, query, page, per_page, user):
+        """Returns a :class:`~flask_sqlalchemy.Pagination` of the objects
+        of the model which match the search query and are visible to the
+        user. Only the objects of the requested page are loaded. Its items
+        are ``(object, snippet)`` tuples where the snippet is the markup of
+        the matched text of posts and topics or ``None``.
+
+        :param model: The model which should be searched, e.g. ``Post``.
+        :param query: The search query which has been entered by the user.
+        :param page: The page which should be returned.
+        :param per_page: The number of objects per page.
+        :param user: The user who is searching.
+        """
+        raise NotImplementedError
+
+    def delete(self, model, ids):
+        """Removes objects from the index. Needs to be called after they
+        have been deleted with bulk statements, which don't trigger the
+        session events that keep the index up to date.
+
+        :param model: The model class, e.g. ``Post``.
+        :param ids: The primary keys of the deleted objects.
+        """
+        raise NotImplementedError
+
+    def move_topics(self, topic_ids):
+        """Updates the index after topics have been moved to another
+        forum with bulk statements.
+
+        :param topic_ids: The ids of the moved topics.
+        """
+        raise NotImplementedError
+
+    def reindex(self, batch_size=10000, procs=1, resume=False,
+                progress=None):
+        """Rebuilds the index from scratch.
+
+        :param batch_size: The number of rows which are indexed at once.
+        :param procs: The number of processes which build the index, if
+                      supported by the backend.
+        :param resume: Continues an interrupted rebuild instead of
+                       starting over.
+        :param progress: A callable which is called with the model, the
+                         number of indexed objects and the total number of
+                         objects after every batch.
+        """
+        raise NotImplementedError
+
+    def sync(self, batch_size=10000, progress=None):
+        """Brings the index up to date with the database without
+        rebuilding it, e.g. after objects have been changed with bulk
+        statements or a backup has been restored. Returns a dict which
+        maps the model names to the number of updated and deleted
+        objects.
+
+        :param batch_size: The number of ids which are compared at once.
+        :param progress: A callable which is called with the model, the
+                         number of compared ids and the total number of
+                         ids after every batch.
+        """
+        raise NotImplementedError
+
+
+class WhooshSearchBackend(SearchBackend):
+    """Searches the Whoosh indexes which are maintained by
+    Flask-Whooshee. The indexes are stored in ``WHOOSHEE_DIR``.
+    """
+
+    def search(self, model, query):
+        return model.query.whooshee_search(query)
+
+    def search_page(self, model, query, page, per_page, user):
+        page = max(page, 1)
+        wh = next(wh for wh in whooshee.whoosheers if model in wh.models)
+        schema = wh.schema
+        field = "{}_id".format(model.__name__.lower())
+
+        search_filter = None
+        if "forum_id" in schema:
+            forum_ids = visible_forum_ids(user)
+            if not forum_ids:
+                return Pagination(None, page, per_page, 0, [])
+            search_filter = whoosh.query.Or([
+                whoosh.query.Term("forum_id", forum_id)
+                for forum_id in forum_ids
+            ])
+
+        parser = whoosh.qparser.MultifieldParser(
+            [name for name, type_ in schema.items()
+             if isinstance(type_, whoosh.fields.TEXT)],
+            schema, group=whoosh.qparser.OrGroup
+        )
+        parsed = parser.parse(wh.prep_search_string(query, True))
+
+        index = whooshee.get_or_create_index(current_app, wh)
+        with index.searcher() as searcher:
+            hits = searcher.search_page(parsed, page, pagelen=per_page,
+                                        filter=search_filter, terms=True)
+            hits.results.formatter = _MatchFormatter()
+            # pages after the last one are clamped by whoosh
+            page = hits.pagenum
+            total = hits.total
+            ids = [hit[field] for hit in hits]
+            snippets = {}
+            if model in (Post, Topic):
+                snippets = {hit[field]: highlight(hit.highlights("content"))
+                            for hit in hits}
+
+        # the objects are loaded in the order of their relevance
+        objects = {}
+        if ids:
+            objects = {obj.id: obj
+                       for obj in model.query.filter(model.id.in_(ids))}
+        return Pagination(None, page, per_page, total, [
+            (objects[id_], snippets.get(id_)) for id_ in ids
+            if id_ in objects
+        ])
+
+    def delete(self, model, ids):
+        delete_from_index(model, ids)
+
+    def move_topics(self, topic_ids):
+        # the posts are indexed with the forum of their topic
+        post_ids = [id_ for id_, in db.session.query(Post.id).
+                    filter(Post.topic_id.in_(topic_ids))]
+        update_index(Topic, topic_ids)
+        update_index(Post, post_ids)
+
+    def reindex(self, batch_size=10000, procs=1, resume=False,
+                progress=None):
+        rebuild_index(batch_size=batch_size, procs=procs, resume=resume,
+                      progress=progress)
+
+    def sync(self, batch_size=10000, progress=None):
+        return sync_index(batch_size=batch_size, progress=progress)
+
+
+class SQLSearchBackend(SearchBackend):
+    """The base class of the backends which use the full text search of
+    the database. The documents are stored in the ``search_documents``
+    table and are updated within the transaction which changes the
+    objects, hence the index can be shared by any number of processes.
+    """
+
+    def search(self, model, query):
+        terms = search_terms(query)
+        if not terms:
+            return model.query.filter(db.false())
+
+        matches = self._match(model, terms).alias("matches")
+        return model.query.\
+            join(matches, matches.c.object_id == model.id).\
+            order_by(self._order_by(matches.c.rank))
+
+    def search_page(self, model, query, page, per_page, user):
+        terms = search_terms(query)
+        results = filter_visible(self.search(model, query), model, user).\
+            paginate(page, per_page, False)
+
+        snippets = {}
+        if model in (Post, Topic) and results.items:
+            snippets = self._snippets(
+                model, terms, [obj.id for obj in results.items]
+            )
+        results.items = [(obj, snippets.get(obj.id))
+                         for obj in results.items]
+        return results
+
+    def move_topics(self, topic_ids):
+        # the forums are joined when searching, the documents don't change
+        pass
+
+    def delete(self, model, ids):
+        if not ids:
+            return
+
+        db.session.execute(
+            search_documents.delete().
+            where(search_documents.c.model == model.__name__).
+            where(search_documents.c.object_id.in_(ids))
+        )
+        db.session.commit()
+        invalidate_search_cache()
+
+    def reindex(self, batch_size=10000, procs=1, resume=False,
+                progress=None):
+        self.create_table(db.session.connection())
+        for model in searchable_models:
+            is_model = search_documents.c.model == model.__name__
+            if resume:
+                last_id = db.session.execute(
+                    db.select([db.func.max(search_documents.c.object_id)]).
+                    where(is_model)
+                ).scalar() or 0
+            else:
+                db.session.execute(search_documents.delete().where(is_model))
+                last_id = 0
+
+            total = db.session.query(db.func.count(model.id)).scalar()
+            indexed = db.session.query(db.func.count(model.id)).\
+                filter(model.id <= last_id).\
+                scalar()
+            while True:
+                ids = [id_ for id_, in db.session.query(model.id).
+                       filter(model.id > last_id).
+                       order_by(model.id).
+                       limit(batch_size)]
+                if not ids:
+                    break
+
+                self.index(db.session.connection(), model,
+                           lambda column: column.between(ids[0], ids[-1]))
+                db.session.commit()
+
+                last_id = ids[-1]
+                indexed += len(ids)
+                if progress is not None:
+                    progress(model, indexed, max(total, indexed))
+        db.session.commit()
+        invalidate_search_cache()
+
+    def sync(self, batch_size=10000, progress=None):
+        # the documents are changed along with the objects, only bulk
+        # statements can leave missing or stale documents behind
+        self.create_table(db.session.connection())
+        stats = {}
+        for model in searchable_models:
+            is_model = search_documents.c.model == model.__name__
+            max_id = max(
+                db.session.query(db.func.max(model.id)).scalar() or 0,
+                db.session.execute(
+                    db.select([db.func.max(search_documents.c.object_id)]).
+                    where(is_model)
+                ).scalar() or 0
+            )
+
+            updated = deleted = 0
+            for start in range(0, max_id + 1, batch_size):
+                end = start + batch_size - 1
+                indexed = set(id_ for id_, in db.session.execute(
+                    db.select([search_documents.c.object_id]).
+                    where(is_model).
+                    where(search_documents.c.object_id.between(start, end))
+                ))
+                existing = set(
+                    id_ for id_, in db.session.query(model.id).
+                    filter(model.id.between(start, end))
+                )
+
+                changed = indexed ^ existing
+                if changed:
+                    self.index(db.session.connection(), model,
+                               lambda column: column.in_(changed))
+                    db.session.commit()
+                    updated += len(existing - indexed)
+                    deleted += len(indexed - existing)
+
+                if progress is not None:
+                    progress(model, min(end, max_id), max_id)
+
+            stats[model.__name__] = {"updated": updated, "deleted": deleted}
+        db.session.commit()
+        invalidate_search_cache()
+        return stats
+
+    def index(self, connection, model, where):
+        """Writes the documents of the objects of a model.
+
+        :param connection: The connection which should be used.
+        :param model: The model class, e.g. ``Post``.
+        :param where: A callable which returns the clause that selects
+                      the objects when it is called with an id column.
+        """
+        name = model.__name__
+        connection.execute(
+            search_documents.delete().
+            where(search_documents.c.model == name).
+            where(where(search_documents.c.object_id))
+        )
+
+        documents = searchable_models[model]()
+        id_, text = documents.inner_columns
+        connection.execute(search_documents.insert().from_select(
+            ["model", "object_id", "document"],
+            documents.with_only_columns([
+                db.literal(name), id_, self._document(text)
+            ]).where(where(id_))
+        ))
+
+    def create_table(self, connection):
+        """Creates the ``search_documents`` table if it doesn't exist.
+
+        :param connection: The connection which should be used.
+        """
+        raise NotImplementedError
+
+    def _document(self, text):
+        """Returns the expression which is stored as the document."""
+        return text
+
+    def _match(self, model, terms):
+        """Returns a select of the ``object_id`` and ``rank`` of the
+        documents which match the search terms.
+        """
+        raise NotImplementedError
+
+    def _order_by(self, rank):
+        return rank
+
+    def _snippets(self, model, terms, ids):
+        """Returns a dict which maps the ids of the objects to the
+        highlighted snippets of their matched text.
+        """
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(SQLSearchBackend):
+    """Indexes the documents with an FTS5 table. Needs SQLite 3.9 or newer
+    which has been compiled with FTS5 support.
+
+    The documents are stored in a regular table whose primary key is used
+    as the rowid of the ``search_documents_fts`` table, which is kept up to
+    date by triggers. Thus the documents are replaced by their keys
+    instead of scanning the full text index. The model is copied into the
+    full text index as well, so that matches are filtered before the
+    documents are looked up.
+    """
+
+    def create_table(self, connection):
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS search_documents ("
+            "id INTEGER NOT NULL, "
+            "model VARCHAR(50) NOT NULL, "
+            "object_id INTEGER NOT NULL, "
+            "document TEXT NOT NULL, "
+            "CONSTRAINT pk_search_documents PRIMARY KEY (id), "
+            "CONSTRAINT uq_search_documents_model "
+            "UNIQUE (model, object_id))"
+        )
+        connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_documents_fts "
+            "USING fts5(model UNINDEXED, document, "
+            "content='search_documents', "
+            "content_rowid='id')"
+        )
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS search_documents_ai "
+            "AFTER INSERT ON search_documents BEGIN "
+            "INSERT INTO search_documents_fts (rowid, model, document) "
+            "VALUES (new.id, new.model, new.document); "
+            "END"
+        )
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS search_documents_ad "
+            "AFTER DELETE ON search_documents BEGIN "
+            "INSERT INTO search_documents_fts "
+            "(search_documents_fts, rowid, model, document) "
+            "VALUES ('delete', old.id, old.model, old.document); "
+            "END"
+        )
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS search_documents_au "
+            "AFTER UPDATE ON search_documents BEGIN "
+            "INSERT INTO search_documents_fts "
+            "(search_documents_fts, rowid, model, document) "
+            "VALUES ('delete', old.id, old.model, old.document); "
+            "INSERT INTO search_documents_fts (rowid, model, document) "
+            "VALUES (new.id, new.model, new.document); "
+            "END"
+        )
+
+    def _match(self, model, terms):
+        # a prefix query for every term, the documents which match most
+        # of them are ranked first
+        query = " OR ".join('"{}"*'.format(term) for term in terms)
+        return db.select([
+            search_documents.c.object_id,
+            db.literal_column("search_documents_fts.rank").label("rank")
+        ]).select_from(
+            search_documents.join(
+                db.table("search_documents_fts"),
+                db.literal_column("search_documents_fts.rowid") ==
+                db.literal_column("search_documents.id")
+            )
+        ).where(
+            db.literal_column("search_documents_fts.model") == model.__name__
+        ).where(
+            db.literal_column("search_documents_fts").match(query)
+        )
+
+    def _snippets(self, model, terms, ids):
+        rows = db.session.execute(self._match(model, terms).with_only_columns([
+            search_documents.c.object_id,
+            db.func.snippet(db.literal_column("search_documents_fts"), 1,
+                            MATCH_START, MATCH_END, u"\u2026", 32)
+        ]).where(search_documents.c.object_id.in_(ids)))
+        return {id_: highlight(snippet) for id_, snippet in rows}
+
+
+class PostgreSQLSearchBackend(SQLSearchBackend):
+    """Stores the documents as ``tsvector`` which are indexed by a GIN
+    index.
+    """
+
+    #: The text search configuration which is used to parse the documents
+    #: and queries. The ``simple`` configuration doesn't depend on the
+    #: language of the board.
+    text_search_config = "simple"
+
+    def create_table(self, connection):
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS search_documents ("
+            "model VARCHAR(50) NOT NULL, "
+            "object_id INTEGER NOT NULL, "
+            "document TSVECTOR NOT NULL, "
+            "CONSTRAINT pk_search_documents PRIMARY KEY (model, object_id))"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS ix_search_documents_document "
+            "ON search_documents USING gin (document)"
+        )
+
+    def _document(self, text):
+        return db.func.to_tsvector(self.text_search_config, text)
+
+    def _query(self, terms):
+        return db.func.to_tsquery(
+            self.text_search_config,
+            " | ".join("{}:*".format(term) for term in terms)
+        )
+
+    def _match(self, model, terms):
+        query = self._query(terms)
+        return db.select([
+            search_documents.c.object_id,
+            db.func.ts_rank(search_documents.c.document, query).label("rank")
+        ]).where(
+            search_documents.c.model == model.__name__
+        ).where(
+            search_documents.c.document.op("@@")(query)
+        )
+
+    def _order_by(self, rank):
+        return rank.desc()
+
+    def _snippets(self, model, terms, ids):
+        # tsvectors don't contain the text, hence it is selected again
+        documents = searchable_models[model]()
+        id_, text = documents.inner_columns
+        options = u"StartSel={}, StopSel={}, MaxFragments=2".format(
+            MATCH_START, MATCH_END
+        )
+        rows = db.session.execute(documents.with_only_columns([
+            id_, db.func.ts_headline(self.text_search_config, text,
+                                     self._query(terms), options)
+        ]).where(id_.in_(ids)))
+        return {id_: highlight(snippet) for id_, snippet in rows}
+
+
+class _MatchFormatter(whoosh.highlight.Formatter):
+    """Encloses the matches of the Whoosh snippets in the markers which
+    are turned into markup by :func:`highlight`.
+    """
+
+    between = u"\u2026"
+
+    def format_token(self, text, token, replace=False):
+        return MATCH_START + whoosh.highlight.get_text(text, token, replace) + \
+            MATCH_END
+
+
+search_backends = {
+    "whoosh": WhooshSearchBackend,
+    "sqlite": SQLiteSearchBackend,
+    "postgresql": PostgreSQLSearchBackend
+}
+
+
+def get_search_backend(app=None):
+    """Returns the search backend which is configured with
+    ``SEARCH_BACKEND``.
+
+    :param app: The app. Defaults to the current app.
+    """
+    app = app or current_app
+    return search_backends[app.config["SEARCH_BACKEND"]]()
+
+
+def cached_search_page(model, query, page, per_page, user):
+    """Returns the same results as :meth:`SearchBackend.search_page` but
+    caches the ids and snippets of the results for ``SEARCH_CACHE_TIMEOUT``
+    seconds. The results are cached per normalized search query and set
+    of groups of the user. Any change of the search index invalidates them
+    (see :func:`~flaskbb.utils.search.invalidate_search_cache`).
+
+    :param model: The model which should be searched, e.g. ``Post``.
+    :param query: The search query which has been entered by the user.
+    :param page: The page which should be returned.
+    :param per_page: The number of objects per page.
+    :param user: The user who is searching.
+    """
+    backend = get_search_backend()
+    timeout = current_app.config["SEARCH_CACHE_TIMEOUT"]
+    if not timeout:
+        return backend.search_page(model, query, page, per_page, user)
+
+    generation = cache.get("search/generation")
+    if generation is None:
+        invalidate_search_cache()
+        generation = cache.get("search/generation")
+
+    normalized = u" ".join(query.lower().split())
+    key = "search/{}/{}/{}/{}/{}/{}".format(
+        generation, model.__name__,
+        ",".join(str(group_id) for group_id in
+                 sorted(group.id for group in user.groups)),
+        hashlib.sha1(normalized.encode("utf-8")).hexdigest(), page, per_page
+    )
+
+    cached = cache.get(key)
+    if cached is None:
+        _count_search_cache("misses")
+        results = backend.search_page(model, query, page, per_page, user)
+        cache.set(key, (results.page, results.total, [
+            (obj.id, None if snippet is None else text_type(snippet))
+            for obj, snippet in results.items
+        ]), timeout=timeout)
+        return results
+
+    _count_search_cache("hits")
+    page, total, items = cached
+    objects = {}
+    if items:
+        objects = {obj.id: obj for obj in
+                   model.query.filter(model.id.in_(id_ for id_, _ in items))}
+    return Pagination(None, page, per_page, total, [
+        (objects[id_], None if snippet is None else Markup(snippet))
+        for id_, snippet in items if id_ in objects
+    ])
+
+
+def search_cache_stats():
+    """Returns a dict with the number of ``hits`` and ``misses`` of the
+    search result cache. If redis is enabled, the counters are shared by
+    all processes, otherwise they are counted per process.
+    """
+    if current_app.config["REDIS_ENABLED"]:
+        stats = redis_store.hgetall("search/stats")
+        return {name: int(stats.get(name.encode("utf-8"), 0))
+                for name in ("hits", "misses")}
+
+    stats = current_app.extensions.get("search_cache_stats", Counter())
+    return {"hits": stats["hits"], "misses": stats["misses"]}
+
+
+def _count_search_cache(name):
+    if current_app.config["REDIS_ENABLED"]:
+        redis_store.hincrby("search/stats", name, 1)
+    else:
+        current_app.extensions.setdefault(
+            "search_cache_stats", Counter()
+        )[name] += 1
+
+
+def _has_search_documents(connection):
+    """Checks if the ``search_documents`` table exists. A missing table
+    doesn't abort the transaction which changes the objects, their
+    documents are written by the next reindex instead.
+    """
+    state = current_app.extensions.setdefault("search_backends", {})
+    if not state.get("has_table"):
+        state["has_table"] = connection.dialect.has_table(
+            connection, search_documents.name
+        )
+        if not state["has_table"]:
+            logger.warning(
+                "The search_documents table doesn't exist, the changes "
+                "aren't indexed. Run 'flaskbb reindex' to create it."
+            )
+    return state["has_table"]
+
+
+def _after_insert(mapper, connection, target):
+    # new objects show up once the cached search results expire
+    _index_object(mapper, connection, target)
+
+
+def _after_update(mapper, connection, target):
+    # e.g. the counters and the views don't change the document
+    if not has_indexed_changes(target):
+        return
+
+    if _index_object(mapper, connection, target):
+        invalidate_search_cache()
+
+
+def _index_object(mapper, connection, target):
+    backend = get_search_backend()
+    if not isinstance(backend, SQLSearchBackend) or \
+            not _has_search_documents(connection):
+        return False
+
+    model = mapper.class_
+    backend.index(connection, model, lambda column: column == target.id)
+
+    # the first post is part of the document of its topic
+    if model is Post and db.inspect(target).attrs.content.history.has_changes():
+        first_posts = db.select([Topic.id]).\
+            where(Topic.first_post_id == target.id)
+        backend.index(connection, Topic,
+                      lambda column: column.in_(first_posts))
+    return True
+
+
+def _after_delete(mapper, connection, target):
+    backend = get_search_backend()
+    if not isinstance(backend, SQLSearchBackend) or \
+            not _has_search_documents(connection):
+        return
+
+    connection.execute(
+        search_documents.delete().
+        where(search_documents.c.model == mapper.class_.__name__).
+        where(search_documents.c.object_id == target.id)
+    )
+    invalidate_search_cache()
+
+
+for _model in searchable_models:
+    event.listen(_model, "after_insert", _after_insert)
+    event.listen(_model, "after_update", _after_update)
+    event.listen(_model, "after_delete", _after_delete)
@@ -10,20 +10,32 @@
     :license: BSD, see LICENSE for more details.
 """
 import collections
+import time
+
+from flask import current_app
 
 from flaskbb.management.models import Setting
+from flaskbb.utils.database import request_cache
 
 
 class FlaskBBConfig(collections.MutableMapping):
     """Provides a dictionary like interface for interacting with FlaskBB's
     Settings cache.
+
+    The settings are looked up once per request. Every process keeps a
+    snapshot of them which is reused as long as the generation of the
+    settings hasn't been changed by :meth:`Setting.update`, hence a
+    request usually only fetches the generation from the cache. As the
+    generation isn't shared by the processes if the cache isn't shared
+    either, the snapshot expires after ``CACHE_DEFAULT_TIMEOUT`` seconds
+    like the cached settings.
     """
 
     def __init__(self, *args, **kwargs):
         self.update(dict(*args, **kwargs))
 
     def __getitem__(self, key):
-        return Setting.as_dict()[key]
+        return self.snapshot()[key]
 
     def __setitem__(self, key, value):
         Setting.update({key.lower(): value})
@@ -32,10 +44,33 @@ class FlaskBBConfig(collections.MutableMapping):
         pass
 
     def __iter__(self):
-        return iter(Setting.as_dict())
+        return iter(self.snapshot())
 
     def __len__(self):
-        return len(Setting.as_dict())
+        return len(self.snapshot())
+
+    def snapshot(self):
+        """Returns all settings as a dict which must not be modified."""
+        settings = request_cache("settings")
+        if not settings:
+            settings.update(self._load())
+        return settings
+
+    def _load(self):
+        # the generation is fetched first so that a concurrent update
+        # can't be hidden by an outdated snapshot
+        generation = Setting.get_generation()
+        timeout = current_app.config["CACHE_DEFAULT_TIMEOUT"]
+        snapshot = current_app.extensions.get("settings_snapshot")
+        if snapshot is not None and snapshot[0] == generation and \
+                (not timeout or time.time() - snapshot[2] < timeout):
+            return snapshot[1]
+
+        settings = Setting.as_dict()
+        current_app.extensions["settings_snapshot"] = (
+            generation, settings, time.time()
+        )
+        return settings
 
 
 flaskbb_config = FlaskBBConfig()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+    flaskbb.utils.whooshee
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Extends Flask-Whooshee with an asynchronous indexing mode.
+
+    :copyright: (c) 2018 the FlaskBB Team
+    :license: BSD, see LICENSE for more details
+"""
+import logging
+
+from flask import current_app
+from flask_whooshee import Whooshee as BaseWhooshee
+
+
+logger = logging.getLogger(__name__)
+
+
+class Whooshee(BaseWhooshee):
+    """Writes the changes of the searchable models to the search index.
+
+    By default they are written synchronously when the session is flushed,
+    which means that the request has to wait for the lock of the index.
+    If ``SEARCH_INDEX_ASYNC`` is enabled, the changes are only added to
+    the ``search_queue`` table within the same transaction and a single
+    writer applies them in batches later on
+    (see :func:`~flaskbb.utils.search.process_search_queue`).
+
+    Changes aren't written to indexes which have been created with an
+    older schema of their whoosheer, as this would abort the flush. They
+    have to be rebuilt with ``flaskbb reindex`` instead.
+    """
+
+    def index_is_current(self, wh):
+        """Checks if the index of a whoosheer has been created with its
+        current schema and logs an error if it hasn't.
+
+        :param wh: The whoosheer whose index should be checked.
+        """
+        index = self.get_or_create_index(current_app, wh)
+        fields = sorted((name, type(field)) for name, field in
+                        index.schema.items())
+        if fields == sorted((name, type(field)) for name, field in
+                            wh.schema.items()):
+            return True
+
+        logger.error(
+            "The search index of %s has been created with an older schema "
+            "and isn't updated anymore. Run 'flaskbb reindex' to rebuild "
+            "it.", wh.__name__
+        )
+        return False
+
+    def on_commit(self, changes):
+        if not current_app.extensions["whooshee"]["enable_indexing"]:
+            return
+
+        outdated = set()
+        for wh in self.whoosheers:
+            changed = any(type(obj) in wh.models for obj, _ in changes)
+            if changed and not self.index_is_current(wh):
+                outdated.update(wh.models)
+
+        changes = [change for change in changes
+                   if type(change[0]) not in outdated]
+        if changes:
+            super(Whooshee, self).on_commit(changes)
+
+    def after_insert(self, mapper, connection, target):
+        # new objects show up once the cached search results expire
+        if not self._enqueue(connection, target):
+            super(Whooshee, self).after_insert(mapper, connection, target)
+
+    def after_update(self, mapper, connection, target):
+        if not self._enqueue(connection, target):
+            super(Whooshee, self).after_update(mapper, connection, target)
+
+            from flaskbb.utils.search import (has_indexed_changes,
+                                              invalidate_search_cache)
+            if has_indexed_changes(target):
+                invalidate_search_cache()
+
+    def after_delete(self, mapper, connection, target):
+        if not self._enqueue(connection, target):
+            super(Whooshee, self).after_delete(mapper, connection, target)
+
+            from flaskbb.utils.search import invalidate_search_cache
+            invalidate_search_cache()
+
+    def _enqueue(self, connection, target):
+        if not current_app.config.get("SEARCH_INDEX_ASYNC", False):
+            return False
+
+        from flaskbb.utils.search import enqueue_index_changes
+        enqueue_index_changes(type(target), [target.id],
+                              connection=connection)
+        return True
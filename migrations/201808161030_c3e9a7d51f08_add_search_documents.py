@@ -0,0 +1,51 @@
+"""Add search documents
+
+Revision ID: c3e9a7d51f08
+Revises: 8a1c6e3f4b92
+Create Date: 2018-08-16 10:30:27.581344
+
+"""
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e9a7d51f08'
+down_revision = '8a1c6e3f4b92'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    # the table is only used by the full text search backend of the
+    # database, see flaskbb.utils.search_backends
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        try:
+            op.execute(
+                'CREATE VIRTUAL TABLE search_documents '
+                'USING fts5(model UNINDEXED, object_id UNINDEXED, document)'
+            )
+        except sa.exc.OperationalError:
+            # SQLite has been compiled without FTS5, which is only needed
+            # by the sqlite search backend
+            if current_app.config.get('SEARCH_BACKEND') == 'sqlite':
+                raise RuntimeError(
+                    'The sqlite search backend requires SQLite with the '
+                    'FTS5 extension.'
+                )
+    elif dialect == 'postgresql':
+        op.create_table('search_documents',
+        sa.Column('model', sa.String(length=50), nullable=False),
+        sa.Column('object_id', sa.Integer(), nullable=False),
+        sa.Column('document', postgresql.TSVECTOR(), nullable=False),
+        sa.PrimaryKeyConstraint('model', 'object_id', name=op.f('pk_search_documents'))
+        )
+        op.create_index('ix_search_documents_document', 'search_documents',
+                        ['document'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS search_documents')
@@ -0,0 +1,118 @@
+"""Key the SQLite search documents
+
+Revision ID: f61b2c8d4a37
+Revises: c3e9a7d51f08
+Create Date: 2018-08-20 14:15:42.118205
+
+"""
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f61b2c8d4a37'
+down_revision = 'c3e9a7d51f08'
+branch_labels = ()
+depends_on = None
+
+
+def _table_sql(name):
+    return op.get_bind().execute(
+        sa.text("SELECT sql FROM sqlite_master WHERE name = :name"),
+        name=name
+    ).scalar()
+
+
+def upgrade():
+    # the FTS5 table had no usable key, the documents are now stored in a
+    # regular table whose primary key is the rowid of the full text index,
+    # see flaskbb.utils.search_backends.SQLiteSearchBackend
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    old_sql = _table_sql('search_documents')
+    if old_sql is not None:
+        op.rename_table('search_documents', 'search_documents_old')
+
+    try:
+        op.execute(
+            'CREATE TABLE search_documents ('
+            'id INTEGER NOT NULL, '
+            'model VARCHAR(50) NOT NULL, '
+            'object_id INTEGER NOT NULL, '
+            'document TEXT NOT NULL, '
+            'CONSTRAINT pk_search_documents PRIMARY KEY (id), '
+            'CONSTRAINT uq_search_documents_model UNIQUE (model, object_id))'
+        )
+        op.execute(
+            "CREATE VIRTUAL TABLE search_documents_fts "
+            "USING fts5(model UNINDEXED, document, "
+            "content='search_documents', content_rowid='id')"
+        )
+    except sa.exc.OperationalError:
+        # SQLite has been compiled without FTS5, which is only needed
+        # by the sqlite search backend
+        if current_app.config.get('SEARCH_BACKEND') == 'sqlite':
+            raise RuntimeError(
+                'The sqlite search backend requires SQLite with the '
+                'FTS5 extension.'
+            )
+        op.execute('DROP TABLE IF EXISTS search_documents')
+        return
+
+    op.execute(
+        'CREATE TRIGGER search_documents_ai '
+        'AFTER INSERT ON search_documents BEGIN '
+        'INSERT INTO search_documents_fts (rowid, model, document) '
+        'VALUES (new.id, new.model, new.document); '
+        'END'
+    )
+    op.execute(
+        'CREATE TRIGGER search_documents_ad '
+        'AFTER DELETE ON search_documents BEGIN '
+        'INSERT INTO search_documents_fts '
+        '(search_documents_fts, rowid, model, document) '
+        "VALUES ('delete', old.id, old.model, old.document); "
+        'END'
+    )
+    op.execute(
+        'CREATE TRIGGER search_documents_au '
+        'AFTER UPDATE ON search_documents BEGIN '
+        'INSERT INTO search_documents_fts '
+        '(search_documents_fts, rowid, model, document) '
+        "VALUES ('delete', old.id, old.model, old.document); "
+        'INSERT INTO search_documents_fts (rowid, model, document) '
+        'VALUES (new.id, new.model, new.document); '
+        'END'
+    )
+
+    if old_sql is not None:
+        op.execute(
+            'INSERT INTO search_documents (model, object_id, document) '
+            'SELECT model, object_id, document FROM search_documents_old'
+        )
+        op.execute('DROP TABLE search_documents_old')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    if _table_sql('search_documents_fts') is None:
+        return
+
+    op.execute('DROP TRIGGER IF EXISTS search_documents_ai')
+    op.execute('DROP TRIGGER IF EXISTS search_documents_ad')
+    op.execute('DROP TRIGGER IF EXISTS search_documents_au')
+    op.execute('DROP TABLE search_documents_fts')
+    op.rename_table('search_documents', 'search_documents_new')
+    op.execute(
+        'CREATE VIRTUAL TABLE search_documents '
+        'USING fts5(model UNINDEXED, object_id UNINDEXED, document)'
+    )
+    op.execute(
+        'INSERT INTO search_documents (model, object_id, document) '
+        'SELECT model, object_id, document FROM search_documents_new'
+    )
+    op.execute('DROP TABLE search_documents_new')
@@ -0,0 +1,62 @@
+"""Create the board statistics
+
+Revision ID: b7e4d9a2c615
+Revises: f61b2c8d4a37
+Create Date: 2018-08-21 11:20:08.342719
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4d9a2c615'
+down_revision = 'f61b2c8d4a37'
+branch_labels = ()
+depends_on = None
+
+
+board_statistics = sa.table(
+    'board_statistics',
+    sa.column('key', sa.String),
+    sa.column('value', sa.BigInteger)
+)
+users = sa.table('users', sa.column('id', sa.Integer))
+topics = sa.table(
+    'topics', sa.column('id', sa.Integer), sa.column('hidden', sa.Boolean)
+)
+posts = sa.table(
+    'posts', sa.column('id', sa.Integer), sa.column('topic_id', sa.Integer),
+    sa.column('hidden', sa.Boolean)
+)
+
+
+def upgrade():
+    # the counters are only updated by FlaskBB, hence the missing ones
+    # are counted once (see BoardStatistic.reconcile)
+    connection = op.get_bind()
+    existing = {
+        key for key, in connection.execute(sa.select([board_statistics.c.key]))
+    }
+    visible_topics = sa.select([topics.c.id]).where(topics.c.hidden != True)
+    stats = {
+        'users': sa.select([sa.func.count(users.c.id)]),
+        'topics': sa.select([sa.func.count()]).select_from(
+            visible_topics.alias()
+        ),
+        'posts': sa.select([sa.func.count(posts.c.id)]).where(
+            posts.c.topic_id.in_(visible_topics)
+        ).where(posts.c.hidden != True),
+        'newest_user_id': sa.select([sa.func.max(users.c.id)])
+    }
+    rows = [
+        {'key': key, 'value': connection.execute(select).scalar() or 0}
+        for key, select in stats.items() if key not in existing
+    ]
+    if rows:
+        op.bulk_insert(board_statistics, rows)
+
+
+def downgrade():
+    # the rows don't change the schema, hence they are kept
+    pass
@@ -1,7 +1,8 @@
 from flask import _request_ctx_stack, url_for
 
+from flaskbb.extensions import db
 from flaskbb.forum import utils
-from flaskbb.forum.models import Forum
+from flaskbb.forum.models import Forum, Post, Topic
 from flaskbb.user.models import Group
 
 
@@ -30,3 +31,54 @@ class TestForceLoginHelpers(object):
 
         # use in rather than == because it can contain query params as well
         assert url_for(application.config["LOGIN_VIEW"]) in result.headers["Location"]
+
+
+class TestTopicViewBuffer(object):
+    def test_views_are_buffered(self, topic, application):
+        application.config["TOPIC_VIEWS_FLUSH_INTERVAL"] = 3600
+        views = topic.views
+
+        utils.count_topic_view(topic.id)
+        utils.count_topic_view(topic.id)
+
+        assert Topic.query.with_entities(Topic.views).\
+            filter_by(id=topic.id).scalar() == views
+        assert utils.flush_topic_views() == 1
+        assert Topic.query.with_entities(Topic.views).\
+            filter_by(id=topic.id).scalar() == views + 2
+        assert utils.flush_topic_views() == 0
+
+    def test_views_are_flushed_after_interval(self, topic, application):
+        application.config["TOPIC_VIEWS_FLUSH_INTERVAL"] = 0
+        views = topic.views
+
+        utils.count_topic_view(topic.id)
+
+        assert Topic.query.with_entities(Topic.views).\
+            filter_by(id=topic.id).scalar() == views + 1
+
+
+class TestVerifyPostCounts(object):
+    def test_counters_are_consistent(self, topic, moderator_user):
+        post = Post(content="Test Content")
+        post.save(moderator_user, topic)
+        post.hide(moderator_user)
+
+        assert utils.verify_post_counts() == {
+            "user_posts": 0, "topic_posts": 0,
+            "forum_posts": 0, "forum_topics": 0
+        }
+
+    def test_fixes_drifted_counters(self, topic, user):
+        user.post_count = 10
+        topic.forum.topic_count = 5
+        db.session.commit()
+
+        wrong = utils.verify_post_counts(fix=True)
+
+        assert wrong["user_posts"] == 1
+        assert wrong["forum_topics"] == 1
+        db.session.expire_all()
+        assert user.post_count == 1
+        assert topic.forum.topic_count == 1
+        assert utils.verify_post_counts()["user_posts"] == 0
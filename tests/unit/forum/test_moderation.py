@@ -0,0 +1,118 @@
+from flaskbb.extensions import db
+from flaskbb.forum.models import Forum, Post, Report, Topic
+from flaskbb.forum.moderation import TopicModerator
+from flaskbb.forum.utils import verify_post_counts
+from flaskbb.management.models import BoardStatistic
+
+
+def create_topics(forum, user, amount):
+    topics = []
+    for i in range(amount):
+        topic = Topic(title="Topic {}".format(i))
+        topic.save(forum=forum, user=user, post=Post(content="First post"))
+        Post(content="Reply").save(user, topic)
+        topics.append(topic)
+    return topics
+
+
+def assert_consistent_counters():
+    assert verify_post_counts() == {
+        "user_posts": 0, "topic_posts": 0,
+        "forum_posts": 0, "forum_topics": 0
+    }
+
+
+class TestTopicModerator(object):
+    def test_set_flag(self, forum, user):
+        topics = create_topics(forum, user, 3)
+        topics[0].locked = True
+        db.session.commit()
+        moderator = TopicModerator(db)
+
+        changed = moderator.set_flag(
+            forum, [topic.id for topic in topics], "locked", True
+        )
+
+        assert changed == 2
+        assert Topic.query.filter_by(locked=True).count() == 3
+
+    def test_ignores_topics_of_other_forums(self, forum, category, user):
+        other_forum = Forum(title="Other", category_id=category.id).save()
+        topic = create_topics(other_forum, user, 1)[0]
+
+        changed = TopicModerator(db).set_flag(
+            forum, [topic.id], "important", True
+        )
+
+        assert changed == 0
+        db.session.expire_all()
+        assert not topic.important
+
+    def test_hide_and_unhide(self, forum, user, moderator_user):
+        topics = create_topics(forum, user, 3)
+        ids = [topic.id for topic in topics[:2]]
+        moderator = TopicModerator(db)
+
+        assert moderator.hide(forum, ids, moderator_user) == 2
+        db.session.expire_all()
+        assert forum.topic_count == 1
+        assert forum.post_count == 2
+        assert user.post_count == 2
+        assert forum.last_post_id == topics[2].last_post_id
+        assert all(topic.hidden and topic.first_post.hidden
+                   for topic in topics[:2])
+        assert_consistent_counters()
+
+        # hiding them again doesn't change anything
+        assert moderator.hide(forum, ids, moderator_user) == 0
+
+        assert moderator.unhide(forum, ids) == 2
+        db.session.expire_all()
+        assert forum.topic_count == 3
+        assert forum.post_count == 6
+        assert user.post_count == 6
+        assert not any(topic.hidden or topic.first_post.hidden
+                       for topic in topics)
+        assert_consistent_counters()
+
+    def test_delete(self, forum, user, moderator_user):
+        topics = create_topics(forum, user, 3)
+        last_post_id = topics[0].last_post_id
+        Report(reason="Spam").save(post=topics[1].first_post, user=user)
+        topics[1].hide(moderator_user)
+        ids = [topic.id for topic in topics[1:]]
+        posts = BoardStatistic.as_dict()["posts"]
+
+        assert TopicModerator(db).delete(forum, ids) == 2
+
+        db.session.expire_all()
+        assert Topic.query.count() == 1
+        assert Post.query.count() == 2
+        assert Report.query.count() == 0
+        assert forum.topic_count == 1
+        assert forum.post_count == 2
+        assert forum.last_post_id == last_post_id
+        assert user.post_count == 2
+        assert BoardStatistic.as_dict()["posts"] == posts - 2
+        assert_consistent_counters()
+
+    def test_move(self, forum, category, user):
+        topics = create_topics(forum, user, 2)
+        other_forum = Forum(title="Other", category_id=category.id).save()
+        other_topic = create_topics(other_forum, user, 1)[0]
+        new_forum = Forum(title="New", category_id=category.id).save()
+        ids = [topics[0].id, other_topic.id]
+
+        assert TopicModerator(db).move(forum, ids, new_forum)
+
+        db.session.expire_all()
+        assert topics[0].forum_id == new_forum.id
+        assert topics[1].forum_id == forum.id
+        # the topic of another forum is ignored
+        assert other_topic.forum_id == other_forum.id
+        assert new_forum.topic_count == 1
+        assert forum.topic_count == 1
+        assert_consistent_counters()
+
+        assert not TopicModerator(db).move(forum, [other_topic.id],
+                                           new_forum)
@@ -0,0 +1,237 @@
+from datetime import datetime, timedelta
+
+import pytest
+from pytz import UTC
+from sqlalchemy import event
+
+from flaskbb.extensions import db
+from flaskbb.forum.models import (Forum, ForumsRead, Post, ReadMarks, Topic,
+                                  TopicsRead)
+from flaskbb.forum.tracking import (ReadMarksTracker, TopicsReadTracker,
+                                    decode_marks, encode_marks,
+                                    get_read_tracker, mark_forums_read,
+                                    prune_read_trackers)
+from flaskbb.utils.helpers import time_utcnow, topic_is_unread
+
+
+@pytest.fixture(params=["topicsread", "readmarks"])
+def tracker(request, application):
+    application.config["READ_TRACKER"] = request.param
+    return get_read_tracker()
+
+
+def view_topic(topic, user):
+    forumsread = ForumsRead.query.filter_by(
+        user_id=user.id, forum_id=topic.forum_id
+    ).first()
+    return topic.update_read(user, topic.forum, forumsread)
+
+
+def test_marks_are_encoded_sorted_and_exact():
+    marks = {
+        12: datetime(2018, 8, 14, 10, 0, 0, 123456, tzinfo=UTC),
+        3: datetime(2018, 8, 13, 9, 30, 0, 1, tzinfo=UTC)
+    }
+
+    encoded = encode_marks(marks)
+
+    assert encoded.startswith("3:")
+    assert decode_marks(encoded) == marks
+    assert decode_marks("") == {}
+
+
+def test_get_read_tracker_uses_config(application):
+    application.config["READ_TRACKER"] = "readmarks"
+    assert isinstance(get_read_tracker(), ReadMarksTracker)
+
+    application.config["READ_TRACKER"] = "topicsread"
+    assert isinstance(get_read_tracker(), TopicsReadTracker)
+
+
+class TestReadTrackers(object):
+    def test_new_post_makes_topic_unread(self, tracker, topic, user):
+        assert tracker.get(user, topic) is None
+
+        view_topic(topic, user)
+        assert not topic_is_unread(topic, tracker.get(user, topic), user)
+
+        Post(content="Reply").save(user, topic)
+        assert topic_is_unread(topic, tracker.get(user, topic), user)
+
+        view_topic(topic, user)
+        assert not topic_is_unread(topic, tracker.get(user, topic), user)
+
+    def test_forum_is_read_after_all_topics(
+        self, tracker, topic, topic_moderator, user
+    ):
+        view_topic(topic, user)
+
+        assert tracker.unread_count(user, topic.forum, topic.date_created) == 1
+        assert ForumsRead.query.filter_by(user_id=user.id).count() == 0
+
+        view_topic(topic_moderator, user)
+
+        assert ForumsRead.query.filter_by(user_id=user.id).count() == 1
+        reads = tracker.get_many(user, [topic, topic_moderator])
+        assert set(reads) == {topic.id, topic_moderator.id}
+
+    def test_clear(self, tracker, topic, user):
+        view_topic(topic, user)
+        ForumsRead.query.delete()
+
+        tracker.clear(user, forum_id=topic.forum_id)
+
+        assert tracker.get(user, topic) is None
+
+    def test_move_topics_keeps_read_state(
+        self, tracker, topic, topic_moderator, user
+    ):
+        view_topic(topic, user)
+        forum_other = Forum(title="Test Forum 2", category_id=1).save()
+
+        forum_other.move_topics_to([topic])
+
+        assert tracker.get(user, topic) is not None
+        assert tracker.get(user, topic_moderator) is None
+
+    def test_get_topics_returns_read_state(self, tracker, topic, user):
+        view_topic(topic, user)
+
+        topics = Forum.get_topics(topic.forum_id, user)
+
+        assert [(item.id, read is not None)
+                for item, read in topics.items] == [(topic.id, True)]
+
+
+class TestReadMarksTracker(object):
+    def test_marks_are_compacted_once_the_forum_is_read(
+        self, application, topic, topic_moderator, user
+    ):
+        application.config["READ_TRACKER"] = "readmarks"
+
+        view_topic(topic, user)
+        marks = ReadMarks.query.filter_by(user_id=user.id).one()
+        assert list(decode_marks(marks.marks)) == [topic.id]
+
+        view_topic(topic_moderator, user)
+        assert marks.marks == ""
+
+        # the forumsread tracker acts as the watermark
+        read = get_read_tracker().get(user, topic)
+        assert read.last_read == ForumsRead.query.one().last_read
+
+        # no new posts, hence nothing has to be stored
+        assert not view_topic(Topic.query.get(topic.id), user)
+        assert marks.marks == ""
+
+    @pytest.mark.parametrize("exists", [True, False])
+    def test_concurrent_marks_are_kept(
+        self, application, topic, topic_moderator, user, mocker, exists
+    ):
+        application.config["READ_TRACKER"] = "readmarks"
+        tracker = get_read_tracker()
+        if exists:
+            tracker.mark_read(user, topic_moderator, None)
+        replace_marks = tracker._replace_marks
+        read_at = time_utcnow()
+
+        def concurrent_request(user_id, forum_id, old, new):
+            # the other topic is marked as read in the meantime
+            ReadMarks.query.delete()
+            ReadMarks.create(user_id=user_id, forum_id=forum_id,
+                             marks=encode_marks({topic_moderator.id: read_at}))
+            mocker.stopall()
+            return replace_marks(user_id, forum_id, old, new)
+
+        mocker.patch.object(tracker, "_replace_marks",
+                            side_effect=concurrent_request)
+
+        tracker.mark_read(user, topic, None)
+
+        marks = decode_marks(ReadMarks.query.one().marks)
+        assert sorted(marks) == sorted([topic.id, topic_moderator.id])
+        assert marks[topic_moderator.id] == read_at
+
+
+def test_topicsread_is_loaded_once(application, topic, user):
+    application.config["READ_TRACKER"] = "topicsread"
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        if "FROM topicsread" in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        view_topic(topic, user)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+
+    assert len(statements) == 1
+
+
+class TestMarkForumsRead(object):
+    def test_mark_all_forums_read(self, tracker, topic, category, user):
+        view_topic(topic, user)
+        other = Forum(title="Other", category_id=category.id).save()
+
+        mark_forums_read(user)
+
+        rows = ForumsRead.query.filter_by(user_id=user.id).all()
+        assert {row.forum_id for row in rows} == {topic.forum_id, other.id}
+        assert all(row.cleared is not None for row in rows)
+        assert TopicsRead.query.count() == 0
+        assert ReadMarks.query.count() == 0
+        assert not topic_is_unread(topic, tracker.get(user, topic), user,
+                                   rows[0])
+
+    def test_mark_single_forum_read(self, tracker, topic, category, user):
+        other = Forum(title="Other", category_id=category.id).save()
+
+        mark_forums_read(user, forum_id=other.id)
+        mark_forums_read(user, forum_id=other.id)
+
+        assert [row.forum_id for row in ForumsRead.query.all()] == [other.id]
+
+
+class TestPruneReadTrackers(object):
+    def test_removes_expired_trackers(self, topic, user, default_settings):
+        expired = time_utcnow() - timedelta(days=30)
+        db.session.add_all([
+            TopicsRead(user_id=user.id, topic_id=topic.id,
+                       forum_id=topic.forum_id, last_read=expired),
+            ForumsRead(user_id=user.id, forum_id=topic.forum_id,
+                       last_read=expired, cleared=expired),
+            ReadMarks(user_id=user.id, forum_id=topic.forum_id,
+                      marks=encode_marks({topic.id: expired}))
+        ])
+        db.session.commit()
+
+        removed = prune_read_trackers(batch_size=1)
+
+        assert removed["topicsread"] == 1
+        assert removed["forumsread"] == 1
+        assert removed["readmarks"] == 1
+        assert "seconds" in removed
+        assert TopicsRead.query.count() == 0
+        assert ForumsRead.query.count() == 0
+        assert ReadMarks.query.count() == 0
+
+    def test_collapses_read_forums(
+        self, topic, topic_moderator, user, default_settings
+    ):
+        view_topic(topic, user)
+
+        # there is still an unread topic
+        assert prune_read_trackers()["collapsed"] == 0
+
+        view_topic(topic_moderator, user)
+
+        assert prune_read_trackers()["collapsed"] == 2
+        assert TopicsRead.query.count() == 0
+        forumsread = ForumsRead.query.one()
+        assert forumsread.cleared is not None
+        assert not topic_is_unread(topic, None, user, forumsread)
+
+        Post(content="Reply").save(user, topic)
+        assert topic_is_unread(topic, None, user, forumsread)
@@ -0,0 +1,88 @@
+from flaskbb.forum.models import Forum, Post, Topic
+from flaskbb.management.models import BoardStatistic
+from flaskbb.user.models import User
+
+
+def test_statistics_are_created_with_the_table(topic):
+    stats = BoardStatistic.as_dict()
+
+    assert stats["users"] == User.query.count()
+    assert stats["topics"] == 1
+    assert stats["posts"] == 1
+    assert stats["newest_user_id"] == topic.user_id
+    assert stats == BoardStatistic.reconcile()
+
+
+def test_missing_statistics_arent_counted(topic):
+    BoardStatistic.query.delete()
+
+    assert BoardStatistic.as_dict() == dict.fromkeys(BoardStatistic.keys, 0)
+    assert BoardStatistic.query.count() == 0
+
+
+def test_statistics_follow_posts_and_topics(forum, user, moderator_user):
+    BoardStatistic.reconcile()
+
+    topic = Topic(title="Test Topic")
+    topic.save(forum=forum, user=user, post=Post(content="First Post"))
+    post = Post(content="Reply")
+    post.save(topic=topic, user=user)
+    assert BoardStatistic.as_dict()["topics"] == 1
+    assert BoardStatistic.as_dict()["posts"] == 2
+
+    post.hide(moderator_user)
+    assert BoardStatistic.as_dict()["posts"] == 1
+    post.unhide()
+    assert BoardStatistic.as_dict()["posts"] == 2
+
+    topic.hide(moderator_user)
+    assert BoardStatistic.as_dict()["topics"] == 0
+    assert BoardStatistic.as_dict()["posts"] == 0
+    topic.unhide()
+    assert BoardStatistic.as_dict()["topics"] == 1
+    assert BoardStatistic.as_dict()["posts"] == 2
+
+    post.delete()
+    assert BoardStatistic.as_dict()["posts"] == 1
+    topic.delete()
+    assert BoardStatistic.as_dict()["topics"] == 0
+    assert BoardStatistic.as_dict()["posts"] == 0
+
+    assert BoardStatistic.as_dict() == BoardStatistic.reconcile()
+
+
+def test_statistics_follow_users(user):
+    BoardStatistic.reconcile()
+    users = BoardStatistic.as_dict()["users"]
+
+    new_user = User(username="new_user", email="new_user@example.org",
+                    password="test", primary_group=user.primary_group)
+    new_user.save()
+    assert BoardStatistic.as_dict()["users"] == users + 1
+    assert BoardStatistic.as_dict()["newest_user_id"] == new_user.id
+
+    new_user.delete()
+    assert BoardStatistic.as_dict()["users"] == users
+    assert BoardStatistic.as_dict()["newest_user_id"] == user.id
+
+
+def test_statistics_follow_forums_and_categories(topic, user, forum,
+                                                 category, moderator_user):
+    hidden = Topic(title="Hidden")
+    hidden.save(forum=forum, user=user, post=Post(content="Hidden"))
+    hidden.hide(moderator_user)
+    other = Forum(title="Other", category_id=category.id)
+    other.save()
+    Post(content="Reply").save(topic=topic, user=user)
+    Topic(title="Other").save(forum=other, user=user, post=Post(content="A"))
+    assert BoardStatistic.as_dict()["topics"] == 2
+    assert BoardStatistic.as_dict()["posts"] == 3
+
+    forum.delete()
+    assert BoardStatistic.as_dict()["topics"] == 1
+    assert BoardStatistic.as_dict()["posts"] == 1
+
+    category.delete()
+    assert BoardStatistic.as_dict()["topics"] == 0
+    assert BoardStatistic.as_dict()["posts"] == 0
+    assert BoardStatistic.as_dict() == BoardStatistic.reconcile()
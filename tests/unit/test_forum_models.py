@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from flask import current_app
 from flask_login import login_user, current_user, logout_user
@@ -122,6 +122,30 @@ def test_category_get_all(forum, user):
         assert categories == [(category, [(forum, None)])]
 
 
+def test_category_get_all_cached_tree_is_invalidated(forum, user):
+    category = forum.category
+
+    with current_app.test_request_context():
+        login_user(user)
+        assert Category.get_all(current_user) == [(category, [(forum, None)])]
+
+        # the cached tree is invalidated by saving a new forum
+        new_forum = Forum(title="New Forum", category=category, position=2)
+        new_forum.save()
+        assert Category.get_all(current_user) == \
+            [(category, [(forum, None), (new_forum, None)])]
+
+        # the forumsread objects are not cached
+        forumsread = ForumsRead(user_id=user.id, forum_id=forum.id,
+                                last_read=datetime.utcnow())
+        forumsread.save()
+        assert Category.get_all(current_user) == \
+            [(category, [(forum, forumsread), (new_forum, None)])]
+
+        category.delete()
+        assert Category.get_all(current_user) == []
+
+
 def test_forum_save(category, moderator_user):
     """Test the save forum method"""
     forum = Forum(title="Test Forum", category_id=category.id)
@@ -281,14 +305,89 @@ def test_forum_get_topics(topic, user):
 
         topics = Forum.get_topics(forum_id=forum.id, user=current_user)
 
-        assert topics.items == [(topic, topic.last_post, None)]
+        assert topics.items == [(topic, None)]
 
         # Test with logged out user
         logout_user()
 
         topics = Forum.get_topics(forum_id=forum.id, user=current_user)
 
-        assert topics.items == [(topic, topic.last_post, None)]
+        assert topics.items == [(topic, None)]
+
+
+def test_forum_get_topics_keyset(forum, user):
+    topics = []
+    for i in range(5):
+        topic = Topic(title="Test Topic {}".format(i))
+        topic.save(forum=forum, post=Post(content="Test Content"), user=user)
+        topics.append(topic)
+    topics[1].important = True
+    topics[1].save()
+
+    with current_app.test_request_context():
+        login_user(user)
+
+        def ids(page, **kwargs):
+            pagination = Forum.get_topics(forum_id=forum.id, user=current_user,
+                                          page=page, per_page=2, **kwargs)
+            return [item[0].id for item in pagination.items], pagination
+
+        first, pagination = ids(1)
+        assert pagination.total == 5
+        assert pagination.pages == 3
+        assert pagination.cursor_for(2) == "&after={}".format(first[-1])
+
+        second_by_offset, _ = ids(2)
+        second, pagination = ids(2, after=first[-1])
+        assert second == second_by_offset
+        assert second[0] not in first
+
+        previous, _ = ids(1, before=second[0])
+        assert previous == first
+
+        third, _ = ids(3, after=second[-1])
+        assert len(third) == 1
+        assert sorted(first + second + third) == sorted(t.id for t in topics)
+        # the important topic comes first
+        assert first[0] == topics[1].id
+
+
+def test_forum_get_topics_first_unread_posts(forum, user):
+    read_topic = Topic(title="Read Topic")
+    read_topic.save(forum=forum, post=Post(content="Test Content"), user=user)
+    unread_topic = Topic(title="Unread Topic")
+    unread_topic.save(forum=forum, post=Post(content="Test Content"),
+                      user=user)
+
+    last_read = read_topic.first_post.date_created + timedelta(seconds=1)
+    new_post = Post(content="New Content")
+    new_post.save(user=user, topic=read_topic)
+    new_post.date_created = last_read + timedelta(seconds=1)
+    new_post.save()
+    read_topic.last_updated = new_post.date_created
+    read_topic.save()
+
+    topicsread = TopicsRead()
+    topicsread.user_id = user.id
+    topicsread.topic_id = read_topic.id
+    topicsread.forum_id = forum.id
+    topicsread.last_read = last_read
+    topicsread.save()
+
+    with current_app.test_request_context():
+        login_user(user)
+        topics = Forum.get_topics(forum_id=forum.id, user=current_user)
+
+        assert topics.first_unread_posts == {
+            read_topic.id: new_post.id,
+            unread_topic.id: unread_topic.first_post_id
+        }
+        assert read_topic.first_unread(topicsread, current_user) == \
+            new_post.url
+
+        logout_user()
+        topics = Forum.get_topics(forum_id=forum.id, user=current_user)
+        assert topics.first_unread_posts == {}
 
 
 def test_topic_save(forum, user):
@@ -338,6 +437,30 @@ def test_topic_delete(topic):
     assert forum.last_post_id is None
 
 
+def test_topic_last_post_columns(topic, moderator_user):
+    first_post = topic.first_post
+    assert topic.last_post_user_id == first_post.user_id
+    assert topic.last_post_username == first_post.username
+    assert topic.last_post_created == first_post.date_created
+
+    post = Post(content="Test Content Moderator")
+    post.save(topic=topic, user=moderator_user)
+    assert topic.last_post_user_id == moderator_user.id
+    assert topic.last_post_username == moderator_user.username
+    assert topic.last_post_created == post.date_created
+
+    post.hide(moderator_user)
+    assert topic.last_post_username == first_post.username
+
+    post.unhide()
+    assert topic.last_post_username == moderator_user.username
+
+    post.delete()
+    assert topic.last_post_user_id == first_post.user_id
+    assert topic.last_post_username == first_post.username
+    assert topic.last_post_created == first_post.date_created
+
+
 def test_topic_move(topic):
     """Tests the topic move method."""
     forum_other = Forum(title="Test Forum 2", category_id=1)
@@ -356,6 +479,36 @@ def test_topic_move(topic):
     assert forum_other.last_post_id == topic.last_post_id
     assert forum_other.topic_count == 1
     assert forum_other.post_count == 1
+    assert forum_other.last_post_username == topic.last_post_username
+
+
+def test_forum_move_topics_to(topic, topic_moderator, user, moderator_user):
+    """Moves several topics at once and keeps the read trackers."""
+    forum_old = topic.forum
+    forum_other = Forum(title="Test Forum 2", category_id=1)
+    forum_other.save()
+    Post(content="Reply").save(user, topic)
+    topic_moderator.hide(moderator_user)
+    TopicsRead(user_id=user.id, topic_id=topic.id,
+               forum_id=forum_old.id).save()
+
+    assert forum_other.move_topics_to([topic, topic_moderator])
+
+    assert forum_old.topics.count() == 0
+    assert forum_old.topic_count == 0
+    assert forum_old.post_count == 0
+    assert forum_old.last_post_id is None
+
+    # the hidden topic isn't counted
+    assert forum_other.topics.count() == 2
+    assert forum_other.topic_count == 1
+    assert forum_other.post_count == 2
+    assert forum_other.last_post_id == topic.last_post_id
+    assert TopicsRead.query.filter_by(topic_id=topic.id).one().forum_id == \
+        forum_other.id
+
+    # topics which are already in the forum are skipped
+    assert not forum_other.move_topics_to([topic])
 
 
 def test_topic_move_same_forum(topic):
@@ -545,6 +698,38 @@ def test_post_delete(topic):
     assert topic.forum.last_post_id == topic.last_post_id
 
 
+def test_topic_second_last_post_does_not_load_thread(database, topic):
+    # a megathread with 100k replies
+    database.session.execute(Post.__table__.insert(), [
+        {"topic_id": topic.id, "user_id": topic.user_id,
+         "username": topic.username, "content": "Reply {}".format(i),
+         "date_created": datetime.utcnow()}
+        for i in range(100000)
+    ])
+    database.session.commit()
+    last_id, second_last_id = [
+        post_id for post_id, in database.session.query(Post.id).
+        filter(Post.topic_id == topic.id).
+        order_by(Post.id.desc()).limit(2)
+    ]
+
+    def loaded_posts():
+        return sum(1 for obj in database.session.identity_map.values()
+                   if isinstance(obj, Post))
+
+    database.session.expunge_all()
+    topic = Topic.query.get(topic.id)
+    assert topic.second_last_post == second_last_id
+    assert loaded_posts() == 0
+
+    # deleting the last post of the megathread must not load the thread
+    topic.last_post_id = last_id
+    database.session.commit()
+    Post.query.get(last_id).delete()
+    assert topic.last_post_id == second_last_id
+    assert loaded_posts() < 10
+
+
 def test_report(topic, user):
     """Tests if the reports can be saved/edited and deleted with the
     implemented save and delete methods."""
@@ -639,6 +824,38 @@ def test_hiding_first_post_hides_topic(forum, topic, user):
     assert forum.last_post == topic.last_post
 
 
+def test_hiding_topic_updates_post_counts(forum, topic, user,
+                                          moderator_user):
+    for i in range(3):
+        Post(content="Test Content {}".format(i)).save(moderator_user, topic)
+    hidden_post = Post(content="Hidden Content")
+    hidden_post.save(moderator_user, topic)
+    hidden_post.hide(moderator_user)
+
+    assert user.post_count == 1
+    assert moderator_user.post_count == 3
+    assert forum.post_count == 4
+    assert forum.topic_count == 1
+
+    topic.hide(moderator_user)
+    assert user.post_count == 0
+    assert moderator_user.post_count == 0
+    assert forum.post_count == 0
+    assert forum.topic_count == 0
+
+    topic.unhide()
+    assert user.post_count == 1
+    assert moderator_user.post_count == 3
+    assert forum.post_count == 4
+    assert forum.topic_count == 1
+
+    topic.delete()
+    assert user.post_count == 0
+    assert moderator_user.post_count == 0
+    assert forum.post_count == 0
+    assert forum.topic_count == 0
+
+
 def test_retrieving_hidden_posts(topic, user):
     new_post = Post(content='stuff')
     new_post.save(user, topic)
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from flask import current_app
+
+from flaskbb.user.utils import AuthorBundle
+from flaskbb.utils.helpers import time_utcnow
+
+
+class TestAuthorBundle(object):
+    def test_loads_groups_and_permissions(self, user, moderator_user,
+                                          default_groups):
+        user.add_to_group(default_groups[2])
+        user.save()
+
+        authors = AuthorBundle([user, moderator_user, None])
+
+        assert set(authors.users) == {user.id, moderator_user.id}
+        assert authors.groups[user.id] == [
+            default_groups[3], default_groups[2]
+        ]
+        assert authors.permissions[user.id] == user.get_permissions()
+        assert authors.permissions[user.id]["mod"]
+        assert not authors.permissions[user.id]["admin"]
+
+    def test_seeds_request_permissions(self, user, moderator_user):
+        with current_app.test_request_context():
+            authors = AuthorBundle([user, moderator_user])
+            assert user.permissions is authors.permissions[user.id]
+
+    def test_online_status(self, user, moderator_user):
+        user.lastseen = time_utcnow()
+        moderator_user.lastseen = time_utcnow() - timedelta(days=1)
+
+        authors = AuthorBundle([user, moderator_user])
+
+        assert authors.is_online(user)
+        assert not authors.is_online(moderator_user)
@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from flaskbb.user import utils
+from flaskbb.user.models import User
+from flaskbb.utils.helpers import time_utcnow
+
+
+def stored_lastseen(user):
+    return User.query.with_entities(User.lastseen).\
+        filter_by(id=user.id).scalar()
+
+
+class TestLastseen(object):
+    def test_recent_lastseen_is_not_touched(self, user, application):
+        application.config["LASTSEEN_GRANULARITY"] = 3600
+        user.lastseen = time_utcnow()
+        user.save()
+
+        utils.touch_lastseen(user)
+
+        assert utils.flush_lastseen() == 0
+
+    def test_stale_lastseen_is_buffered(self, user, application):
+        application.config["LASTSEEN_GRANULARITY"] = 3600
+        stale = time_utcnow() - timedelta(hours=2)
+        user.lastseen = stale
+        user.save()
+
+        utils.touch_lastseen(user)
+
+        assert stored_lastseen(user) < stale + timedelta(hours=1)
+        assert utils.flush_lastseen() == 1
+        assert stored_lastseen(user) > stale + timedelta(hours=1)
+
+    def test_lastseen_is_flushed_after_granularity(self, user, application):
+        application.config["LASTSEEN_GRANULARITY"] = 0
+        stale = time_utcnow() - timedelta(hours=2)
+        user.lastseen = stale
+        user.save()
+
+        utils.touch_lastseen(user)
+
+        assert stored_lastseen(user) > stale + timedelta(hours=1)
@@ -0,0 +1,36 @@
+from flaskbb.utils.buffers import LocalBuffer, get_buffer
+
+
+def test_local_buffer_incr_and_drain():
+    buffer = LocalBuffer("test")
+    buffer.incr(1)
+    buffer.incr(1)
+    buffer.incr(2, 5)
+
+    assert len(buffer) == 2
+    assert buffer.drain() == {1: 2, 2: 5}
+    assert len(buffer) == 0
+    assert buffer.drain() == {}
+
+
+def test_local_buffer_set_replaces_value():
+    buffer = LocalBuffer("test")
+    buffer.set(1, 10)
+    buffer.set(1, 20)
+
+    assert buffer.drain() == {1: 20}
+
+
+def test_buffer_is_due_once_per_interval():
+    buffer = LocalBuffer("test")
+
+    assert not buffer.due(60)
+    assert buffer.due(0)
+    assert not buffer.due(60)
+
+
+def test_get_buffer_without_redis(application):
+    buffer = get_buffer("test")
+
+    assert isinstance(buffer, LocalBuffer)
+    assert get_buffer("test") is buffer
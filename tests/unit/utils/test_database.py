@@ -0,0 +1,111 @@
+from datetime import datetime
+
+import pytest
+from flask import current_app
+from flask_login import login_user
+from pytz import UTC
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql, postgresql
+
+from flaskbb.extensions import db
+from flaskbb.forum.models import Forum, ForumsRead, Topic
+from flaskbb.utils.database import (UTCDateTime, _upsert_statements,
+                                    get_entity, has_view_hidden,
+                                    upsert_from_select)
+
+
+def count_queries(func):
+    statements = []
+
+    def before_cursor_execute(*args):
+        statements.append(args[2])
+
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        result = func()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return result, len(statements)
+
+
+def test_get_entity_is_loaded_once_per_request(topic):
+    topic_id = topic.id
+    db.session.expunge_all()
+
+    with current_app.test_request_context():
+        # load the permissions of the current user up front
+        has_view_hidden()
+
+        first, queries = count_queries(lambda: get_entity(Topic, topic_id))
+        assert first.id == topic_id
+        assert queries == 1
+
+        second, queries = count_queries(lambda: get_entity(Topic, topic_id))
+        assert second is first
+        assert queries == 0
+
+        missing, queries = count_queries(lambda: get_entity(Topic, 42))
+        assert missing is None
+        missing, queries = count_queries(lambda: get_entity(Topic, 42))
+        assert missing is None
+        assert queries == 0
+
+
+def test_get_entity_respects_hidden(topic, user, moderator_user):
+    topic.hide(moderator_user)
+
+    with current_app.test_request_context():
+        login_user(user)
+        assert get_entity(Topic, topic.id) is None
+
+    with current_app.test_request_context():
+        login_user(moderator_user)
+        assert get_entity(Topic, topic.id) == topic
+
+
+def forumsread_select(user_id, last_read):
+    return db.select([
+        db.literal(user_id).label("user_id"),
+        Forum.id.label("forum_id"),
+        db.literal(last_read, UTCDateTime(timezone=True)).label("last_read")
+    ])
+
+
+def test_upsert_from_select(forum, category, user):
+    other = Forum(title="Other", category_id=category.id).save()
+    ForumsRead(user_id=user.id, forum_id=forum.id,
+               last_read=datetime(2018, 1, 1, tzinfo=UTC)).save()
+    last_read = datetime(2018, 8, 1, tzinfo=UTC)
+    select = forumsread_select(user.id, last_read)
+
+    _, count = count_queries(lambda: upsert_from_select(
+        ForumsRead.__table__, ["user_id", "forum_id", "last_read"],
+        select, keys=["user_id", "forum_id"]
+    ))
+    db.session.commit()
+
+    assert count == 1
+    rows = ForumsRead.query.order_by(ForumsRead.forum_id).all()
+    assert [(row.forum_id, row.last_read) for row in rows] == [
+        (forum.id, last_read), (other.id, last_read)
+    ]
+
+
+@pytest.mark.parametrize("dialect, expected", [
+    (postgresql.dialect(), "ON CONFLICT (user_id, forum_id) DO UPDATE"),
+    (mysql.dialect(), "ON DUPLICATE KEY UPDATE"),
+])
+def test_upsert_statements(dialect, expected, database):
+    statements = _upsert_statements(
+        dialect.name, ForumsRead.__table__,
+        ["user_id", "forum_id", "last_read"],
+        forumsread_select(1, datetime(2018, 8, 1, tzinfo=UTC)),
+        keys=["user_id", "forum_id"]
+    )
+
+    assert len(statements) == 1
+    sql = str(statements[0].compile(dialect=dialect))
+    assert sql.startswith("INSERT INTO forumsread")
+    assert "SELECT" in sql
+    assert expected in sql
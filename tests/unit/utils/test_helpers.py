@@ -1,21 +1,32 @@
 # -*- coding: utf-8 -*-
 import datetime as dt
 
+from pytz import UTC
+
 from flaskbb.forum.models import Forum
 from flaskbb.utils.helpers import (
     check_image,
     crop_title,
     format_quote,
     forum_is_unread,
+    from_microseconds,
     get_image_info,
     is_online,
     slugify,
     time_utcnow,
+    to_microseconds,
     topic_is_unread,
 )
 from flaskbb.utils.settings import flaskbb_config
 
 
+def test_microseconds_since_the_epoch():
+    value = dt.datetime(2018, 8, 13, 9, 30, 0, 1, tzinfo=UTC)
+
+    assert to_microseconds(value) == 1534152600000001
+    assert from_microseconds(to_microseconds(value)) == value
+
+
 def test_slugify():
     """Test the slugify helper method."""
     assert slugify(u"Hello world") == u"hello-world"
@@ -1,4 +1,8 @@
-from flaskbb.markup import FlaskBBRenderer, make_renderer
+from flask import current_app
+
+from flaskbb.markup import (FlaskBBRenderer, RenderCache, _post_stamp,
+                            make_post_renderer, make_renderer)
+from flaskbb.utils.helpers import time_utcnow
 
 markdown = make_renderer([FlaskBBRenderer])
 
@@ -33,3 +37,71 @@ print("Hello World")
     bad_language_render = markdown(bad_language)
     assert "<pre>" in bad_language_render
     assert "highlight" not in bad_language_render
+
+
+def test_render_cache_evicts_least_recently_used():
+    render_cache = RenderCache(maxsize=2)
+    render_cache.set("a", "<p>a</p>")
+    render_cache.set("b", "<p>b</p>")
+
+    # touch 'a' so that 'b' is the least recently used entry
+    assert render_cache.get("a") == "<p>a</p>"
+    render_cache.set("c", "<p>c</p>")
+
+    assert len(render_cache) == 2
+    assert render_cache.get("b") is None
+    assert render_cache.get("a") == "<p>a</p>"
+    assert render_cache.get("c") == "<p>c</p>"
+
+
+def test_render_cache_checks_stamp():
+    render_cache = RenderCache(maxsize=10)
+    render_cache.set("post/1", "<p>old</p>", stamp="2018-01-01")
+
+    assert render_cache.get("post/1", "2018-01-01") == "<p>old</p>"
+    assert render_cache.get("post/1", "2018-01-02") is None
+
+
+def test_render_cache_shared_tier(application):
+    render_cache = RenderCache(maxsize=0, shared=True, key_prefix="test")
+    render_cache.set("text/1", "<p>shared</p>")
+
+    assert len(render_cache) == 0
+    assert render_cache.get("text/1") == "<p>shared</p>"
+
+    render_cache.delete("text/1")
+    assert render_cache.get("text/1") is None
+
+
+def test_post_markup_is_cached_and_invalidated(topic):
+    post_markup = current_app.jinja_env.filters["post_markup"]
+    render_cache = current_app.extensions["markup_cache"]
+    post = topic.first_post
+
+    assert "Test Content Normal" in post_markup(post)
+    assert render_cache.get("post/{}".format(post.id), _post_stamp(post))
+
+    post.content = "Edited Content"
+    post.date_modified = time_utcnow()
+    post.save()
+
+    assert render_cache.get("post/{}".format(post.id), _post_stamp(post)) \
+        is None
+    assert "Edited Content" in post_markup(post)
+
+
+def test_post_content_html_is_persisted(topic, default_settings):
+    current_app.config["PERSIST_POST_HTML"] = True
+    post = topic.first_post
+    post.content = "**Persisted**"
+    post.save()
+
+    assert post.content_html == "<p><strong>Persisted</strong></p>\n"
+
+    post_markup = make_post_renderer(lambda content: "unused", None,
+                                     persisted=True)
+    assert post_markup(post) == post.content_html
+
+    current_app.config["PERSIST_POST_HTML"] = False
+    post.save()
+    assert post.content_html is None
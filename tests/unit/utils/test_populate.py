@@ -6,7 +6,7 @@ from flaskbb.extensions import alembic, db
 from flaskbb.utils.populate import delete_settings_from_fixture, \
     create_settings_from_fixture, update_settings_from_fixture, \
     create_default_groups, create_test_data, insert_bulk_data, \
-    create_welcome_forum, create_user
+    create_welcome_forum, create_user, create_latest_db
 from flaskbb.fixtures.groups import fixture as group_fixture
 from flaskbb.fixtures.settings import fixture as settings_fixture
 from flaskbb.user.models import Group, User
@@ -163,3 +163,16 @@ def test_migrations_upgrade():
     assert len(User.query.all()) == 0
 
     drop_database(db.engine.url)
+
+
+def test_create_latest_db_creates_search_documents(application):
+    application.config["SEARCH_BACKEND"] = "sqlite"
+
+    create_latest_db()
+
+    assert db.engine.dialect.has_table(db.engine, "search_documents")
+    create_default_groups()
+    user = create_user("test", "test", "test@example.org", "admin")
+    assert [object_id for object_id, in db.session.execute(
+        "SELECT object_id FROM search_documents WHERE model = 'User'"
+    )] == [user.id]
@@ -0,0 +1,287 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from flaskbb.extensions import db
+from flaskbb.forum.forms import SearchPageForm
+from flaskbb.forum.models import Forum, Post, Topic
+from flaskbb.forum.moderation import TopicModerator
+from flaskbb.user.models import User
+from flaskbb.utils.search_backends import (PostgreSQLSearchBackend,
+                                           SQLiteSearchBackend,
+                                           WhooshSearchBackend,
+                                           cached_search_page,
+                                           get_search_backend, highlight,
+                                           search_cache_stats,
+                                           search_documents, search_terms)
+
+
+@pytest.fixture
+def sqlite_backend(application, database):
+    application.config["SEARCH_BACKEND"] = "sqlite"
+    backend = get_search_backend()
+    backend.create_table(db.session.connection())
+    db.session.commit()
+    return backend
+
+
+def indexed(model):
+    return sorted(
+        id_ for id_, in db.session.execute(
+            db.select([search_documents.c.object_id]).
+            where(search_documents.c.model == model.__name__)
+        )
+    )
+
+
+def test_get_search_backend_uses_config(application):
+    assert isinstance(get_search_backend(), WhooshSearchBackend)
+
+    application.config["SEARCH_BACKEND"] = "sqlite"
+    assert isinstance(get_search_backend(), SQLiteSearchBackend)
+
+    application.config["SEARCH_BACKEND"] = "postgresql"
+    assert isinstance(get_search_backend(), PostgreSQLSearchBackend)
+
+
+def test_search_terms():
+    assert search_terms(u'"foo" bar* -baz') == [u"foo", u"bar", u"baz"]
+
+
+class TestSQLiteSearchBackend(object):
+    def test_documents_are_kept_up_to_date(self, sqlite_backend, topic,
+                                           user):
+        post = Post(content="A reply about kittens")
+        post.save(user, topic)
+
+        assert sqlite_backend.search(Post, "kitten").all() == [post]
+        assert indexed(Topic) == [topic.id]
+        assert indexed(Forum) == [topic.forum_id]
+        assert indexed(User) == [user.id]
+
+        post.content = "A reply about puppies"
+        post.save()
+        assert sqlite_backend.search(Post, "kitten").all() == []
+        assert sqlite_backend.search(Post, "puppies").all() == [post]
+
+        post.delete()
+        assert post.id not in indexed(Post)
+
+    def test_counters_dont_rewrite_documents(self, sqlite_backend, topic,
+                                             user):
+        db.session.execute(search_documents.update().values(
+            document="unchanged"
+        ))
+        db.session.commit()
+
+        # updates the counters of the topic, the forum and the user
+        Post(content="Reply").save(user, topic)
+        topic.views += 1
+        topic.save()
+
+        assert sorted(
+            (model, document) for model, document in db.session.execute(
+                db.select([search_documents.c.model,
+                           search_documents.c.document]).
+                where(search_documents.c.model != "Post")
+            )
+        ) == [("Forum", "unchanged"), ("Topic", "unchanged"),
+              ("User", "unchanged")]
+
+    def test_topic_contains_its_first_post(self, sqlite_backend, topic):
+        assert sqlite_backend.search(Topic, "Test Content").all() == [topic]
+
+        topic.first_post.content = "Something else"
+        topic.first_post.save()
+        assert sqlite_backend.search(Topic, "content").all() == []
+        assert sqlite_backend.search(Topic, "else").all() == [topic]
+
+    def test_ranking(self, sqlite_backend, topic, user):
+        first = Post(content="apples")
+        first.save(user, topic)
+        second = Post(content="apples and oranges")
+        second.save(user, topic)
+
+        results = sqlite_backend.search(Post, "apples oranges").all()
+
+        assert results == [second, first]
+        assert sqlite_backend.search(Post, "*").all() == []
+
+    def test_search_page_form(self, application, sqlite_backend, topic):
+        with application.test_request_context():
+            form = SearchPageForm(search_query="test",
+                                  search_types=["topic", "user"],
+                                  meta={"csrf": False})
+
+            results = form.get_results(topic.user)
+
+        assert [obj for obj, _ in results["topic"].items] == [topic]
+        assert results["user"].items == [(topic.user, None)]
+
+    def test_search_page(self, sqlite_backend, topic, user):
+        posts = []
+        for i in range(3):
+            post = Post(content=u"<b>kittens</b> number {}".format(i))
+            post.save(user, topic)
+            posts.append(post)
+
+        results = sqlite_backend.search_page(Post, "kittens", 2, 2, user)
+
+        assert results.total == 3
+        assert results.pages == 2
+        [(post, snippet)] = results.items
+        assert post in posts
+        assert u"&lt;b&gt;<mark>kittens</mark>&lt;/b&gt;" in snippet
+
+    def test_search_page_filters_forums(
+        self, sqlite_backend, topic, category, user, guest, default_groups
+    ):
+        secret = Forum(title="Secret kittens", category_id=category.id)
+        secret.save(groups=[default_groups[0]])
+        Topic(title="Secret kittens").save(
+            forum=secret, user=user, post=Post(content="kittens")
+        )
+
+        for model in (Post, Topic, Forum):
+            assert sqlite_backend.search_page(model, "kittens", 1, 10,
+                                              guest).total == 0
+            assert sqlite_backend.search(model, "kittens").count() == 1
+
+    def test_reindex(self, sqlite_backend, topic, user):
+        for i in range(3):
+            Post(content="Reply {}".format(i)).save(user, topic)
+        db.session.execute(search_documents.delete())
+        db.session.commit()
+        progress = []
+
+        sqlite_backend.reindex(
+            batch_size=2, progress=lambda *args: progress.append(args)
+        )
+
+        assert indexed(Post) == [p.id for p in Post.query.order_by(Post.id)]
+        assert (Post, 4, 4) in progress
+
+        db.session.execute(search_documents.delete().where(
+            search_documents.c.object_id > topic.first_post_id
+        ))
+        sqlite_backend.reindex(resume=True)
+        assert len(indexed(Post)) == 4
+
+    def test_sync(self, sqlite_backend, topic, user):
+        reply = Post(content="Reply")
+        reply.save(user, topic)
+        db.session.execute(search_documents.delete().
+                           where(search_documents.c.model == "Post").
+                           where(search_documents.c.object_id == reply.id))
+        db.session.execute(search_documents.insert().values(
+            model="Post", object_id=42, document="deleted"
+        ))
+        db.session.commit()
+
+        stats = sqlite_backend.sync(batch_size=2)
+
+        assert stats["Post"] == {"updated": 1, "deleted": 1}
+        assert stats["Topic"] == {"updated": 0, "deleted": 0}
+        assert indexed(Post) == [topic.first_post_id, reply.id]
+
+    def test_bulk_delete(self, sqlite_backend, topic, user):
+        Post(content="Reply").save(user, topic)
+
+        TopicModerator(db).delete(topic.forum, [topic.id])
+
+        assert indexed(Post) == []
+        assert indexed(Topic) == []
+
+    def test_documents_are_looked_up_by_key(self, sqlite_backend):
+        def plan(statement):
+            sql = statement.compile(db.engine,
+                                    compile_kwargs={"literal_binds": True})
+            return " ".join(row[-1] for row in db.session.execute(
+                "EXPLAIN QUERY PLAN {}".format(sql)
+            ))
+
+        match = plan(sqlite_backend._match(Post, ["kitten"]))
+        assert match.startswith("SCAN search_documents_fts VIRTUAL TABLE")
+        assert "USING INTEGER PRIMARY KEY" in match
+
+        delete = plan(search_documents.delete().
+                      where(search_documents.c.model == "Post").
+                      where(search_documents.c.object_id == 1))
+        assert "SCAN" not in delete
+
+
+def test_missing_table_doesnt_abort_changes(application, category, caplog):
+    application.config["SEARCH_BACKEND"] = "sqlite"
+
+    Forum(title="Unindexed", category_id=category.id).save()
+
+    assert Forum.query.count() == 1
+    assert "search_documents table doesn't exist" in caplog.text
+
+
+def test_postgresql_queries(mocker):
+    backend = PostgreSQLSearchBackend()
+
+    sql = str(backend._match(Post, ["foo", "bar"]).compile(
+        dialect=postgresql.dialect()
+    ))
+    assert "search_documents.document @@ to_tsquery" in sql
+    assert "ts_rank(search_documents.document, to_tsquery" in sql
+
+    execute = mocker.patch.object(db.session, "execute", return_value=[])
+    backend._snippets(Topic, ["foo"], [1])
+    statement = execute.call_args[0][0]
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert "ts_headline" in sql
+    assert "LEFT OUTER JOIN posts" in sql
+
+    document = backend._document(db.literal("text"))
+    assert "to_tsvector" in str(document.compile(dialect=postgresql.dialect()))
+
+
+def test_highlight():
+    snippet = highlight(u"<i>a</i> \x02match\x03 \u2026")
+
+    assert snippet == u"&lt;i&gt;a&lt;/i&gt; <mark>match</mark> \u2026"
+
+
+class TestSearchCache(object):
+    def test_results_are_cached(self, sqlite_backend, topic, user, guest):
+        first = cached_search_page(Topic, "Test  Topic", 1, 10, user)
+        second = cached_search_page(Topic, "test topic", 1, 10, user)
+
+        assert [obj for obj, _ in first.items] == [topic]
+        assert second.items == first.items
+        assert second.total == 1
+        assert search_cache_stats() == {"hits": 1, "misses": 1}
+
+        # the guest has other groups
+        cached_search_page(Topic, "test topic", 1, 10, guest)
+        assert search_cache_stats() == {"hits": 1, "misses": 2}
+
+    def test_index_changes_invalidate_the_cache(self, sqlite_backend, topic,
+                                                user):
+        assert cached_search_page(Post, "kittens", 1, 10, user).total == 0
+
+        topic.first_post.content = "kittens"
+        topic.first_post.save()
+
+        assert cached_search_page(Post, "kittens", 1, 10, user).total == 1
+        assert search_cache_stats() == {"hits": 0, "misses": 2}
+
+    def test_other_changes_keep_the_cache(self, sqlite_backend, topic,
+                                          topic_moderator, user):
+        assert cached_search_page(Topic, "test", 1, 10, user).total == 2
+
+        # updates the counters of the topic, the forum and the user
+        Post(content="Reply").save(user, topic_moderator)
+
+        assert cached_search_page(Topic, "test", 1, 10, user).total == 2
+        assert search_cache_stats() == {"hits": 1, "misses": 1}
+
+    def test_disabled(self, application, sqlite_backend, topic, user):
+        application.config["SEARCH_CACHE_TIMEOUT"] = 0
+
+        cached_search_page(Topic, "test", 1, 10, user)
+        cached_search_page(Topic, "test", 1, 10, user)
+
+        assert search_cache_stats() == {"hits": 0, "misses": 0}
@@ -0,0 +1,251 @@
+from datetime import timedelta
+
+import pytest
+from flask import current_app
+
+from flaskbb.extensions import db, whooshee
+from flaskbb.forum.models import Forum, Post, Topic
+from flaskbb.management.models import SearchQueueEntry
+from flaskbb.utils.helpers import time_utcnow
+from flaskbb.utils.search import (PostWhoosheer, TopicWhoosheer,
+                                  delete_from_index,
+                                  enqueue_index_changes, process_search_queue,
+                                  rebuild_index, search_queue_lag, sync_index)
+from flaskbb.utils.search_backends import (WhooshSearchBackend,
+                                           cached_search_page)
+
+
+@pytest.fixture
+def post_index(application, mocker):
+    config = application.extensions["whooshee"]
+    mocker.patch.dict(config, {"memory_storage": True,
+                               "whoosheers_indexes": {}})
+    mocker.patch.object(whooshee, "whoosheers", [PostWhoosheer])
+    return whooshee.get_or_create_index(application, PostWhoosheer)
+
+
+def indexed_post_ids(index):
+    with index.searcher() as searcher:
+        return sorted(fields["post_id"] for fields in searcher.all_stored_fields())
+
+
+class TestSearchQueue(object):
+    def test_enqueue_index_changes(self, topic):
+        enqueue_index_changes(Post, [topic.first_post_id, 42])
+        db.session.commit()
+
+        entries = SearchQueueEntry.query.order_by(SearchQueueEntry.id).all()
+        assert [(e.model, e.object_id) for e in entries] == [
+            ("Post", topic.first_post_id), ("Post", 42)
+        ]
+        assert search_queue_lag()["pending"] == 2
+
+    def test_process_search_queue(self, topic, user, post_index):
+        reply = Post(content="Reply")
+        reply.save(user, topic)
+        writer = post_index.writer()
+        writer.add_document(post_id=42, content=u"deleted")
+        writer.commit()
+        enqueue_index_changes(Post, [topic.first_post_id, reply.id,
+                                     reply.id, 42])
+        db.session.commit()
+
+        assert process_search_queue(batch_size=3) == 4
+
+        assert indexed_post_ids(post_index) == [topic.first_post_id, reply.id]
+        assert SearchQueueEntry.query.count() == 0
+        assert search_queue_lag() == {"pending": 0, "lag": 0}
+
+    def test_late_entries_are_kept(self, topic, post_index, mocker):
+        db.session.add_all([
+            SearchQueueEntry(id=5, model="Post", object_id=1,
+                             queued_at=time_utcnow()),
+            SearchQueueEntry(id=6, model="Post", object_id=2,
+                             queued_at=time_utcnow())
+        ])
+        db.session.commit()
+        written = []
+
+        def write_index_changes(changes):
+            # a transaction with a lower id commits after the batch was read
+            if not written:
+                db.session.add(SearchQueueEntry(id=3, model="Post",
+                                                object_id=3,
+                                                queued_at=time_utcnow()))
+                db.session.commit()
+            written.append(dict(changes))
+
+        mocker.patch("flaskbb.utils.search._write_index_changes",
+                     side_effect=write_index_changes)
+
+        assert process_search_queue() == 3
+        assert written == [{"Post": {1, 2}}, {"Post": {3}}]
+        assert SearchQueueEntry.query.count() == 0
+
+    def test_delete_from_index_is_queued(self, application, database,
+                                         post_index):
+        application.config["SEARCH_INDEX_ASYNC"] = True
+        writer = post_index.writer()
+        writer.add_document(post_id=42, content=u"deleted")
+        writer.commit()
+
+        delete_from_index(Post, [42])
+
+        assert indexed_post_ids(post_index) == [42]
+        assert SearchQueueEntry.query.count() == 1
+
+        process_search_queue()
+        assert indexed_post_ids(post_index) == []
+
+    def test_lag(self, topic):
+        db.session.add(SearchQueueEntry(
+            model="Post", object_id=topic.first_post_id,
+            queued_at=time_utcnow() - timedelta(minutes=5)
+        ))
+        db.session.commit()
+
+        lag = search_queue_lag()
+        assert lag["pending"] == 1
+        assert 300 <= lag["lag"] < 360
+
+
+class TestRebuildIndex(object):
+    def test_rebuild_index(self, topic, user, post_index):
+        Post(content="Reply").save(user, topic)
+        writer = post_index.writer()
+        writer.add_document(post_id=42, content=u"deleted")
+        writer.commit()
+        progress = []
+
+        rebuild_index(batch_size=1,
+                      progress=lambda *args: progress.append(args))
+
+        index = whooshee.get_or_create_index(current_app, PostWhoosheer)
+        assert indexed_post_ids(index) == [topic.first_post_id,
+                                           topic.last_post_id]
+        assert progress == [(Post, 1, 2), (Post, 2, 2)]
+        assert index.doc_count() == 2
+        assert len(index.reader().leaf_readers()) == 1
+
+    def test_resume_from_checkpoint(self, topic, user, post_index, mocker):
+        reply = Post(content="Reply")
+        reply.save(user, topic)
+        mocker.patch("flaskbb.utils.search._load_checkpoint", return_value={
+            "PostWhoosheer": {"Post": topic.first_post_id}
+        })
+
+        rebuild_index(resume=True)
+
+        assert indexed_post_ids(post_index) == [reply.id]
+
+
+class TestSyncIndex(object):
+    def test_sync_index(self, topic, user, post_index):
+        rebuild_index()
+        reply = Post(content="Reply")
+        reply.save(user, topic)
+        topic.first_post.content = u"Edited"
+        topic.first_post.date_modified = time_utcnow()
+        topic.first_post.save()
+        writer = post_index.writer()
+        writer.add_document(post_id=42, content=u"deleted")
+        writer.commit()
+        progress = []
+
+        stats = sync_index(batch_size=20,
+                           progress=lambda *args: progress.append(args))
+
+        assert stats == {"Post": {"updated": 2, "deleted": 1}}
+        assert indexed_post_ids(post_index) == [topic.first_post_id, reply.id]
+        assert progress == [(Post, 19, 42), (Post, 39, 42), (Post, 42, 42)]
+        results = WhooshSearchBackend().search_page(Post, "edited", 1, 10,
+                                                    user)
+        assert [post.id for post, _ in results.items] == [topic.first_post_id]
+
+    def test_unchanged_objects_are_skipped(self, topic, user, post_index):
+        rebuild_index()
+
+        assert sync_index() == {"Post": {"updated": 0, "deleted": 0}}
+
+        Post(content="Reply").save(user, topic)
+        assert sync_index() == {"Post": {"updated": 1, "deleted": 0}}
+        assert sync_index() == {"Post": {"updated": 0, "deleted": 0}}
+
+
+class TestOutdatedIndex(object):
+    @pytest.fixture
+    def outdated_index(self, post_index):
+        # the index of a previous release didn't contain the forums
+        schema = PostWhoosheer.schema.copy()
+        schema.remove("forum_id")
+        indexes = current_app.extensions["whooshee"]["whoosheers_indexes"]
+        indexes[PostWhoosheer] = post_index.storage.create_index(schema)
+        return indexes[PostWhoosheer]
+
+    def test_changes_are_skipped(self, topic, outdated_index, caplog):
+        whooshee.on_commit([[topic.first_post, "update"]])
+        enqueue_index_changes(Post, [topic.first_post_id])
+        db.session.commit()
+        process_search_queue()
+
+        assert outdated_index.doc_count() == 0
+        assert "Run 'flaskbb reindex'" in caplog.text
+
+    def test_rebuild_index(self, topic, outdated_index):
+        rebuild_index()
+
+        assert whooshee.index_is_current(PostWhoosheer)
+        whooshee.on_commit([[topic.first_post, "update"]])
+        index = whooshee.get_or_create_index(current_app, PostWhoosheer)
+        assert indexed_post_ids(index) == [topic.first_post_id]
+
+
+class TestWhooshSearchPage(object):
+    def test_search_page(self, topic, user, guest, post_index):
+        for i in range(3):
+            Post(content=u"<b>kittens</b> number {}".format(i)).\
+                save(user, topic)
+        rebuild_index()
+        backend = WhooshSearchBackend()
+
+        results = backend.search_page(Post, "kittens", 2, 2, user)
+
+        assert results.total == 3
+        [(post, snippet)] = results.items
+        assert u"<mark>kittens</mark>&lt;/b&gt;" in snippet
+
+        assert backend.search_page(Post, "kittens", 1, 2, guest).total == 3
+
+    def test_page_out_of_range(self, topic, user, post_index):
+        for i in range(3):
+            Post(content=u"kittens number {}".format(i)).save(user, topic)
+        rebuild_index()
+        backend = WhooshSearchBackend()
+
+        for page in (0, -1):
+            results = backend.search_page(Post, "kittens", page, 2, user)
+            assert results.page == 1
+            assert len(results.items) == 2
+
+        # pages after the last one return the last page
+        for _ in range(2):
+            results = cached_search_page(Post, "kittens", 5, 2, user)
+            assert results.page == 2
+            assert not results.has_next
+            assert len(results.items) == 1
+
+    def test_forums_are_filtered(self, topic, user, category, guest,
+                                 default_groups, post_index, mocker):
+        mocker.patch.object(whooshee, "whoosheers",
+                            [PostWhoosheer, TopicWhoosheer])
+        secret = Forum(title="Secret", category_id=category.id)
+        secret.save(groups=[default_groups[0]])
+        Post(content=u"kittens").save(user, topic)
+        rebuild_index()
+        backend = WhooshSearchBackend()
+        assert backend.search_page(Post, "kittens", 1, 10, guest).total == 1
+
+        secret.move_topics_to([topic])
+
+        assert backend.search_page(Post, "kittens", 1, 10, guest).total == 0
+        assert backend.search_page(Topic, "test", 1, 10, guest).total == 0
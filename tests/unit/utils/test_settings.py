@@ -1,3 +1,9 @@
+from datetime import timedelta
+
+from freezegun import freeze_time
+
+from flaskbb.extensions import db
+from flaskbb.management.models import Setting
 from flaskbb.utils.settings import FlaskBBConfig
 
 
@@ -12,3 +18,44 @@ def test_flaskbb_config(default_settings):
     assert flaskbb_config['PROJECT_TITLE'] == 'FlaskBBTest'
     # test __iter__
     assert 'PROJECT_TITLE' in list(flaskbb_config.__iter__())
+
+
+def test_settings_are_loaded_once_per_request(application, default_settings,
+                                              mocker):
+    flaskbb_config = FlaskBBConfig()
+    as_dict = mocker.spy(Setting, "as_dict")
+
+    with application.test_request_context():
+        assert flaskbb_config['PROJECT_TITLE'] == 'FlaskBB'
+        assert flaskbb_config['PROJECT_TITLE'] == 'FlaskBB'
+
+        Setting.update({'project_title': 'FlaskBBTest'})
+        assert flaskbb_config['PROJECT_TITLE'] == 'FlaskBBTest'
+    assert as_dict.call_count == 2
+
+    # the snapshot of the process is reused until the settings change
+    with application.test_request_context():
+        assert flaskbb_config['PROJECT_TITLE'] == 'FlaskBBTest'
+    assert as_dict.call_count == 2
+
+
+def test_snapshot_expires(application, default_settings):
+    flaskbb_config = FlaskBBConfig()
+    timeout = application.config["CACHE_DEFAULT_TIMEOUT"]
+
+    with freeze_time("2018-08-20 12:00:00") as frozen:
+        with application.test_request_context():
+            assert flaskbb_config['PROJECT_TITLE'] == 'FlaskBB'
+
+        # another process with its own cache changes the settings, the
+        # generation in the cache of this process stays the same
+        setting = Setting.query.get('project_title')
+        setting.value = 'FlaskBBTest'
+        db.session.commit()
+
+        with application.test_request_context():
+            assert flaskbb_config['PROJECT_TITLE'] == 'FlaskBB'
+
+        frozen.tick(timedelta(seconds=timeout + 1))
+        with application.test_request_context():
+            assert flaskbb_config['PROJECT_TITLE'] == 'FlaskBBTest'